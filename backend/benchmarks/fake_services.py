@@ -0,0 +1,122 @@
+from fastapi import FastAPI, Request
+from typing import Tuple
+import asyncio
+import itertools
+import random
+import socket
+import threading
+import time
+import uvicorn
+
+
+async def _delay(latency_ms: float, jitter_ms: float) -> None:
+    delay = latency_ms + random.uniform(-jitter_ms, jitter_ms)
+    if delay > 0:
+        await asyncio.sleep(delay / 1000)
+
+
+def build_azure_app(latency_ms: float = 200, jitter_ms: float = 0, completion_tokens: int = 60) -> FastAPI:
+    """Chat completions for any deployment, with token counts derived from the prompt size"""
+    app = FastAPI()
+
+    @app.post("/openai/deployments/{deployment}/chat/completions")
+    async def chat_completions(deployment: str, request: Request):
+        body = await request.json()
+        await _delay(latency_ms, jitter_ms)
+        prompt_tokens = sum(len(m.get("content", "")) for m in body.get("messages", [])) // 4 + 1
+        return {
+            "id": f"chatcmpl-bench-{time.time_ns()}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": deployment,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": "word " * completion_tokens},
+                "finish_reason": "stop"
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens
+            }
+        }
+
+    return app
+
+
+def build_slack_app(latency_ms: float = 50, jitter_ms: float = 0, history_messages: int = 20) -> FastAPI:
+    """Slack Web API methods used by the bot; unknown methods return ok"""
+    app = FastAPI()
+    timestamps = itertools.count(1)
+
+    @app.post("/api/{method}")
+    async def api_method(method: str, request: Request):
+        form = await request.form()
+        await _delay(latency_ms, jitter_ms)
+        if method == "auth.test":
+            return {"ok": True, "team": "bench", "user": "bench-bot", "bot_id": "B0BENCH"}
+        if method == "chat.postMessage":
+            return {"ok": True, "channel": form.get("channel"), "ts": f"{time.time():.0f}.{next(timestamps):06d}"}
+        if method in ("conversations.history", "conversations.replies"):
+            messages = [
+                {"ts": f"1700000000.{i:06d}", "user": f"U{i % 5}", "text": f"message {i} about the launch plan"}
+                for i in range(history_messages)
+            ]
+            return {"ok": True, "messages": messages[::-1], "has_more": False}
+        if method == "users.info":
+            return {"ok": True, "user": {"id": form.get("user"), "name": "bench-user"}}
+        return {"ok": True}
+
+    return app
+
+
+def build_google_app(latency_ms: float = 100, jitter_ms: float = 0) -> FastAPI:
+    """Docs create/batchUpdate and Drive about/files.get.
+
+    Mount points match settings.google_api_endpoints of
+    {"docs": "<url>/", "drive": "<url>/drive/v3/"}.
+    """
+    app = FastAPI()
+    documents = itertools.count(1)
+
+    @app.post("/v1/documents")
+    async def create_document(request: Request):
+        body = await request.json()
+        await _delay(latency_ms, jitter_ms)
+        return {"documentId": f"doc-{next(documents)}", "title": body.get("title")}
+
+    @app.post("/v1/documents/{document_id}:batchUpdate")
+    async def batch_update(document_id: str):
+        await _delay(latency_ms, jitter_ms)
+        return {"documentId": document_id, "replies": []}
+
+    @app.get("/drive/v3/about")
+    async def about():
+        await _delay(latency_ms, jitter_ms)
+        return {"user": {"emailAddress": "bench@example.com", "displayName": "Bench"}}
+
+    @app.get("/drive/v3/files/{file_id}")
+    async def get_file(file_id: str):
+        await _delay(latency_ms, jitter_ms)
+        return {"id": file_id, "webViewLink": f"https://docs.example.com/{file_id}"}
+
+    return app
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def serve(app: FastAPI) -> Tuple[str, uvicorn.Server]:
+    """Run app on a free local port in a daemon thread; returns (base url, server)"""
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    deadline = time.monotonic() + 10
+    while not server.started:
+        if time.monotonic() > deadline:
+            raise RuntimeError("Fake service did not start")
+        time.sleep(0.01)
+    return f"http://127.0.0.1:{port}", server
@@ -0,0 +1,422 @@
+"""Benchmark the backend against local stand-ins for Azure OpenAI, Slack and Google.
+
+Starts the fake services, runs the app with serve.py in a subprocess with a fresh
+SQLite database, then drives each scenario at increasing concurrency and writes
+throughput, latency percentiles and server memory to a JSON file:
+
+    cd backend
+    python -m benchmarks.run --output bench.json
+    python -m benchmarks.run --output bench-new.json --compare bench.json
+    python -m benchmarks.run --output scaling.json --workers 1,2,4 --scenarios agent_message
+"""
+from dataclasses import asdict, dataclass
+from typing import Callable, Dict, List, Optional
+import argparse
+import asyncio
+import hashlib
+import hmac
+import itertools
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import httpx
+from benchmarks.fake_services import build_azure_app, build_google_app, build_slack_app, free_port, serve
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SIGNING_SECRET = "benchmark-signing-secret"
+SCENARIOS = ["login", "admin_dashboard", "agent_message", "agent_summary", "slack_events"]
+
+
+@dataclass
+class Result:
+    scenario: str
+    workers: int
+    concurrency: int
+    requests: int
+    errors: int
+    duration_s: float
+    throughput_rps: float
+    p50_ms: float
+    p90_ms: float
+    p99_ms: float
+    max_ms: float
+    rss_mb: Optional[float]
+    peak_rss_mb: Optional[float]
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an ascending list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, round(pct / 100 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def process_memory_mb(pid: int) -> Dict[str, Optional[float]]:
+    """Current and peak resident memory of a process (Linux only)"""
+    memory = {"rss_mb": None, "peak_rss_mb": None}
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    memory["rss_mb"] = round(int(line.split()[1]) / 1024, 1)
+                elif line.startswith("VmHWM:"):
+                    memory["peak_rss_mb"] = round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return memory
+
+
+def process_tree_memory_mb(pid: int) -> Dict[str, Optional[float]]:
+    """Current and peak resident memory summed over a process and its descendants (Linux only)"""
+    total = {"rss_mb": None, "peak_rss_mb": None}
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        for key, value in process_memory_mb(current).items():
+            if value is not None:
+                total[key] = round((total[key] or 0) + value, 1)
+        try:
+            with open(f"/proc/{current}/task/{current}/children") as children:
+                pending.extend(int(child) for child in children.read().split())
+        except OSError:
+            pass
+    return total
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR,
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def slack_headers(body: bytes) -> Dict[str, str]:
+    timestamp = str(int(time.time()))
+    signature = hmac.new(SIGNING_SECRET.encode(), f"v0:{timestamp}:".encode() + body, hashlib.sha256).hexdigest()
+    return {
+        "X-Slack-Request-Timestamp": timestamp,
+        "X-Slack-Signature": f"v0={signature}",
+        "Content-Type": "application/json"
+    }
+
+
+class Backend:
+    """The app under test, served by serve.py in its own process tree"""
+
+    def __init__(self, env: Dict[str, str], log_path: str, workers: int = 1):
+        self.port = free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self.workers = workers
+        self.log = open(log_path, "a")
+        self.process = subprocess.Popen(
+            [
+                sys.executable, "serve.py", "--host", "127.0.0.1", "--port", str(self.port),
+                "--workers", str(workers), "--log-level", "warning"
+            ],
+            cwd=BACKEND_DIR,
+            env={**os.environ, **env},
+            stdout=self.log,
+            stderr=subprocess.STDOUT
+        )
+
+    def wait_ready(self, timeout: float = 60) -> None:
+        """Wait for readiness; several answers in a row, since each may come from a different worker"""
+        deadline = time.monotonic() + timeout
+        ready = 0
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"Backend exited with code {self.process.returncode}")
+            try:
+                ready = ready + 1 if httpx.get(f"{self.url}/health/ready", timeout=1).status_code == 200 else 0
+                if ready >= 3 * self.workers:
+                    return
+            except httpx.HTTPError:
+                ready = 0
+            time.sleep(0.1)
+        raise RuntimeError("Backend did not become ready")
+
+    def stop(self) -> None:
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+        self.log.close()
+
+
+async def setup(client: httpx.AsyncClient, azure_url: str) -> str:
+    """Create the admin user and the service credentials; returns an access token"""
+    user = {"username": "bench", "email": "bench@example.com", "password": "benchmark-password"}
+    await client.post("/api/auth/signup", json=user)
+    response = await client.post("/api/auth/login", json={"username": user["username"], "password": user["password"]})
+    response.raise_for_status()
+    token = response.json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+
+    credentials = {
+        "slack": {"bot_token": "xoxb-benchmark"},
+        "azure_openai": {
+            "endpoint": azure_url,
+            "api_key": "benchmark",
+            "deployment": "gpt-35-turbo",
+            "api_version": "2023-05-15"
+        },
+        "google_workspace": {"token": "benchmark"}
+    }
+    for service_type, creds in credentials.items():
+        response = await client.post(
+            "/api/credentials/", json={"service_type": service_type, "credentials": creds}, headers=headers
+        )
+        response.raise_for_status()
+    return token
+
+
+def build_requests(token: str) -> Dict[str, Callable[[int], Dict]]:
+    """Request factories per scenario; each call gets a unique sequence number"""
+    auth = {"Authorization": f"Bearer {token}"}
+
+    def slack_event(n: int) -> Dict:
+        body = json.dumps({
+            "type": "event_callback",
+            "team_id": "T0BENCH",
+            "event_id": f"Ev{n:010d}",
+            "event": {
+                "type": "message",
+                "channel": f"C{n % 8}",
+                "user": f"U{n % 50}",
+                "text": f"What is the status of task {n}?",
+                "ts": f"{time.time():.0f}.{n:06d}"
+            }
+        }).encode()
+        return {"method": "POST", "url": "/api/slack/events", "content": body, "headers": slack_headers(body)}
+
+    # Every prompt is unique so identical-request coalescing doesn't flatter the numbers
+    return {
+        "login": lambda n: {
+            "method": "POST", "url": "/api/auth/login",
+            "json": {"username": "bench", "password": "benchmark-password"}
+        },
+        "admin_dashboard": lambda n: {"method": "GET", "url": "/api/admin/dashboard", "headers": auth},
+        "agent_message": lambda n: {
+            "method": "POST", "url": "/api/agent/message",
+            "json": {"message": f"Summarize the risks for project {n}"}, "headers": auth
+        },
+        "agent_summary": lambda n: {
+            "method": "POST", "url": "/api/agent/summary",
+            "json": {"title": f"Notes {n}", "content": f"Meeting {n}: " + "we discussed the roadmap. " * 40},
+            "headers": auth
+        },
+        "slack_events": slack_event
+    }
+
+
+async def run_level(
+    client: httpx.AsyncClient,
+    make_request: Callable[[int], Dict],
+    concurrency: int,
+    total: int,
+    sequence: itertools.count
+) -> Dict:
+    """Send total requests with at most concurrency in flight; returns latencies and error count"""
+    latencies: List[float] = []
+    errors = 0
+    remaining = iter(range(total))
+
+    async def worker():
+        nonlocal errors
+        for _ in remaining:
+            request = make_request(next(sequence))
+            start = time.perf_counter()
+            try:
+                response = await client.request(**request)
+                if response.status_code >= 400:
+                    errors += 1
+            except httpx.HTTPError:
+                errors += 1
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return {"latencies": sorted(latencies), "errors": errors, "duration_s": time.perf_counter() - start}
+
+
+async def run_benchmarks(args, backend: Backend, azure_url: str) -> List[Result]:
+    results = []
+    sequence = itertools.count(1)
+    limits = httpx.Limits(max_connections=max(args.concurrency) + 10)
+    async with httpx.AsyncClient(base_url=backend.url, timeout=args.timeout, limits=limits) as client:
+        token = await setup(client, azure_url)
+        requests = build_requests(token)
+        for scenario in args.scenarios:
+            # Warm caches, connection pools and lazily built clients outside the measurement
+            await run_level(client, requests[scenario], 1, args.warmup, sequence)
+            for concurrency in args.concurrency:
+                level = await run_level(client, requests[scenario], concurrency, args.requests, sequence)
+                latencies = level["latencies"]
+                result = Result(
+                    scenario=scenario,
+                    workers=backend.workers,
+                    concurrency=concurrency,
+                    requests=len(latencies),
+                    errors=level["errors"],
+                    duration_s=round(level["duration_s"], 3),
+                    throughput_rps=round(len(latencies) / level["duration_s"], 2),
+                    p50_ms=round(percentile(latencies, 50), 2),
+                    p90_ms=round(percentile(latencies, 90), 2),
+                    p99_ms=round(percentile(latencies, 99), 2),
+                    max_ms=round(latencies[-1], 2) if latencies else 0.0,
+                    **process_tree_memory_mb(backend.process.pid)
+                )
+                results.append(result)
+                print(
+                    f"{scenario:16} w={backend.workers:<3} c={concurrency:<4} {result.throughput_rps:8.1f} req/s  "
+                    f"p50 {result.p50_ms:8.1f} ms  p99 {result.p99_ms:8.1f} ms  "
+                    f"errors {result.errors:<4} rss {result.rss_mb} MB"
+                )
+    return results
+
+
+def compare(results: List[Dict], baseline: Dict, max_regression: Optional[float]) -> bool:
+    """Print throughput and p99 changes against a baseline run; False if any exceed max_regression"""
+    previous = {(r["scenario"], r.get("workers", 1), r["concurrency"]): r for r in baseline["results"]}
+    ok = True
+    print(f"\nCompared with {baseline.get('commit') or 'baseline'}:")
+    for result in results:
+        before = previous.get((result["scenario"], result["workers"], result["concurrency"]))
+        if not before or not before["throughput_rps"] or not before["p99_ms"]:
+            continue
+        throughput_change = result["throughput_rps"] / before["throughput_rps"] - 1
+        p99_change = result["p99_ms"] / before["p99_ms"] - 1
+        regressed = max_regression is not None and (
+            throughput_change < -max_regression or p99_change > max_regression
+        )
+        ok = ok and not regressed
+        print(
+            f"{result['scenario']:16} w={result['workers']:<3} c={result['concurrency']:<4} "
+            f"throughput {throughput_change:+7.1%}  "
+            f"p99 {p99_change:+7.1%}{'  REGRESSION' if regressed else ''}"
+        )
+    return ok
+
+
+def scaling(results: List[Dict]) -> None:
+    """Print each scenario's best throughput per worker count against the fewest workers"""
+    best: Dict[str, Dict[int, float]] = {}
+    for result in results:
+        per_workers = best.setdefault(result["scenario"], {})
+        per_workers[result["workers"]] = max(per_workers.get(result["workers"], 0.0), result["throughput_rps"])
+    print("\nScaling (best throughput over concurrency levels):")
+    for scenario, per_workers in best.items():
+        base_workers = min(per_workers)
+        base = per_workers[base_workers]
+        for workers, throughput in sorted(per_workers.items()):
+            speedup = throughput / base if base else 0.0
+            print(
+                f"{scenario:16} w={workers:<3} {throughput:8.1f} req/s  x{speedup:5.2f}  "
+                f"efficiency {speedup / (workers / base_workers):6.1%}"
+            )
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the backend against local fake services")
+    parser.add_argument("--output", default="benchmark-results.json", help="Where to write the JSON results")
+    parser.add_argument("--scenarios", type=lambda s: s.split(","), default=SCENARIOS,
+                        help=f"Comma-separated subset of {','.join(SCENARIOS)}")
+    parser.add_argument("--concurrency", type=lambda s: [int(c) for c in s.split(",")], default=[1, 4, 16, 64],
+                        help="Comma-separated concurrency levels")
+    parser.add_argument("--workers", type=lambda s: [int(w) for w in s.split(",")], default=[1],
+                        help="Comma-separated worker process counts; each gets a fresh server and database")
+    parser.add_argument("--requests", type=int, default=200, help="Requests per scenario and concurrency level")
+    parser.add_argument("--warmup", type=int, default=5, help="Unmeasured requests before each scenario")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Per-request timeout in seconds")
+    parser.add_argument("--azure-latency-ms", type=float, default=200)
+    parser.add_argument("--slack-latency-ms", type=float, default=50)
+    parser.add_argument("--google-latency-ms", type=float, default=100)
+    parser.add_argument("--jitter-ms", type=float, default=0, help="Uniform +/- jitter added to every fake latency")
+    parser.add_argument("--keep-limits", action="store_true",
+                        help="Keep the configured rate limits and admission control instead of lifting them")
+    parser.add_argument("--compare", help="Baseline results JSON to compare against")
+    parser.add_argument("--max-regression", type=float,
+                        help="With --compare, exit non-zero if throughput drops or p99 grows by more than this fraction")
+    args = parser.parse_args(argv)
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+    return args
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    azure_url, _ = serve(build_azure_app(args.azure_latency_ms, args.jitter_ms))
+    slack_url, _ = serve(build_slack_app(args.slack_latency_ms, args.jitter_ms))
+    google_url, _ = serve(build_google_app(args.google_latency_ms, args.jitter_ms))
+
+    log_path = f"{os.path.splitext(args.output)[0]}.server.log"
+    print(f"Server log: {log_path}")
+    open(log_path, "w").close()
+    results = []
+    for workers in args.workers:
+        with tempfile.TemporaryDirectory() as tmp:
+            env = {
+                "DATABASE_URL": f"sqlite:///{tmp}/benchmark.db",
+                "SLACK_SIGNING_SECRET": SIGNING_SECRET,
+                "SLACK_API_BASE_URL": f"{slack_url}/api/",
+                "GOOGLE_API_ENDPOINTS": json.dumps({"docs": f"{google_url}/", "drive": f"{google_url}/drive/v3/"}),
+                "CREDENTIAL_HEALTH_INTERVAL_SECONDS": "0",
+                "PROFILING_DIR": f"{tmp}/profiles",
+                "TRACING_EXPORTER": "none"
+            }
+            if workers > 1:
+                # Workers share rate limits, caches and metrics as in production
+                env["SHARED_STATE_URL"] = f"sqlite:///{tmp}/state.db"
+                env["PROMETHEUS_MULTIPROC_DIR"] = f"{tmp}/metrics"
+                os.makedirs(env["PROMETHEUS_MULTIPROC_DIR"])
+            if not args.keep_limits:
+                env.update({
+                    "RATE_LIMITS": "{}",
+                    "ADMISSION_PER_USER_LIMIT": "100000",
+                    "ADMISSION_INITIAL_LIMIT": "100000",
+                    "ADMISSION_MAX_LIMIT": "100000",
+                    "ADMISSION_MIN_LIMIT": "100000"
+                })
+
+            backend = Backend(env, log_path, workers)
+            try:
+                backend.wait_ready()
+                results.extend(asyncio.run(run_benchmarks(args, backend, azure_url)))
+            finally:
+                backend.stop()
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {
+            key: value for key, value in vars(args).items() if key not in ("output", "compare", "max_regression")
+        },
+        "results": [asdict(result) for result in results]
+    }
+    with open(args.output, "w") as output:
+        json.dump(report, output, indent=2)
+    print(f"\nWrote {args.output}")
+    if len(args.workers) > 1:
+        scaling(report["results"])
+
+    if args.compare:
+        with open(args.compare) as baseline:
+            if not compare(report["results"], json.load(baseline), args.max_regression):
+                return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,98 @@
+"""Measure how long the backend takes to import, using python -X importtime.
+
+Each run imports the app in a fresh interpreter and reports the best total,
+the heaviest top-level packages and any SDK that should only load on first use:
+
+    cd backend
+    python -m benchmarks.startup
+    python -m benchmarks.startup --runs 5 --top 20 --budget-ms 1500
+"""
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Dict, List, Tuple
+import argparse
+import os
+import re
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Generous enough for a loaded CI machine; a heavy SDK sneaking back in costs far more
+BUDGET_MS = 2000
+# SDKs the app imports on first use rather than at startup
+DEFERRED_MODULES = ["openai", "slack_bolt", "googleapiclient", "google_auth_oauthlib", "pyinstrument"]
+
+_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+
+@dataclass
+class ImportProfile:
+    total_ms: float
+    # module -> (self, cumulative) microseconds, in import order
+    modules: Dict[str, Tuple[int, int]] = field(default_factory=dict)
+
+    def packages(self) -> List[Tuple[str, float]]:
+        """Self time summed by top-level package, heaviest first, in milliseconds"""
+        totals = defaultdict(int)
+        for name, (self_us, _) in self.modules.items():
+            totals[name.split(".")[0]] += self_us
+        return sorted(((name, us / 1000) for name, us in totals.items()), key=lambda item: -item[1])
+
+    def deferred_loaded(self) -> List[str]:
+        """Deferred SDKs that were imported anyway"""
+        return [name for name in DEFERRED_MODULES if name in self.modules]
+
+
+def parse_importtime(output: str, module: str) -> ImportProfile:
+    modules = {}
+    for line in output.splitlines():
+        match = _LINE.match(line)
+        if match:
+            modules[match.group(4)] = (int(match.group(1)), int(match.group(2)))
+    if module not in modules:
+        raise RuntimeError(f"No importtime entry for {module}:\n{output[-2000:]}")
+    return ImportProfile(total_ms=modules[module][1] / 1000, modules=modules)
+
+
+def profile_import(module: str = "main") -> ImportProfile:
+    """Import module in a fresh interpreter and return its import profile"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=BACKEND_DIR,
+        capture_output=True,
+        text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+    return parse_importtime(result.stderr, module)
+
+
+def best_of(runs: int, module: str = "main") -> ImportProfile:
+    """Fastest of several imports; the first run also pays for compiling bytecode and a cold disk cache"""
+    return min((profile_import(module) for _ in range(runs)), key=lambda profile: profile.total_ms)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Measure backend import time")
+    parser.add_argument("--module", default="main", help="Module to import")
+    parser.add_argument("--runs", type=int, default=3, help="Imports to run; the fastest is reported")
+    parser.add_argument("--top", type=int, default=15, help="Heaviest top-level packages to list")
+    parser.add_argument("--budget-ms", type=float, default=BUDGET_MS, help="Fail if the import takes longer")
+    args = parser.parse_args(argv)
+
+    profile = best_of(args.runs, args.module)
+    print(f"import {args.module}: {profile.total_ms:.0f} ms (best of {args.runs}, budget {args.budget_ms:.0f} ms)\n")
+    print(f"{'package':<30} {'self ms':>8}")
+    for name, ms in profile.packages()[:args.top]:
+        print(f"{name:<30} {ms:>8.1f}")
+
+    ok = profile.total_ms <= args.budget_ms
+    loaded = profile.deferred_loaded()
+    if loaded:
+        print(f"\nImported at startup but should load on first use: {', '.join(loaded)}")
+        ok = False
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,5 +1,5 @@
 from pydantic_settings import BaseSettings
-from typing import Optional
+from typing import Dict, Optional, Tuple
 import os
 
 
@@ -9,6 +9,13 @@ class Settings(BaseSettings):
     app_env: str = "development"
     secret_key: str = "development-secret-key-change-in-production"
     database_url: str = "sqlite:///./slack_ai_bot.db"
+    warmup_db_connections: int = 4  # Connections opened at startup so first requests don't pay to connect
+    readiness_timeout_seconds: float = 2.0  # /health/ready fails if the database doesn't answer in time
+    
+    # Credential encryption
+    credential_encryption_keys: str = ""  # Comma-separated Fernet keys, newest first; older ones only decrypt. Required in production; elsewhere empty uses a key derived from secret_key
+    credential_legacy_key: bool = True  # Also decrypt with the key derived from secret_key; turn off once rotate_keys.py reports nothing needs it
+    credential_data_key_cache_size: int = 4096  # Decrypted per-credential data keys kept in memory
     
     # CORS
     allowed_origins: str = "http://localhost:3000,http://localhost:5173"
@@ -23,17 +30,90 @@ class Settings(BaseSettings):
     slack_bot_token: Optional[str] = None
     slack_app_token: Optional[str] = None
     slack_signing_secret: Optional[str] = None
+    slack_api_base_url: str = "https://www.slack.com/api/"  # Web API root (e.g. a proxy or the benchmark stand-in)
+    slack_context_messages: int = 20  # Recent messages kept per channel as answer context
+    slack_context_channels: int = 1000  # Channels with buffered context before LRU eviction
+    slack_summary_window_messages: int = 200  # Messages fetched for "summarize this thread/channel"
+    slack_summary_cache_size: int = 500  # Conversations whose summaries are cached for incremental updates
+    slash_command_max_concurrency: int = 4  # Slash command jobs running at once across all users
+    slash_command_max_pending_per_user: int = 3  # Queued or running slash command jobs per Slack user
+    slash_command_timeout_seconds: float = 120  # Slash command jobs are cancelled after this long
+    slack_event_dedup_seconds: float = 3600  # Redelivered events with an already-seen event_id are ignored this long
+    slack_keyring_check_seconds: float = 5.0  # How often each worker checks whether another one changed the signing secrets
+    
+    # Background jobs
+    job_workers: int = 2  # Concurrent background jobs per process
+    job_poll_interval_seconds: float = 2.0  # How often idle workers check for due jobs
+    job_drive_max_attempts: int = 5  # Google Drive upload attempts before giving up on the upload
+    job_drive_backoff_seconds: float = 2.0  # First Drive retry delay, doubled per attempt
+    job_drive_backoff_max_seconds: float = 300.0
     
     # Azure OpenAI (Optional - configured via portal)
     azure_openai_endpoint: Optional[str] = None
     azure_openai_api_key: Optional[str] = None
     azure_openai_deployment: Optional[str] = None
     azure_openai_api_version: str = "2023-05-15"
+    azure_openai_context_window: int = 8192  # Model window; credentials may override with "context_window"
+    azure_openai_balancing: str = "least_outstanding"  # Or "latency", across a credential's deployments
+    azure_openai_max_attempts: int = 3  # Tries per request, failing over between deployments
+    azure_openai_backoff_seconds: float = 0.5  # Backoff cap before the first retry, doubled per attempt
+    azure_openai_backoff_max_seconds: float = 8.0
+    azure_openai_breaker_failures: int = 3  # Consecutive 429/5xx before a deployment's breaker opens
+    azure_openai_breaker_cooldown_seconds: float = 30.0
+    llm_coalesce_requests: bool = True  # Share one completion between identical concurrent requests
+    admission_per_user_limit: int = 4  # Concurrent agent requests per user before 429
+    admission_initial_limit: int = 20  # Global concurrent agent requests before 503; adapts to latency
+    admission_min_limit: int = 2
+    admission_max_limit: int = 100
+    admission_target_latency_ms: float = 8000  # Slower requests shrink the global limit
+    
+    # Rate limits per route name, e.g. "10/minute"; "<name>:<user id>" overrides a limit for one user
+    rate_limits: Dict[str, str] = {
+        "login": "10/minute",
+        "signup": "5/minute",
+        "agent": "30/minute",
+        "credential_test": "10/minute"
+    }
+    rate_limit_store: Optional[str] = None  # Defaults to the shared state; or its own "memory"/"sqlite:///..."/"redis://..."
+    
+    # Multi-worker deployment (python serve.py)
+    web_concurrency: int = 0  # Worker processes; 0 means one per CPU core
+    prepare_database_on_startup: bool = True  # Schema, rollup backfill and job recovery in the app's startup; serve.py does them once instead
+    shared_state_url: str = "memory"  # Caches, rate limits and dedup: "sqlite:///path/state.db" shares them across workers on one host, "redis://host:6379/0" across hosts
+    
+    # Credential tests
+    credential_test_timeout_seconds: float = 10.0  # Per-service limit on a live connection test
+    credential_test_cache_seconds: float = 300.0  # Reuse a successful test this long; 0 disables
+    credential_health_interval_seconds: float = 900.0  # Background re-test of all credentials (jittered); 0 disables
+    credential_health_max_concurrency: int = 4
+    credential_unhealthy_after_failures: int = 3  # Consecutive failed tests before the agent skips a service
+    
+    # Metrics
+    metrics_token: Optional[str] = None  # If set, /metrics requires "Authorization: Bearer <token>"
+    
+    # Tracing
+    tracing_exporter: str = "none"  # "console", "file:/path/spans.jsonl" or "otlp"
+    tracing_sample_ratio: float = 0.05  # Fraction of traces recorded
+    
+    # Profiling (admins add "X-Profile: 1" or "?profile=1" to a request)
+    profiling_enabled: bool = True
+    profiling_dir: str = "profiles"
+    profiling_max_profiles: int = 20  # Oldest profiles are deleted past this
+    profiling_interval_seconds: float = 0.001  # Sampling interval
+    answer_max_tokens: int = 1000  # Completion cap for answers
+    answer_context_max_tokens: int = 2000  # Channel context is trimmed (oldest first) to fit this
+    summary_max_tokens: int = 1000  # Completion cap for summaries
+    min_completion_tokens: int = 64  # Requests that can't leave this much room are rejected up front
+    user_daily_token_budget: int = 0  # Per-user tokens per UTC day; 0 disables the budget
+    default_prompt_price_per_1k: float = 0.002  # USD, for models missing from the pricing table
+    default_completion_price_per_1k: float = 0.002
+    pricing_overrides: Dict[str, Tuple[float, float]] = {}  # Deployment/model -> (prompt, completion) USD per 1K
     
     # Google OAuth (Optional - configured via portal)
     google_client_id: Optional[str] = None
     google_client_secret: Optional[str] = None
     google_redirect_uri: str = "http://localhost:8000/api/oauth/google/callback"
+    google_api_endpoints: Dict[str, str] = {}  # API name ("drive", "docs") -> base URL override
     
     class Config:
         env_file = ".env"
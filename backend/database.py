@@ -1,16 +1,40 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, inspect
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+from typing import Optional
+import logging
+import os
 from config import settings
+from metrics import instrument_engine
+from tracing import span
+
+logger = logging.getLogger(__name__)
 
 # Create SQLite engine
 engine = create_engine(
     settings.database_url,
     connect_args={"check_same_thread": False}  # Needed for SQLite
 )
+instrument_engine(engine)
+
+if engine.dialect.name == "sqlite":
+    @event.listens_for(engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        # WAL lets worker processes keep reading while another one writes
+        dbapi_connection.execute("PRAGMA journal_mode=WAL")
+        dbapi_connection.execute("PRAGMA synchronous=NORMAL")
+
+
+class TracedSession(Session):
+    """Session recording a span around each commit"""
+
+    def commit(self) -> None:
+        with span("db.commit"):
+            super().commit()
+
 
 # Create SessionLocal class
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine, class_=TracedSession)
 
 # Create Base class for models
 Base = declarative_base()
@@ -25,7 +49,55 @@ def get_db():
         db.close()
 
 
-def init_db():
-    """Initialize database tables"""
-    from models import User, Credential, AuditLog, UsageStats, SlackMessage, Summary
-    Base.metadata.create_all(bind=engine)
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+
+
+def migration_config(connection=None):
+    """Alembic config for the migrations in backend/migrations, run on connection if given"""
+    from alembic.config import Config
+
+    config = Config()
+    config.set_main_option("script_location", MIGRATIONS_DIR)
+    config.attributes["connection"] = connection
+    return config
+
+
+def head_revision() -> str:
+    from alembic.script import ScriptDirectory
+
+    return ScriptDirectory.from_config(migration_config()).get_current_head()
+
+
+def current_revision(bind=engine) -> Optional[str]:
+    """Migration the database is at, or None for a new database or one from before migrations"""
+    from alembic.runtime.migration import MigrationContext
+
+    with bind.connect() as conn:
+        return MigrationContext.configure(conn).get_current_revision()
+
+
+def init_db(bind=engine) -> bool:
+    """Apply pending migrations; returns whether any ran.
+
+    A database already at the latest revision costs one query. One created with
+    create_all before migrations existed is stamped at the initial revision first;
+    the later revisions skip what it already has.
+    """
+    # Alembic is only needed here, so the app doesn't pay to import it at startup
+    from alembic import command
+    from alembic.runtime.migration import MigrationContext
+
+    head = head_revision()
+    with bind.begin() as conn:
+        current = MigrationContext.configure(conn).get_current_revision()
+        if current == head:
+            logger.info(f"Database schema is current (revision {head})")
+            return False
+
+        config = migration_config(conn)
+        if current is None and inspect(conn).has_table("users"):
+            logger.info("Adopting a database created before migrations")
+            command.stamp(config, "0001")
+        command.upgrade(config, "head")
+    logger.info(f"Database migrated from revision {current} to {head}")
+    return True
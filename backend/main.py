@@ -4,7 +4,15 @@ from fastapi.responses import JSONResponse
 from contextlib import asynccontextmanager
 import logging
 from config import settings
-from database import init_db
+from database import init_db, SessionLocal
+from services.job_service import job_engine
+from services.usage_service import ensure_rollups
+from services.credential_health import credential_health
+from services.admission import AdmissionRejected
+from services.readiness import readiness
+from metrics import MetricsMiddleware
+from tracing import configure_tracing, shutdown_tracing
+from profiling import ProfilingMiddleware
 
 # Configure logging
 logging.basicConfig(
@@ -14,14 +22,40 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
-@asynccontextmanager
-async def lifespan(app: FastAPI):
-    """Initialize database on startup"""
+def prepare_database() -> None:
+    """One-off startup work: schema, usage rollup backfill and requeueing jobs a crash left running.
+    
+    serve.py runs this once before starting its workers, since a worker doing it
+    would requeue jobs the other workers are still running.
+    """
     logger.info("Initializing database...")
     init_db()
+    db = SessionLocal()
+    try:
+        ensure_rollups(db)
+    finally:
+        db.close()
+    recovered = job_engine.recover()
+    if recovered:
+        logger.info(f"Resuming {recovered} interrupted job(s)")
     logger.info("Database initialized successfully")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Initialize database on startup"""
+    configure_tracing()
+    if settings.prepare_database_on_startup:
+        prepare_database()
+    await job_engine.start()
+    await credential_health.start()
+    await readiness.start()
     yield
     logger.info("Shutting down...")
+    await readiness.stop()
+    await credential_health.stop()
+    await job_engine.stop()
+    shutdown_tracing()
 
 
 # Create FastAPI app
@@ -41,6 +75,18 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(ProfilingMiddleware)
+
+
+# Load shedding: tell clients when to come back instead of queueing their request
+@app.exception_handler(AdmissionRejected)
+async def admission_rejected_handler(request: Request, exc: AdmissionRejected):
+    return JSONResponse(
+        status_code=exc.status_code,
+        content={"detail": exc.detail},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
 
 
 # Global exception handler
@@ -53,18 +99,8 @@ async def global_exception_handler(request: Request, exc: Exception):
     )
 
 
-# Health check endpoint
-@app.get("/health")
-async def health_check():
-    return {
-        "status": "healthy",
-        "app_name": settings.app_name,
-        "environment": settings.app_env
-    }
-
-
 # Import and include routers
-from routes import auth, credentials, agent, admin, oauth, slack_events
+from routes import auth, credentials, agent, admin, oauth, slack_events, jobs, metrics, health
 
 app.include_router(auth.router)
 app.include_router(credentials.router)
@@ -72,6 +108,9 @@ app.include_router(agent.router)
 app.include_router(admin.router)
 app.include_router(oauth.router)
 app.include_router(slack_events.router)
+app.include_router(jobs.router)
+app.include_router(metrics.router)
+app.include_router(health.router)
 
 
 # Root endpoint
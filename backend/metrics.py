@@ -0,0 +1,137 @@
+from contextlib import contextmanager
+from prometheus_client import (
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    generate_latest
+)
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from typing import Tuple
+import os
+import time
+
+# Set PROMETHEUS_MULTIPROC_DIR (to an empty directory) before starting multiple
+# workers; every process then writes its samples there and /metrics merges them.
+MULTIPROCESS = bool(os.environ.get("PROMETHEUS_MULTIPROC_DIR"))
+
+FAST_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+SLOW_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0)
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route template",
+    ["method", "route", "status"], buckets=SLOW_BUCKETS
+)
+LLM_REQUEST_SECONDS = Histogram(
+    "llm_request_duration_seconds", "Azure OpenAI completion latency by deployment",
+    ["deployment", "outcome"], buckets=SLOW_BUCKETS
+)
+EXTERNAL_API_SECONDS = Histogram(
+    "external_api_duration_seconds", "Slack and Google API call latency by method",
+    ["service", "method"], buckets=SLOW_BUCKETS
+)
+DB_QUERY_SECONDS = Histogram(
+    "db_query_duration_seconds", "Database statement execution time",
+    ["operation"], buckets=FAST_BUCKETS
+)
+QUEUE_DEPTH = Gauge(
+    "queue_depth", "Work waiting or in progress",
+    ["queue"], multiprocess_mode="livesum"
+)
+# Counted at startup, then moved as jobs are queued and claimed. Summed across
+# workers including exited ones, since a job queued by one may be claimed by another
+JOBS_QUEUED = Gauge(
+    "jobs_queued", "Background jobs waiting to run",
+    multiprocess_mode="sum"
+)
+CACHE_REQUESTS = Counter(
+    "cache_requests_total", "Cache lookups by result",
+    ["cache", "result"]
+)
+
+
+def elapsed_seconds(start_ns: int) -> float:
+    return (time.perf_counter_ns() - start_ns) / 1e9
+
+
+@contextmanager
+def timed(histogram: Histogram, **labels):
+    """Observe the duration of the block in a histogram"""
+    start = time.perf_counter_ns()
+    try:
+        yield
+    finally:
+        histogram.labels(**labels).observe(elapsed_seconds(start))
+
+
+def cache_lookup(cache: str, hit: bool) -> None:
+    CACHE_REQUESTS.labels(cache=cache, result="hit" if hit else "miss").inc()
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording request latency per route template.
+
+    Routes are labelled by their path template ("/api/jobs/{job_id}") rather than
+    the raw path, so label cardinality stays bounded. Streaming responses are timed
+    until their last chunk is sent.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter_ns()
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            HTTP_REQUEST_SECONDS.labels(
+                method=scope["method"],
+                route=getattr(route, "path", "unmatched"),
+                status=str(status_code)
+            ).observe(elapsed_seconds(start))
+
+
+def instrument_engine(engine: Engine) -> None:
+    """Time every statement the engine executes"""
+    # The start goes on the statement's own execution context, so a statement that
+    # raises (and never reaches after_cursor_execute) leaves nothing behind
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context._query_start_ns = time.perf_counter_ns()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        start = getattr(context, "_query_start_ns", None)
+        if start is None:
+            return
+        operation = statement.lstrip()[:6].lower()
+        if operation not in ("select", "insert", "update", "delete"):
+            operation = "other"
+        DB_QUERY_SECONDS.labels(operation=operation).observe(elapsed_seconds(start))
+
+
+def render() -> Tuple[bytes, str]:
+    """Render all metrics in the Prometheus text format, merged across workers if configured"""
+    if MULTIPROCESS:
+        from prometheus_client import multiprocess
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
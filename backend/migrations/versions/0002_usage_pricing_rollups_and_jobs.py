@@ -0,0 +1,89 @@
+"""Per-model usage pricing, daily usage rollups and the background job queue
+
+Databases created with create_all before migrations existed may already have
+some of this, so each step checks first.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-19 18:46:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0002'
+down_revision: Union[str, None] = '0001'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    inspector = sa.inspect(op.get_bind())
+    existing = {column['name'] for column in inspector.get_columns('usage_stats')}
+    with op.batch_alter_table('usage_stats') as batch_op:
+        if 'model' not in existing:
+            batch_op.add_column(sa.Column('model', sa.String(), nullable=True))
+        # Older rows were priced on the total; their split is unknown
+        for name in ['prompt_tokens', 'completion_tokens']:
+            if name not in existing:
+                batch_op.add_column(sa.Column(name, sa.Integer(), nullable=True, server_default='0'))
+
+    if not inspector.has_table('usage_rollups'):
+        op.create_table('usage_rollups',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('service_type', sa.String(), nullable=False),
+        sa.Column('action_type', sa.String(), nullable=False),
+        sa.Column('requests', sa.Integer(), nullable=True),
+        sa.Column('prompt_tokens', sa.Integer(), nullable=True),
+        sa.Column('completion_tokens', sa.Integer(), nullable=True),
+        sa.Column('tokens_used', sa.Integer(), nullable=True),
+        sa.Column('cost', sa.Float(), nullable=True),
+        sa.Column('execution_time_ms_total', sa.Float(), nullable=True),
+        sa.Column('timed_requests', sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('day', 'user_id', 'service_type', 'action_type', name='uq_usage_rollup')
+        )
+        op.create_index('ix_usage_rollups_day', 'usage_rollups', ['day'], unique=False)
+        op.create_index('ix_usage_rollups_id', 'usage_rollups', ['id'], unique=False)
+        op.create_index('ix_usage_rollups_user_id', 'usage_rollups', ['user_id'], unique=False)
+
+    if not inspector.has_table('jobs'):
+        op.create_table('jobs',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('job_type', sa.String(), nullable=False),
+        sa.Column('status', sa.String(), nullable=True),
+        sa.Column('stage', sa.String(), nullable=True),
+        sa.Column('payload', sa.JSON(), nullable=False),
+        sa.Column('result', sa.JSON(), nullable=True),
+        sa.Column('error', sa.Text(), nullable=True),
+        sa.Column('attempts', sa.Integer(), nullable=True),
+        sa.Column('next_attempt_at', sa.DateTime(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.Column('finished_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+        sa.PrimaryKeyConstraint('id')
+        )
+        op.create_index('ix_jobs_id', 'jobs', ['id'], unique=False)
+        op.create_index('ix_jobs_status', 'jobs', ['status'], unique=False)
+
+    # The schema fingerprint stamp init_db kept before migrations
+    if inspector.has_table('schema_version'):
+        op.drop_table('schema_version')
+
+
+def downgrade() -> None:
+    op.drop_table('jobs')
+    op.drop_table('usage_rollups')
+    with op.batch_alter_table('usage_stats') as batch_op:
+        batch_op.drop_column('completion_tokens')
+        batch_op.drop_column('prompt_tokens')
+        batch_op.drop_column('model')
@@ -0,0 +1,30 @@
+"""Count consecutive failed credential tests
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-19 18:47:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0003'
+down_revision: Union[str, None] = '0002'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    existing = {column['name'] for column in sa.inspect(op.get_bind()).get_columns('credentials')}
+    if 'test_failures' not in existing:
+        with op.batch_alter_table('credentials') as batch_op:
+            batch_op.add_column(sa.Column('test_failures', sa.Integer(), nullable=True, server_default='0'))
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('credentials') as batch_op:
+        batch_op.drop_column('test_failures')
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, Text, ForeignKey, Float, JSON
+from sqlalchemy import Column, Integer, String, DateTime, Date, Boolean, Text, ForeignKey, Float, JSON, UniqueConstraint
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from database import Base
@@ -22,6 +22,8 @@ class User(Base):
     audit_logs = relationship("AuditLog", back_populates="user", cascade="all, delete-orphan")
     usage_stats = relationship("UsageStats", back_populates="user", cascade="all, delete-orphan")
     summaries = relationship("Summary", back_populates="user", cascade="all, delete-orphan")
+    jobs = relationship("Job", back_populates="user", cascade="all, delete-orphan")
+    usage_rollups = relationship("UsageRollup", back_populates="user", cascade="all, delete-orphan")
 
 
 class Credential(Base):
@@ -35,6 +37,7 @@ class Credential(Base):
     last_tested_at = Column(DateTime, nullable=True)
     test_status = Column(String, nullable=True)  # 'success', 'failed', 'pending'
     test_message = Column(Text, nullable=True)
+    test_failures = Column(Integer, default=0)  # Consecutive unsuccessful tests
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
@@ -66,8 +69,11 @@ class UsageStats(Base):
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     service_type = Column(String, nullable=False)  # 'slack', 'azure_openai', 'google_drive'
     action_type = Column(String, nullable=False)  # 'message', 'summary', 'query', etc.
-    tokens_used = Column(Integer, default=0)
-    cost = Column(Float, default=0.0)
+    model = Column(String, nullable=True)  # Model or deployment the cost was priced with
+    prompt_tokens = Column(Integer, default=0)
+    completion_tokens = Column(Integer, default=0)
+    tokens_used = Column(Integer, default=0)  # prompt_tokens + completion_tokens
+    cost = Column(Float, default=0.0)  # USD, priced at write time
     execution_time_ms = Column(Float, nullable=True)
     meta_info = Column(JSON, nullable=True)  # Renamed from 'metadata' to avoid SQLAlchemy reserved name
     created_at = Column(DateTime, default=datetime.utcnow)
@@ -76,6 +82,29 @@ class UsageStats(Base):
     user = relationship("User", back_populates="usage_stats")
 
 
+class UsageRollup(Base):
+    """Running usage totals per day, user, service and action, updated as usage is recorded"""
+    __tablename__ = "usage_rollups"
+    __table_args__ = (
+        UniqueConstraint("day", "user_id", "service_type", "action_type", name="uq_usage_rollup"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    day = Column(Date, nullable=False, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    service_type = Column(String, nullable=False)
+    action_type = Column(String, nullable=False)
+    requests = Column(Integer, default=0)
+    prompt_tokens = Column(Integer, default=0)
+    completion_tokens = Column(Integer, default=0)
+    tokens_used = Column(Integer, default=0)
+    cost = Column(Float, default=0.0)
+    execution_time_ms_total = Column(Float, default=0.0)
+    timed_requests = Column(Integer, default=0)  # Requests with an execution time, for averages
+    
+    user = relationship("User", back_populates="usage_rollups")
+
+
 class SlackMessage(Base):
     __tablename__ = "slack_messages"
     
@@ -105,3 +134,24 @@ class Summary(Base):
     
     # Relationships
     user = relationship("User", back_populates="summaries")
+
+
+class Job(Base):
+    __tablename__ = "jobs"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    job_type = Column(String, nullable=False)  # 'summary'
+    status = Column(String, default="queued", index=True)  # 'queued', 'running', 'succeeded', 'failed'
+    stage = Column(String, default="summarize")  # Next step to run: 'summarize', 'drive', 'record'
+    payload = Column(JSON, nullable=False)  # Job input
+    result = Column(JSON, nullable=True)  # Output so far; persisted after each step so restarts resume
+    error = Column(Text, nullable=True)
+    attempts = Column(Integer, default=0)  # Google Drive attempts
+    next_attempt_at = Column(DateTime, nullable=True)  # Set while waiting to retry
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    finished_at = Column(DateTime, nullable=True)
+    
+    # Relationships
+    user = relationship("User", back_populates="jobs")
@@ -0,0 +1,179 @@
+from datetime import datetime
+from fastapi import HTTPException
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+from urllib.parse import parse_qs
+import asyncio
+import json
+import logging
+import re
+import threading
+import time
+import uuid
+from sqlalchemy.orm import Session
+from config import settings
+from database import SessionLocal
+from models import User
+from security import verify_token
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = b"x-profile"
+PROFILE_ID_HEADER = b"x-profile-id"
+_profile_id_pattern = re.compile(r"^\d+-[0-9a-f]{8}$")
+
+
+class ProfileStore:
+    """Bounded ring of speedscope profiles on disk, oldest removed first.
+
+    Each profile is written as <id>.speedscope.json next to a small <id>.meta.json
+    describing the request, so listing never reads the profiles themselves.
+    """
+
+    def __init__(self, directory: str, max_profiles: int = 20):
+        self.directory = Path(directory)
+        self.max_profiles = max_profiles
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def new_id() -> str:
+        return f"{int(time.time() * 1000)}-{uuid.uuid4().hex[:8]}"
+
+    def path(self, profile_id: str) -> Optional[Path]:
+        """Path of a stored profile, or None if the id is malformed or unknown"""
+        if not _profile_id_pattern.match(profile_id):
+            return None
+        path = self.directory / f"{profile_id}.speedscope.json"
+        return path if path.exists() else None
+
+    def save(self, profile_id: str, meta: Dict, profile: str) -> None:
+        with self._lock:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            (self.directory / f"{profile_id}.speedscope.json").write_text(profile)
+            (self.directory / f"{profile_id}.meta.json").write_text(json.dumps({"id": profile_id, **meta}))
+            # Ids start with a millisecond timestamp, so name order is age order
+            metas = sorted(self.directory.glob("*.meta.json"))
+            for stale in metas[:max(0, len(metas) - self.max_profiles)]:
+                stale_id = stale.name[:-len(".meta.json")]
+                stale.unlink(missing_ok=True)
+                (self.directory / f"{stale_id}.speedscope.json").unlink(missing_ok=True)
+
+    def list(self) -> List[Dict]:
+        """Metadata of stored profiles, newest first"""
+        if not self.directory.exists():
+            return []
+        profiles = []
+        for meta in sorted(self.directory.glob("*.meta.json"), reverse=True):
+            try:
+                profiles.append(json.loads(meta.read_text()))
+            except (OSError, ValueError):
+                continue
+        return profiles
+
+
+def _is_admin(headers: Dict[bytes, bytes], session_factory: Callable[[], Session]) -> bool:
+    """Whether the request carries a valid access token of an active admin.
+
+    The role claim is only a hint: the user is loaded so a demoted or deactivated
+    admin whose token hasn't expired yet can't profile.
+    """
+    authorization = headers.get(b"authorization", b"").decode("latin-1")
+    if not authorization.lower().startswith("bearer "):
+        return False
+    try:
+        token_data = verify_token(authorization[7:])
+    except HTTPException:
+        return False
+    if token_data.role != "admin":
+        return False
+    db = session_factory()
+    try:
+        user = db.query(User).filter(User.id == token_data.user_id).first()
+        return user is not None and user.is_active and user.role == "admin"
+    finally:
+        db.close()
+
+
+class ProfilingMiddleware:
+    """ASGI middleware profiling single requests on demand.
+
+    An admin requests a profile with an "X-Profile: 1" header or a "profile=1" query
+    parameter. The request then runs under pyinstrument's sampling profiler and the
+    speedscope profile is saved to the store; the response carries its id in
+    X-Profile-Id. Requests without the flag go straight through. One request is
+    profiled at a time; others asking meanwhile run unprofiled.
+    """
+
+    def __init__(
+        self,
+        app,
+        store: Optional[ProfileStore] = None,
+        session_factory: Optional[Callable[[], Session]] = None
+    ):
+        self.app = app
+        self.store = store or profile_store
+        self.session_factory = session_factory
+        self._active = False
+
+    @staticmethod
+    def _requested(scope) -> bool:
+        for name, value in scope["headers"]:
+            if name == PROFILE_HEADER:
+                return value not in (b"", b"0")
+        query = scope.get("query_string", b"")
+        if b"profile=" not in query:
+            return False
+        return parse_qs(query.decode("latin-1")).get("profile", ["0"])[0] not in ("", "0")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not settings.profiling_enabled or not self._requested(scope):
+            await self.app(scope, receive, send)
+            return
+        if self._active or not await asyncio.to_thread(
+            _is_admin, dict(scope["headers"]), self.session_factory or SessionLocal
+        ) or self._active:
+            # Checked again since another request may have started profiling during the lookup
+            await self.app(scope, receive, send)
+            return
+
+        self._active = True
+        profile_id = self.store.new_id()
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                headers = [*message.get("headers", []), (PROFILE_ID_HEADER, profile_id.encode())]
+                message = {**message, "headers": headers}
+            await send(message)
+
+        # pyinstrument is only needed once someone actually profiles a request
+        from pyinstrument import Profiler
+        from pyinstrument.renderers import SpeedscopeRenderer
+
+        profiler = Profiler(interval=settings.profiling_interval_seconds, async_mode="enabled")
+        started_at = datetime.utcnow()
+        profiler.start()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            session = profiler.stop()
+            self._active = False
+            meta = {
+                "method": scope["method"],
+                "path": scope["path"],
+                "status": status_code,
+                "started_at": started_at.isoformat(),
+                "duration_ms": round(session.duration * 1000, 2),
+                "samples": session.sample_count
+            }
+            try:
+                profile = SpeedscopeRenderer().render(session)
+                await asyncio.to_thread(self.store.save, profile_id, meta, profile)
+                logger.info(f"Saved profile {profile_id} for {scope['method']} {scope['path']}")
+            except Exception as e:
+                logger.error(f"Failed to save profile {profile_id}: {e}")
+
+
+profile_store = ProfileStore(settings.profiling_dir, max_profiles=settings.profiling_max_profiles)
@@ -0,0 +1,52 @@
+"""Rotate the keys that encrypt stored credentials, while the app keeps running.
+
+    cd backend
+    python rotate_keys.py --generate-key
+    # Put the new key first in CREDENTIAL_ENCRYPTION_KEYS, keep the old ones after it,
+    # and restart every worker so they can all read the new key. Then:
+    python rotate_keys.py --batch-size 500
+
+Once it reports that nothing needs the older keys, drop them from the keyring
+and set CREDENTIAL_LEGACY_KEY=false to stop trusting the key derived from SECRET_KEY.
+"""
+import argparse
+import logging
+
+logger = logging.getLogger("rotate_keys")
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Rewrap stored credentials under the primary encryption key")
+    parser.add_argument("--generate-key", action="store_true", help="Print a new key for CREDENTIAL_ENCRYPTION_KEYS and exit")
+    parser.add_argument("--batch-size", type=int, default=500, help="Rows read and written per transaction")
+    parser.add_argument("--pause", type=float, default=0.0, help="Seconds to sleep between batches to leave room for app writes")
+    args = parser.parse_args(argv)
+
+    if args.generate_key:
+        from cryptography.fernet import Fernet
+
+        print(Fernet.generate_key().decode())
+        return
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    from security import ENCRYPTION_KEY, credential_cipher
+    from services.credential_service import rotate_encryption_keys
+
+    if credential_cipher.primary_key == ENCRYPTION_KEY:
+        raise SystemExit("Set CREDENTIAL_ENCRYPTION_KEYS first; rotating onto the key derived from SECRET_KEY gains nothing")
+
+    stats = rotate_encryption_keys(
+        batch_size=args.batch_size,
+        pause_seconds=args.pause,
+        progress=lambda stats: logger.info(f"{stats['scanned']} scanned, {stats['rotated']} rotated")
+    )
+    if stats["failed"]:
+        raise SystemExit(f"{stats['failed']} credential(s) couldn't be decrypted; keep the old keys until they're fixed")
+    logger.info(
+        "Every credential is under the primary key. Older keys can be dropped from "
+        "CREDENTIAL_ENCRYPTION_KEYS, and CREDENTIAL_LEGACY_KEY set to false"
+    )
+
+
+if __name__ == "__main__":
+    main()
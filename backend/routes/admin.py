@@ -1,10 +1,11 @@
 from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.responses import FileResponse
 from sqlalchemy.orm import Session
 from sqlalchemy import func, desc
 from typing import List
 from datetime import datetime, timedelta
 from database import get_db
-from models import User, AuditLog, UsageStats, SlackMessage, Summary
+from models import User, AuditLog, UsageStats, UsageRollup, SlackMessage, Summary
 from schemas import (
     UserResponse,
     UserUpdate,
@@ -14,6 +15,10 @@ from schemas import (
     UsageStatsSummary
 )
 from security import get_current_admin_user
+from profiling import profile_store
+from services.deployment_pool import deployment_pool
+from services.admission import agent_admission
+from services.single_flight import llm_single_flight
 
 router = APIRouter(prefix="/api/admin", tags=["Admin"])
 
@@ -32,10 +37,12 @@ async def get_dashboard_stats(
     total_messages = db.query(SlackMessage).count()
     total_summaries = db.query(Summary).count()
     
-    # Total tokens and cost
+    # Total tokens and cost, from the rollups rather than every usage row
     usage_totals = db.query(
-        func.sum(UsageStats.tokens_used).label('total_tokens'),
-        func.sum(UsageStats.cost).label('total_cost')
+        func.sum(UsageRollup.tokens_used).label('total_tokens'),
+        func.sum(UsageRollup.prompt_tokens).label('prompt_tokens'),
+        func.sum(UsageRollup.completion_tokens).label('completion_tokens'),
+        func.sum(UsageRollup.cost).label('total_cost')
     ).first()
     
     total_tokens_used = usage_totals.total_tokens or 0
@@ -49,15 +56,15 @@ async def get_dashboard_stats(
     # Usage by service
     usage_by_service = {}
     service_stats = db.query(
-        UsageStats.service_type,
-        func.count(UsageStats.id).label('count'),
-        func.sum(UsageStats.tokens_used).label('tokens'),
-        func.sum(UsageStats.cost).label('cost')
-    ).group_by(UsageStats.service_type).all()
+        UsageRollup.service_type,
+        func.sum(UsageRollup.requests).label('count'),
+        func.sum(UsageRollup.tokens_used).label('tokens'),
+        func.sum(UsageRollup.cost).label('cost')
+    ).group_by(UsageRollup.service_type).all()
     
     for stat in service_stats:
         usage_by_service[stat.service_type] = {
-            "count": stat.count,
+            "count": stat.count or 0,
             "tokens": stat.tokens or 0,
             "cost": float(stat.cost or 0)
         }
@@ -68,6 +75,8 @@ async def get_dashboard_stats(
         "total_messages": total_messages,
         "total_summaries": total_summaries,
         "total_tokens_used": total_tokens_used,
+        "total_prompt_tokens": usage_totals.prompt_tokens or 0,
+        "total_completion_tokens": usage_totals.completion_tokens or 0,
         "total_cost": total_cost,
         "recent_logs": recent_logs,
         "usage_by_service": usage_by_service
@@ -231,27 +240,68 @@ async def get_usage_summary(
     current_user: User = Depends(get_current_admin_user),
     db: Session = Depends(get_db)
 ):
-    """Get usage summary for the specified period"""
-    since_date = datetime.utcnow() - timedelta(days=days)
+    """Get usage summary for the specified period (whole UTC days)"""
+    since_day = (datetime.utcnow() - timedelta(days=days)).date()
     
-    query = db.query(UsageStats).filter(UsageStats.created_at >= since_date)
+    query = db.query(UsageRollup).filter(UsageRollup.day >= since_day)
     if user_id:
-        query = query.filter(UsageStats.user_id == user_id)
+        query = query.filter(UsageRollup.user_id == user_id)
     
-    stats = query.all()
+    rollups = query.all()
     
-    total_messages = len([s for s in stats if s.action_type == "message"])
-    total_summaries = len([s for s in stats if s.action_type == "summary"])
-    total_tokens = sum(s.tokens_used for s in stats)
-    total_cost = sum(s.cost for s in stats)
+    cost_by_user = {}
+    cost_by_service = {}
+    for r in rollups:
+        cost_by_user[r.user_id] = cost_by_user.get(r.user_id, 0.0) + r.cost
+        cost_by_service[r.service_type] = cost_by_service.get(r.service_type, 0.0) + r.cost
     
-    execution_times = [s.execution_time_ms for s in stats if s.execution_time_ms is not None]
-    avg_response_time = sum(execution_times) / len(execution_times) if execution_times else None
+    timed_requests = sum(r.timed_requests for r in rollups)
+    execution_time_total = sum(r.execution_time_ms_total for r in rollups)
+    avg_response_time = execution_time_total / timed_requests if timed_requests else None
     
     return {
-        "total_messages": total_messages,
-        "total_summaries": total_summaries,
-        "total_tokens": total_tokens,
-        "total_cost": total_cost,
-        "avg_response_time_ms": avg_response_time
+        "total_messages": sum(r.requests for r in rollups if r.action_type == "message"),
+        "total_summaries": sum(r.requests for r in rollups if r.action_type == "summary"),
+        "total_tokens": sum(r.tokens_used for r in rollups),
+        "total_prompt_tokens": sum(r.prompt_tokens for r in rollups),
+        "total_completion_tokens": sum(r.completion_tokens for r in rollups),
+        "total_cost": sum(r.cost for r in rollups),
+        "avg_response_time_ms": avg_response_time,
+        "cost_by_user": cost_by_user,
+        "cost_by_service": cost_by_service
+    }
+
+
+@router.get("/llm")
+async def get_llm_stats(
+    current_user: User = Depends(get_current_admin_user)
+):
+    """Get admission, request coalescing and Azure OpenAI deployment health for this process"""
+    return {
+        "admission": agent_admission.stats(),
+        "coalescing": llm_single_flight.stats(),
+        "deployments": deployment_pool.snapshot()
     }
+
+
+@router.get("/profiles")
+async def list_profiles(
+    current_user: User = Depends(get_current_admin_user)
+):
+    """List stored request profiles, newest first"""
+    return profile_store.list()
+
+
+@router.get("/profiles/{profile_id}")
+async def download_profile(
+    profile_id: str,
+    current_user: User = Depends(get_current_admin_user)
+):
+    """Download a request profile in speedscope format (open it at https://www.speedscope.app)"""
+    path = profile_store.path(profile_id)
+    if path is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Profile not found"
+        )
+    return FileResponse(path, media_type="application/json", filename=path.name)
@@ -9,10 +9,23 @@ from schemas import (
     SummaryCreate,
     SummaryResponse
 )
-from security import get_current_user
+from security import get_current_user, rate_limit
 from services.agent_service import AgentService
+from services.admission import agent_admission
 
-router = APIRouter(prefix="/api/agent", tags=["Agent"])
+router = APIRouter(
+    prefix="/api/agent",
+    tags=["Agent"],
+    dependencies=[Depends(rate_limit("agent"))]
+)
+
+# Requests rejected before reaching the model are client errors, not server failures
+ERROR_STATUS_CODES = {
+    "token_budget_exceeded": status.HTTP_429_TOO_MANY_REQUESTS,
+    "context_window_exceeded": status.HTTP_400_BAD_REQUEST,
+    "deployments_unavailable": status.HTTP_503_SERVICE_UNAVAILABLE,
+    "credential_unhealthy": status.HTTP_503_SERVICE_UNAVAILABLE,
+}
 
 
 @router.post("/message", response_model=dict)
@@ -24,18 +37,20 @@ async def handle_message(
     """Handle a message and generate AI response"""
     agent = AgentService(db, current_user.id)
     
-    result = await agent.handle_slack_message(
-        message=message_data.message,
-        channel_id=message_data.channel_id or "direct",
-        slack_user_id=str(current_user.id),
-        message_ts=str(int(db.query(SlackMessage).count()) + 1)
-    )
-    
-    if not result.get("success"):
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=result.get("error", "Failed to process message")
+    # Shed load with 429/503 instead of queueing model calls
+    async with agent_admission.slot(f"user:{current_user.id}"):
+        result = await agent.handle_slack_message(
+            message=message_data.message,
+            channel_id=message_data.channel_id or "direct",
+            slack_user_id=str(current_user.id),
+            message_ts=str(int(db.query(SlackMessage).count()) + 1)
         )
+        
+        if not result.get("success"):
+            raise HTTPException(
+                status_code=ERROR_STATUS_CODES.get(result.get("error_code"), status.HTTP_500_INTERNAL_SERVER_ERROR),
+                detail=result.get("error", "Failed to process message")
+            )
     
     return result
 
@@ -50,17 +65,18 @@ async def create_summary(
     """Generate a summary and optionally save to Google Drive"""
     agent = AgentService(db, current_user.id)
     
-    result = await agent.generate_summary(
-        title=summary_data.title,
-        content=summary_data.content,
-        save_to_drive=save_to_drive
-    )
-    
-    if not result.get("success"):
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=result.get("error", "Failed to generate summary")
+    async with agent_admission.slot(f"user:{current_user.id}"):
+        result = await agent.generate_summary(
+            title=summary_data.title,
+            content=summary_data.content,
+            save_to_drive=save_to_drive
         )
+        
+        if not result.get("success"):
+            raise HTTPException(
+                status_code=ERROR_STATUS_CODES.get(result.get("error_code"), status.HTTP_500_INTERNAL_SERVER_ERROR),
+                detail=result.get("error", "Failed to generate summary")
+            )
     
     return result
 
@@ -9,13 +9,19 @@ from security import (
     verify_password,
     create_access_token,
     create_refresh_token,
-    get_current_user
+    get_current_user,
+    rate_limit
 )
 
 router = APIRouter(prefix="/api/auth", tags=["Authentication"])
 
 
-@router.post("/signup", response_model=UserResponse, status_code=status.HTTP_201_CREATED)
+@router.post(
+    "/signup",
+    response_model=UserResponse,
+    status_code=status.HTTP_201_CREATED,
+    dependencies=[Depends(rate_limit("signup"))]
+)
 async def signup(user_data: UserCreate, db: Session = Depends(get_db)):
     """Register a new user"""
     # Check if user already exists
@@ -62,7 +68,7 @@ async def signup(user_data: UserCreate, db: Session = Depends(get_db)):
     return new_user
 
 
-@router.post("/login", response_model=Token)
+@router.post("/login", response_model=Token, dependencies=[Depends(rate_limit("login"))])
 async def login(login_data: LoginRequest, db: Session = Depends(get_db)):
     """Login user and return access token"""
     # Find user
@@ -1,12 +1,14 @@
 from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from typing import List
-from database import get_db
+from database import SessionLocal, get_db
 from models import User, AuditLog
 from schemas import CredentialCreate, CredentialResponse, CredentialTestResult
-from security import get_current_user
+from security import get_current_user, rate_limit
 from services.credential_service import CredentialService
 from datetime import datetime
+import json
 
 router = APIRouter(prefix="/api/credentials", tags=["Credentials"])
 
@@ -59,7 +61,41 @@ async def get_credentials(
     return credentials
 
 
-@router.post("/{service_type}/test", response_model=CredentialTestResult)
+@router.post("/test", dependencies=[Depends(rate_limit("credential_test"))])
+async def test_all_credentials(current_user: User = Depends(get_current_user)):
+    """Test every configured service concurrently, streaming each result as a server-sent event"""
+    user_id = current_user.id
+    
+    async def events():
+        # The body streams after the request's own session may be closed, so it uses its own
+        db = SessionLocal()
+        try:
+            results = {}
+            async for result in CredentialService.test_all_credentials(db, user_id):
+                results[result["service_type"]] = result["status"]
+                yield f"data: {json.dumps({**result, 'tested_at': datetime.utcnow().isoformat()})}\n\n"
+            
+            # Log test action
+            audit_log = AuditLog(
+                user_id=user_id,
+                action="credential_test",
+                resource_type="credential",
+                details={"results": results},
+                status="success" if all(s == "success" for s in results.values()) else "failed"
+            )
+            db.add(audit_log)
+            db.commit()
+        finally:
+            db.close()
+    
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+@router.post(
+    "/{service_type}/test",
+    response_model=CredentialTestResult,
+    dependencies=[Depends(rate_limit("credential_test"))]
+)
 async def test_credential(
     service_type: str,
     current_user: User = Depends(get_current_user),
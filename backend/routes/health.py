@@ -0,0 +1,31 @@
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+from config import settings
+from services.readiness import readiness
+
+router = APIRouter(tags=["Health"])
+
+
+@router.get("/health")
+async def health_check():
+    return {
+        "status": "healthy",
+        "app_name": settings.app_name,
+        "environment": settings.app_env
+    }
+
+
+@router.get("/health/live")
+async def liveness():
+    """The process is up and serving requests; no dependencies are checked"""
+    return {"status": "alive"}
+
+
+@router.get("/health/ready")
+async def readiness_check():
+    """The worker has warmed up and its database answers; 503 until then"""
+    ready, checks = await readiness.check()
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={"status": "ready" if ready else "not_ready", "checks": checks}
+    )
@@ -0,0 +1,108 @@
+from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session
+from typing import List
+import json
+from database import get_db
+from models import User, Job
+from schemas import SummaryCreate, JobResponse
+from security import get_current_user, rate_limit
+from services.job_service import job_engine, TERMINAL_STATUSES
+
+router = APIRouter(prefix="/api/jobs", tags=["Jobs"])
+
+
+@router.post(
+    "/summary",
+    response_model=JobResponse,
+    status_code=status.HTTP_202_ACCEPTED,
+    dependencies=[Depends(rate_limit("agent"))]
+)
+async def submit_summary_job(
+    summary_data: SummaryCreate,
+    save_to_drive: bool = True,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Queue a summary to be generated (and saved to Google Drive) in the background"""
+    return job_engine.submit_summary(
+        db,
+        user_id=current_user.id,
+        title=summary_data.title,
+        content=summary_data.content,
+        save_to_drive=save_to_drive
+    )
+
+
+@router.get("/", response_model=List[JobResponse])
+async def get_jobs(
+    limit: int = 50,
+    offset: int = 0,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Get the current user's jobs"""
+    return db.query(Job).filter(
+        Job.user_id == current_user.id
+    ).order_by(Job.created_at.desc()).offset(offset).limit(limit).all()
+
+
+@router.get("/{job_id}", response_model=JobResponse)
+async def get_job(
+    job_id: int,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Get a job's status and, once finished, its result"""
+    job = db.query(Job).filter(
+        Job.id == job_id,
+        Job.user_id == current_user.id
+    ).first()
+
+    if not job:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Job not found"
+        )
+
+    return job
+
+
+@router.get("/{job_id}/events")
+async def stream_job_events(
+    job_id: int,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Subscribe to a job's status changes as server-sent events until it finishes"""
+    exists = db.query(Job.id).filter(
+        Job.id == job_id,
+        Job.user_id == current_user.id
+    ).first()
+
+    if not exists:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Job not found"
+        )
+
+    async def events():
+        last_sent = None
+        while True:
+            session = job_engine.session_factory()
+            try:
+                job = session.query(Job).filter(Job.id == job_id).first()
+                data = JobResponse.model_validate(job).model_dump(mode="json")
+            finally:
+                session.close()
+
+            if data != last_sent:
+                yield f"data: {json.dumps(data)}\n\n"
+                last_sent = data
+            if data["status"] in TERMINAL_STATUSES:
+                return
+
+            # Woken early by changes made in this process, otherwise re-check periodically
+            await job_engine.wait_for_change(job_id, timeout=job_engine.poll_interval)
+
+    return StreamingResponse(events(), media_type="text/event-stream")
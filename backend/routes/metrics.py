@@ -0,0 +1,19 @@
+from fastapi import APIRouter, Header, HTTPException, Response, status
+from typing import Optional
+import hmac
+from config import settings
+from metrics import render
+
+router = APIRouter(tags=["Metrics"])
+
+
+@router.get("/metrics", include_in_schema=False)
+async def metrics(authorization: Optional[str] = Header(None)):
+    """Prometheus scrape endpoint"""
+    if settings.metrics_token and not hmac.compare_digest(
+        authorization or "", f"Bearer {settings.metrics_token}"
+    ):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid metrics token")
+
+    body, content_type = render()
+    return Response(content=body, media_type=content_type)
@@ -1,8 +1,6 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Request
 from fastapi.responses import RedirectResponse
 from sqlalchemy.orm import Session
-from google_auth_oauthlib.flow import Flow
-from google.oauth2.credentials import Credentials
 from database import get_db
 from models import User, AuditLog
 from security import get_current_user
@@ -51,7 +49,9 @@ async def google_authorize(
             detail="Google OAuth credentials are incomplete"
         )
     
-    # Create flow instance with user's credentials
+    # Create flow instance with user's credentials (the OAuth library is imported on first use)
+    from google_auth_oauthlib.flow import Flow
+
     flow = Flow.from_client_config(
         {
             "web": {
@@ -118,6 +118,8 @@ async def google_callback(
         redirect_uri = google_oauth_creds.get("redirect_uri", "http://localhost:8000/api/oauth/google/callback")
         
         # Create flow instance with user's credentials
+        from google_auth_oauthlib.flow import Flow
+
         flow = Flow.from_client_config(
             {
                 "web": {
@@ -1,49 +1,43 @@
-from fastapi import APIRouter, Request, HTTPException, Header
+from fastapi import APIRouter, Depends, Request, HTTPException
 from sqlalchemy.orm import Session
+from typing import Optional
 from database import get_db, SessionLocal
 from services.credential_service import CredentialService
 from services.agent_service import AgentService
+from services.slack_service import SlackService
+from services.intent_router import IntentRouter, IntentMatch
+from services.command_queue import slash_command_queue
+from services.admission import agent_admission
+from services.shared_state import shared_state
+from slack_sdk.webhook import WebhookClient
 from models import User
-import hmac
-import hashlib
-import time
+from security import verify_slack_request
+from config import settings
+import asyncio
 import json
+import re
 import logging
 
 logger = logging.getLogger(__name__)
 
-router = APIRouter(prefix="/api/slack", tags=["Slack Events"])
+# Bot mention markup, e.g. "<@U1234> hello"
+MENTION_PATTERN = re.compile(r'<@[A-Z0-9]+>')
+SUMMARY_KEYWORDS = ["summarize", "summary", "summarise", "tldr", "tl;dr"]
 
+# Mention intents and slash commands are dispatched through these routers
+mention_router = IntentRouter()
+slash_router = IntentRouter()
 
-def verify_slack_signature(
-    signing_secret: str,
-    timestamp: str,
-    body: bytes,
-    signature: str
-) -> bool:
-    """Verify that request is from Slack"""
-    # Prevent replay attacks - reject if timestamp is older than 5 minutes
-    if abs(time.time() - int(timestamp)) > 60 * 5:
-        return False
-    
-    # Create signature
-    sig_basestring = f"v0:{timestamp}:{body.decode('utf-8')}"
-    my_signature = 'v0=' + hmac.new(
-        signing_secret.encode(),
-        sig_basestring.encode(),
-        hashlib.sha256
-    ).hexdigest()
-    
-    # Compare signatures
-    return hmac.compare_digest(my_signature, signature)
+# Every Slack endpoint is signature-checked on the raw body before the handler runs
+router = APIRouter(
+    prefix="/api/slack",
+    tags=["Slack Events"],
+    dependencies=[Depends(verify_slack_request)]
+)
 
 
 @router.post("/events")
-async def handle_slack_events(
-    request: Request,
-    x_slack_request_timestamp: str = Header(None),
-    x_slack_signature: str = Header(None)
-):
+async def handle_slack_events(request: Request):
     """Handle incoming Slack events"""
     body = await request.body()
     
@@ -67,9 +61,34 @@ async def handle_slack_events(
             logger.debug("Ignoring bot message to prevent loop")
             return {"ok": True}
         
+        if event_type not in ("message", "app_mention"):
+            return {"ok": True}
+        
+        # Slack redelivers events it thinks timed out, possibly to another worker
+        event_id = event_data.get("event_id")
+        dedup_key = f"slack_event:{event_id}"
+        if event_id and not shared_state.add(dedup_key, True, settings.slack_event_dedup_seconds):
+            logger.info(f"Ignoring redelivered Slack event {event_id}")
+            return {"ok": True}
+        
         # Get team/workspace info to find the right user's credentials
         team_id = event_data.get("team_id")
         
+        try:
+            return await _process_event(event, event_type)
+        except Exception:
+            # Failed or shed events are left for Slack's redelivery
+            if event_id:
+                shared_state.delete(dedup_key)
+            raise
+    
+    return {"ok": True}
+
+
+async def _process_event(event: dict, event_type: str) -> dict:
+    """Handle a message or mention event under admission control"""
+    # Shed load before any work; a 503 with Retry-After makes Slack redeliver later
+    async with agent_admission.slot(f"slack:{event.get('user')}"):
         # For now, we'll use the first active user's credentials
         # In production, you'd want to map Slack workspace to specific user
         db = SessionLocal()
@@ -93,8 +112,6 @@ async def handle_slack_events(
             
         finally:
             db.close()
-    
-    return {"ok": True}
 
 
 async def handle_message_event(db: Session, user_id: int, event: dict):
@@ -124,7 +141,8 @@ async def handle_message_event(db: Session, user_id: int, event: dict):
             message=text,
             channel_id=channel,
             slack_user_id=user,
-            message_ts=ts
+            message_ts=ts,
+            use_channel_context=True
         )
         
         if result.get("success"):
@@ -136,17 +154,27 @@ async def handle_message_event(db: Session, user_id: int, event: dict):
         logger.error(f"Error handling message: {e}", exc_info=True)
 
 
+async def _get_slack_service(db: Session, user_id: int) -> Optional[SlackService]:
+    """Build a Slack client from the user's stored credentials"""
+    slack_creds = await CredentialService.get_credential(db, user_id, "slack")
+    if not slack_creds:
+        return None
+    return SlackService(
+        bot_token=slack_creds.get("bot_token"),
+        app_token=slack_creds.get("app_token"),
+        signing_secret=slack_creds.get("signing_secret")
+    )
+
+
 async def handle_mention_event(db: Session, user_id: int, event: dict):
     """Handle app mention events"""
     channel = event.get("channel")
     text = event.get("text", "")
     user = event.get("user")
-    ts = event.get("ts")
     
     # Remove the bot mention from the text
     # Example: "<@U1234> hello" -> "hello"
-    import re
-    text = re.sub(r'<@[A-Z0-9]+>', '', text).strip()
+    text = MENTION_PATTERN.sub('', text).strip()
     
     if not text:
         text = "Hello! How can I help you?"
@@ -157,87 +185,90 @@ async def handle_mention_event(db: Session, user_id: int, event: dict):
     agent = AgentService(db, user_id)
     
     try:
-        # Check if user is requesting a summary
-        text_lower = text.lower()
-        is_summary_request = any(keyword in text_lower for keyword in [
-            "summarize", "summary", "summarise", "tldr", "tl;dr"
-        ])
+        match = mention_router.route(text)
+        await match.handler(db, user_id, agent, event, match)
+    except Exception as e:
+        logger.error(f"Error handling mention: {e}", exc_info=True)
+
+
+@mention_router.intent("summary", SUMMARY_KEYWORDS)
+async def summarize_mention(db: Session, user_id: int, agent: AgentService, event: dict, match: IntentMatch):
+    """Summarize pasted text, or the current thread/channel when none is given"""
+    channel = event.get("channel")
+    content = match.remainder
+    
+    # Too short to be pasted content, e.g. "summarize this thread"
+    if len(content) < 50:
+        thread_ts = event.get("thread_ts")
+        result = await agent.summarize_conversation(
+            channel_id=channel,
+            thread_ts=thread_ts,
+            exclude_ts=event.get("ts"),
+            save_to_drive=True
+        )
         
-        if is_summary_request:
-            # Extract content to summarize
-            content = text
-            for keyword in ["summarize", "summary", "summarise", "tldr", "tl;dr"]:
-                if keyword in text_lower:
-                    parts = text.split(keyword, 1)
-                    if len(parts) > 1:
-                        content = parts[1].strip()
-                        if content.startswith(":"):
-                            content = content[1:].strip()
-                    break
-            
-            if len(content) < 50:
-                from services.slack_service import SlackService
-                from services.credential_service import CredentialService
-                slack_creds = await CredentialService.get_credential(db, user_id, "slack")
-                if slack_creds:
-                    slack = SlackService(
-                        bot_token=slack_creds.get("bot_token"),
-                        app_token=slack_creds.get("app_token"),
-                        signing_secret=slack_creds.get("signing_secret")
-                    )
-                    await slack.send_message(
-                        channel=channel,
-                        text="Please provide more content to summarize. Example: `@bot summarize: [your long text here]`"
-                    )
-                return
-            
-            # Generate summary
-            result = await agent.generate_summary(
-                title=f"Slack Summary - {channel}",
-                content=content,
-                save_to_drive=True
-            )
-            
-            if result.get("success"):
-                summary_text = result.get("summary")
-                drive_url = result.get("google_drive_file_url")
-                
-                from services.slack_service import SlackService
-                from services.credential_service import CredentialService
-                slack_creds = await CredentialService.get_credential(db, user_id, "slack")
-                if slack_creds:
-                    slack = SlackService(
-                        bot_token=slack_creds.get("bot_token"),
-                        app_token=slack_creds.get("app_token"),
-                        signing_secret=slack_creds.get("signing_secret")
-                    )
-                    
-                    response_text = f"📝 *Summary Generated*\n\n{summary_text}"
-                    if drive_url:
-                        response_text += f"\n\n📁 *Saved to Google Drive:* {drive_url}"
-                    
-                    await slack.send_message(
-                        channel=channel,
-                        text=response_text
-                    )
-                
-                logger.info(f"Successfully generated summary via mention in channel {channel}")
-        else:
-            # Regular mention - generate AI response
-            result = await agent.handle_slack_message(
-                message=text,
-                channel_id=channel,
-                slack_user_id=user,
-                message_ts=ts
-            )
-            
+        slack = await _get_slack_service(db, user_id)
+        if slack:
             if result.get("success"):
-                logger.info(f"Successfully responded to mention in channel {channel}")
+                scope = "Thread" if thread_ts else "Channel"
+                response_text = f"📝 *{scope} Summary*\n\n{result.get('summary')}"
+                if result.get("google_drive_file_url"):
+                    response_text += f"\n\n📁 *Saved to Google Drive:* {result.get('google_drive_file_url')}"
             else:
-                logger.error(f"Failed to respond to mention: {result.get('error')}")
+                response_text = (
+                    f"Couldn't summarize this conversation: {result.get('error')}. "
+                    "You can also paste text: `@bot summarize: [your long text here]`"
+                )
+            await slack.send_message(
+                channel=channel,
+                text=response_text,
+                thread_ts=thread_ts
+            )
+        return
+    
+    # Generate summary
+    result = await agent.generate_summary(
+        title=f"Slack Summary - {channel}",
+        content=content,
+        save_to_drive=True
+    )
+    
+    if result.get("success"):
+        summary_text = result.get("summary")
+        drive_url = result.get("google_drive_file_url")
+        
+        slack = await _get_slack_service(db, user_id)
+        if slack:
+            response_text = f"📝 *Summary Generated*\n\n{summary_text}"
+            if drive_url:
+                response_text += f"\n\n📁 *Saved to Google Drive:* {drive_url}"
             
-    except Exception as e:
-        logger.error(f"Error handling mention: {e}", exc_info=True)
+            await slack.send_message(
+                channel=channel,
+                text=response_text
+            )
+        
+        logger.info(f"Successfully generated summary via mention in channel {channel}")
+
+
+async def answer_mention(db: Session, user_id: int, agent: AgentService, event: dict, match: IntentMatch):
+    """Regular mention - generate AI response"""
+    channel = event.get("channel")
+    result = await agent.handle_slack_message(
+        message=match.remainder,
+        channel_id=channel,
+        slack_user_id=event.get("user"),
+        message_ts=event.get("ts"),
+        use_channel_context=True
+    )
+    
+    if result.get("success"):
+        logger.info(f"Successfully responded to mention in channel {channel}")
+    else:
+        logger.error(f"Failed to respond to mention: {result.get('error')}")
+
+
+mention_router.default = answer_mention
 
 
 @router.post("/interactive")
@@ -264,30 +295,76 @@ async def handle_slack_interactive(request: Request):
 
 
 @router.post("/slash-commands")
-async def handle_slash_command(
-    request: Request,
-    x_slack_request_timestamp: str = Header(None),
-    x_slack_signature: str = Header(None)
-):
+async def handle_slash_command(request: Request):
     """Handle Slack slash commands"""
     form_data = await request.form()
     
     command = form_data.get("command")
-    text = form_data.get("text", "")
-    user_id = form_data.get("user_id")
+    
+    logger.info(f"Slash command received: {command} from user {form_data.get('user_id')}")
+    
+    handler = slash_router.route_command(command)
+    if handler:
+        return await handler(form_data)
+    
+    return {
+        "response_type": "ephemeral",
+        "text": f"Command {command} received!"
+    }
+
+
+@slash_router.command("/ai-summarize")
+async def summarize_command(form_data) -> dict:
+    """Example: /ai-summarize [text]
+    
+    Acks immediately and posts the summary to the command's response_url when the
+    background job finishes. Without text, the recent channel window is summarized.
+    """
+    text = form_data.get("text", "").strip()
     channel_id = form_data.get("channel_id")
+    slack_user_id = form_data.get("user_id")
+    response_url = form_data.get("response_url")
     
-    logger.info(f"Slash command received: {command} from user {user_id}")
+    async def job() -> dict:
+        db = SessionLocal()
+        try:
+            # Same workspace-to-user mapping as the events endpoint
+            user = db.query(User).filter(User.is_active == True).first()
+            if not user:
+                return {"success": False, "error": "No active users"}
+            
+            agent = AgentService(db, user.id)
+            if text:
+                return await agent.generate_summary(
+                    title=f"Slack Summary - {channel_id}",
+                    content=text,
+                    save_to_drive=True
+                )
+            return await agent.summarize_conversation(channel_id=channel_id, save_to_drive=True)
+        finally:
+            db.close()
+    
+    async def deliver(result: dict) -> None:
+        if result.get("success"):
+            response_text = f"📝 *Summary Generated*\n\n{result.get('summary')}"
+            if result.get("google_drive_file_url"):
+                response_text += f"\n\n📁 *Saved to Google Drive:* {result.get('google_drive_file_url')}"
+            response_type = "in_channel"
+        else:
+            response_text = f"Couldn't generate summary: {result.get('error')}"
+            response_type = "ephemeral"
+        
+        if response_url:
+            webhook = WebhookClient(response_url)
+            await asyncio.to_thread(webhook.send, text=response_text, response_type=response_type)
     
-    # Example: /ai-summarize [text]
-    if command == "/ai-summarize":
-        # Handle summary generation
+    if not slash_command_queue.submit(slack_user_id, job, deliver):
         return {
-            "response_type": "in_channel",
-            "text": f"Generating summary for: {text[:50]}..."
+            "response_type": "ephemeral",
+            "text": "You already have summaries in progress. Please wait for them to finish."
         }
     
     return {
         "response_type": "ephemeral",
-        "text": f"Command {command} received!"
+        "text": "Generating summary... it will be posted here shortly."
     }
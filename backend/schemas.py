@@ -118,6 +118,24 @@ class SummaryResponse(BaseModel):
         from_attributes = True
 
 
+# Job Schemas
+class JobResponse(BaseModel):
+    id: int
+    job_type: str
+    status: str
+    stage: str
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    attempts: int
+    next_attempt_at: Optional[datetime] = None
+    created_at: datetime
+    updated_at: datetime
+    finished_at: Optional[datetime] = None
+    
+    class Config:
+        from_attributes = True
+
+
 # Audit Log Schemas
 class AuditLogResponse(BaseModel):
     id: int
@@ -139,6 +157,9 @@ class UsageStatsResponse(BaseModel):
     user_id: int
     service_type: str
     action_type: str
+    model: Optional[str] = None
+    prompt_tokens: Optional[int] = None
+    completion_tokens: Optional[int] = None
     tokens_used: int
     cost: float
     execution_time_ms: Optional[float] = None
@@ -152,8 +173,12 @@ class UsageStatsSummary(BaseModel):
     total_messages: int
     total_summaries: int
     total_tokens: int
+    total_prompt_tokens: int = 0
+    total_completion_tokens: int = 0
     total_cost: float
     avg_response_time_ms: Optional[float] = None
+    cost_by_user: Dict[int, float] = {}
+    cost_by_service: Dict[str, float] = {}
 
 
 # Admin Schemas
@@ -163,6 +188,8 @@ class AdminDashboardStats(BaseModel):
     total_messages: int
     total_summaries: int
     total_tokens_used: int
+    total_prompt_tokens: int = 0
+    total_completion_tokens: int = 0
     total_cost: float
     recent_logs: List[AuditLogResponse]
     usage_by_service: Dict[str, Any]
@@ -1,18 +1,27 @@
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Callable, Iterable, List, Optional, Tuple
 from jose import JWTError, jwt
 from passlib.context import CryptContext
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.orm import Session
-from cryptography.fernet import Fernet
+from cryptography.fernet import Fernet, InvalidToken, MultiFernet
+from collections import OrderedDict
+import hashlib
+import hmac
 import json
 import base64
 import logging
+import math
+import threading
+import time
 from config import settings
-from database import get_db
-from models import User
+from database import get_db, SessionLocal
+from models import User, Credential
 from schemas import TokenData
+from services.rate_limit import rate_limiter
+from services.shared_state import shared_state
+from tracing import traced
 
 logger = logging.getLogger(__name__)
 
@@ -25,7 +34,113 @@ oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
 # Encryption for storing credentials
 # In production, use a key management service
 ENCRYPTION_KEY = base64.urlsafe_b64encode(settings.secret_key.encode().ljust(32)[:32])
-cipher_suite = Fernet(ENCRYPTION_KEY)
+ENVELOPE_PREFIX = "env1"
+
+
+class CredentialCipher:
+    """Envelope encryption for stored credentials.
+    
+    Each value is encrypted with its own random data key, and the data key is
+    wrapped with the keyring's primary key and stored alongside it as
+    "env1:<wrapped data key>:<ciphertext>". Rotating the keyring only rewraps
+    the data keys, and every key in the ring can still unwrap until rotate()
+    has been run over all rows. Values from before envelopes (plain Fernet
+    tokens) still decrypt with any keyring key.
+    
+    Unwrapped data keys are cached, LRU-bounded by cache_size, so a hot
+    credential costs one decryption like before.
+    """
+    
+    def __init__(self, keys: List[bytes], cache_size: int = 4096):
+        self.keyring = MultiFernet([Fernet(key) for key in keys])
+        self.primary_key = keys[0]
+        self.primary = Fernet(keys[0])
+        self.cache_size = cache_size
+        self._data_keys: "OrderedDict[str, Fernet]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def _split(token: str) -> Optional[Tuple[str, str]]:
+        """(wrapped data key, ciphertext) for an envelope, None for a legacy token"""
+        parts = token.split(":")
+        if len(parts) == 3 and parts[0] == ENVELOPE_PREFIX:
+            return parts[1], parts[2]
+        return None
+    
+    @staticmethod
+    def ciphertext(token: str) -> str:
+        """The part of a stored value that only changes when the credentials do"""
+        return token.rsplit(":", 1)[-1]
+    
+    def _data_key(self, wrapped: str) -> Fernet:
+        with self._lock:
+            data_key = self._data_keys.get(wrapped)
+            if data_key is not None:
+                self._data_keys.move_to_end(wrapped)
+                return data_key
+        data_key = Fernet(self.keyring.decrypt(wrapped.encode()))
+        if self.cache_size > 0:
+            with self._lock:
+                self._data_keys[wrapped] = data_key
+                if len(self._data_keys) > self.cache_size:
+                    self._data_keys.popitem(last=False)
+        return data_key
+    
+    def encrypt(self, plaintext: bytes) -> str:
+        data_key = Fernet.generate_key()
+        wrapped = self.primary.encrypt(data_key).decode()
+        ciphertext = Fernet(data_key).encrypt(plaintext).decode()
+        return f"{ENVELOPE_PREFIX}:{wrapped}:{ciphertext}"
+    
+    def decrypt(self, token: str) -> bytes:
+        """Decrypt a stored value. Raises InvalidToken if no key in the ring opens it"""
+        envelope = self._split(token)
+        if envelope is None:
+            return self.keyring.decrypt(token.encode())
+        wrapped, ciphertext = envelope
+        return self._data_key(wrapped).decrypt(ciphertext.encode())
+    
+    def rotate(self, token: str) -> Optional[str]:
+        """The value rewrapped under the primary key, or None if it already is.
+        
+        Legacy tokens are re-encrypted as envelopes. Data keys aren't cached here
+        so a pass over every row doesn't evict the hot ones.
+        """
+        envelope = self._split(token)
+        if envelope is None:
+            return self.encrypt(self.keyring.decrypt(token.encode()))
+        wrapped, ciphertext = envelope
+        try:
+            self.primary.decrypt(wrapped.encode())
+            return None
+        except InvalidToken:
+            pass
+        return f"{ENVELOPE_PREFIX}:{self.keyring.rotate(wrapped.encode()).decode()}:{ciphertext}"
+    
+    def clear_cache(self) -> None:
+        with self._lock:
+            self._data_keys.clear()
+
+
+def load_encryption_keys() -> List[bytes]:
+    """Configured keyring, newest first.
+    
+    The key padded from secret_key is weak, so it's only appended while
+    credential_legacy_key is on, for values written before a keyring was
+    configured, and only used as the primary outside production.
+    """
+    keys = [key.strip().encode() for key in settings.credential_encryption_keys.split(",") if key.strip()]
+    if not keys:
+        if settings.app_env == "production":
+            raise RuntimeError("CREDENTIAL_ENCRYPTION_KEYS must be set in production (python rotate_keys.py --generate-key)")
+        logger.warning("CREDENTIAL_ENCRYPTION_KEYS is not set; encrypting credentials with a key derived from SECRET_KEY")
+        return [ENCRYPTION_KEY]
+    if settings.credential_legacy_key and ENCRYPTION_KEY not in keys:
+        keys.append(ENCRYPTION_KEY)
+    return keys
+
+
+credential_cipher = CredentialCipher(load_encryption_keys(), settings.credential_data_key_cache_size)
 
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
@@ -111,14 +226,13 @@ def verify_token(token: str, token_type: str = "access") -> TokenData:
 def encrypt_credentials(credentials: dict) -> str:
     """Encrypt credentials for storage"""
     credentials_json = json.dumps(credentials)
-    encrypted = cipher_suite.encrypt(credentials_json.encode())
-    return encrypted.decode()
+    return credential_cipher.encrypt(credentials_json.encode())
 
 
+@traced("credential.decrypt")
 def decrypt_credentials(encrypted_credentials: str) -> dict:
     """Decrypt stored credentials"""
-    decrypted = cipher_suite.decrypt(encrypted_credentials.encode())
-    return json.loads(decrypted.decode())
+    return json.loads(credential_cipher.decrypt(encrypted_credentials).decode())
 
 
 async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> User:
@@ -158,3 +272,170 @@ async def get_current_admin_user(current_user: User = Depends(get_current_user))
             detail="Not enough permissions"
         )
     return current_user
+
+
+# Slack request signing
+# https://api.slack.com/authentication/verifying-requests-from-slack
+SLACK_SIGNATURE_PREFIX = "v0="
+SLACK_SIGNATURE_LENGTH = len(SLACK_SIGNATURE_PREFIX) + hashlib.sha256().digest_size * 2
+SLACK_REQUEST_MAX_AGE_SECONDS = 60 * 5
+
+
+def load_slack_signing_secrets() -> List[str]:
+    """Load every configured Slack signing secret (environment and stored credentials)"""
+    secrets = []
+    if settings.slack_signing_secret:
+        secrets.append(settings.slack_signing_secret)
+    
+    db = SessionLocal()
+    try:
+        slack_credentials = db.query(Credential).filter(
+            Credential.service_type == "slack",
+            Credential.is_active == True
+        ).all()
+        for credential in slack_credentials:
+            try:
+                signing_secret = decrypt_credentials(credential.encrypted_credentials).get("signing_secret")
+            except Exception as e:
+                logger.error(f"Failed to decrypt Slack credential {credential.id}: {e}")
+                continue
+            if signing_secret and signing_secret not in secrets:
+                secrets.append(signing_secret)
+    finally:
+        db.close()
+    
+    return secrets
+
+
+class SlackSigningKeyring:
+    """Pre-keyed HMAC objects for each workspace's Slack signing secret.
+    
+    Keys are loaded once and reused by copying the keyed HMAC state, so verifying a
+    request costs one hash over the raw body and no database access. Call
+    invalidate() whenever a Slack credential changes: it bumps a generation counter
+    in the shared state, which every worker checks at most every check_seconds
+    and reloads its keys when it moved.
+    """
+    
+    GENERATION_KEY = "slack_keyring:generation"
+    
+    def __init__(
+        self,
+        loader: Callable[[], Iterable[str]] = load_slack_signing_secrets,
+        state=shared_state,
+        check_seconds: float = 5.0
+    ):
+        self.loader = loader
+        self.state = state
+        self.check_seconds = check_seconds
+        self._keys: Optional[List[hmac.HMAC]] = None
+        self._generation: Optional[int] = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+    
+    def invalidate(self) -> None:
+        """Drop cached keys here and make every other worker reload them"""
+        if self.state.incr(self.GENERATION_KEY, 1) is None and not self.state.add(self.GENERATION_KEY, 1):
+            # Another worker created the counter meanwhile
+            self.state.incr(self.GENERATION_KEY, 1)
+        self._keys = None
+    
+    def keys(self) -> List[hmac.HMAC]:
+        """Get the cached keyed HMAC objects, loading them when missing or stale"""
+        keys = self._keys
+        if keys is not None and time.monotonic() - self._checked_at < self.check_seconds:
+            return keys
+        with self._lock:
+            generation = self.state.get(self.GENERATION_KEY) or 0
+            self._checked_at = time.monotonic()
+            if self._keys is not None and generation == self._generation:
+                return self._keys
+            keys = [
+                hmac.new(secret.encode(), digestmod=hashlib.sha256)
+                for secret in self.loader()
+            ]
+            # Not cached when empty, so the first Slack credential is picked up at once
+            self._keys = keys or None
+            self._generation = generation
+            logger.info(f"Loaded {len(keys)} Slack signing key(s)")
+        return keys
+    
+    def verify(
+        self,
+        timestamp: Optional[str],
+        body: bytes,
+        signature: Optional[str],
+        now: Optional[float] = None
+    ) -> bool:
+        """Verify a Slack request signature over the raw body bytes"""
+        # Cheap structural checks first so forged floods never reach the HMAC
+        if not timestamp or not signature:
+            return False
+        if len(signature) != SLACK_SIGNATURE_LENGTH or not signature.startswith(SLACK_SIGNATURE_PREFIX):
+            return False
+        if not signature.isascii():
+            return False
+        try:
+            request_time = int(timestamp)
+        except ValueError:
+            return False
+        
+        # Prevent replay attacks - reject if timestamp is older than 5 minutes
+        if abs((now if now is not None else time.time()) - request_time) > SLACK_REQUEST_MAX_AGE_SECONDS:
+            return False
+        
+        basestring = b"v0:" + timestamp.encode() + b":" + body
+        expected = signature[len(SLACK_SIGNATURE_PREFIX):]
+        for key in self.keys():
+            mac = key.copy()
+            mac.update(basestring)
+            if hmac.compare_digest(mac.hexdigest(), expected):
+                return True
+        return False
+
+
+slack_keyring = SlackSigningKeyring(check_seconds=settings.slack_keyring_check_seconds)
+
+
+async def verify_slack_request(request: Request) -> None:
+    """Reject requests that are not signed by Slack before any parsing happens"""
+    body = await request.body()
+    if not slack_keyring.verify(
+        request.headers.get("x-slack-request-timestamp"),
+        body,
+        request.headers.get("x-slack-signature")
+    ):
+        logger.warning(f"Rejected unsigned or stale Slack request to {request.url.path}")
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid Slack signature"
+        )
+
+
+def rate_limit(name: str) -> Callable:
+    """Dependency enforcing a named rate limit per user, or per client address when anonymous.
+    
+    The user comes from the bearer token's claims alone, so the check needs no
+    database lookup.
+    """
+    async def check_rate_limit(request: Request) -> None:
+        user_id = None
+        authorization = request.headers.get("authorization", "")
+        if authorization.lower().startswith("bearer "):
+            try:
+                user_id = verify_token(authorization[7:]).user_id
+            except HTTPException:
+                pass
+        
+        client_host = request.client.host if request.client else "unknown"
+        identity = f"user:{user_id}" if user_id is not None else f"ip:{client_host}"
+        allowed, retry_after = rate_limiter.check(name, identity, user_id)
+        if not allowed:
+            logger.warning(f"Rate limit '{name}' exceeded by {identity}")
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Rate limit exceeded",
+                headers={"Retry-After": str(max(1, math.ceil(retry_after)))}
+            )
+    
+    return check_rate_limit
@@ -0,0 +1,57 @@
+"""Production entry point: serve the app from several uvicorn worker processes.
+
+    cd backend
+    python serve.py --workers 4 --port 8000
+
+Workers default to WEB_CONCURRENCY, or one per CPU core. The schema, the usage
+rollup backfill and recovery of interrupted jobs run once here before any worker
+starts; doing them per worker would requeue jobs other workers are running. With more than one worker and no
+SHARED_STATE_URL, caches, rate limits and dedup go to a SQLite file in /dev/shm
+(or the temp directory) so every worker sees the same state, and Prometheus
+metrics are merged through a fresh PROMETHEUS_MULTIPROC_DIR.
+"""
+import argparse
+import logging
+import os
+import tempfile
+
+logger = logging.getLogger("serve")
+
+
+def shared_dir() -> str:
+    """RAM-backed directory for per-host state when there is one"""
+    return "/dev/shm" if os.path.isdir("/dev/shm") and os.access("/dev/shm", os.W_OK) else tempfile.gettempdir()
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Serve the backend with multiple worker processes")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=0, help="Worker processes; defaults to WEB_CONCURRENCY or the CPU count")
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    # Workers are spawned fresh and read their settings from the environment set here
+    from config import settings
+
+    workers = args.workers or settings.web_concurrency or os.cpu_count() or 1
+    if workers > 1:
+        if settings.shared_state_url == "memory":
+            path = os.path.join(shared_dir(), f"slack-ai-bot-state-{args.port}.db")
+            os.environ["SHARED_STATE_URL"] = f"sqlite:///{path}"
+            logger.info(f"Sharing caches, rate limits and dedup between workers in {path}")
+        if not os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+            os.environ["PROMETHEUS_MULTIPROC_DIR"] = tempfile.mkdtemp(prefix="slack-ai-bot-metrics-")
+
+    from main import prepare_database
+    import uvicorn
+
+    prepare_database()
+    os.environ["PREPARE_DATABASE_ON_STARTUP"] = "false"
+    logger.info(f"Starting {workers} worker(s) on {args.host}:{args.port}")
+    uvicorn.run("main:app", host=args.host, port=args.port, workers=workers, log_level=args.log_level)
+
+
+if __name__ == "__main__":
+    main()
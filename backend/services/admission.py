@@ -0,0 +1,136 @@
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+import logging
+import math
+import time
+from config import settings
+from metrics import QUEUE_DEPTH
+
+logger = logging.getLogger(__name__)
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request is shed instead of queued; maps to an HTTP 429 or 503"""
+
+    def __init__(self, status_code: int, detail: str, retry_after: int):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+class AdaptiveLimiter:
+    """AIMD concurrency limit driven by the latency of admitted requests.
+
+    Each request that finishes under the target latency raises the limit by
+    1/limit (about one slot per full window of requests); a slow or failed request
+    cuts it by decrease_factor. The limit stays within [min_limit, max_limit].
+    """
+
+    def __init__(
+        self,
+        initial_limit: float = 20,
+        min_limit: float = 2,
+        max_limit: float = 100,
+        target_latency_ms: float = 8000,
+        decrease_factor: float = 0.9,
+        latency_alpha: float = 0.2
+    ):
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.target_latency_ms = target_latency_ms
+        self.decrease_factor = decrease_factor
+        self.latency_alpha = latency_alpha
+        self.latency_ms: Optional[float] = None  # Exponentially weighted average
+
+    def on_sample(self, latency_ms: float, dropped: bool = False) -> None:
+        """Adjust the limit after a request finishes"""
+        self.latency_ms = latency_ms if self.latency_ms is None else (
+            self.latency_alpha * latency_ms + (1 - self.latency_alpha) * self.latency_ms
+        )
+        if dropped or latency_ms > self.target_latency_ms:
+            self.limit = max(self.min_limit, self.limit * self.decrease_factor)
+        else:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+
+class AdmissionController:
+    """Per-user and adaptive global concurrency limits for LLM-backed requests.
+
+    Requests over a limit are rejected straight away with a Retry-After hint rather
+    than queued, so a spike can't build an unbounded backlog of model calls.
+    """
+
+    def __init__(self, limiter: AdaptiveLimiter, per_user_limit: int = 4):
+        self.limiter = limiter
+        self.per_user_limit = per_user_limit
+        self.in_flight = 0
+        self._per_user: Dict[str, int] = {}
+        self.rejected = 0
+
+    def _retry_after(self) -> int:
+        """Seconds until a slot is likely to free up"""
+        latency_ms = self.limiter.latency_ms or self.limiter.target_latency_ms
+        return max(1, math.ceil(latency_ms / 1000))
+
+    def acquire(self, key: str) -> None:
+        """Take a slot for key or raise AdmissionRejected"""
+        if self._per_user.get(key, 0) >= self.per_user_limit:
+            self.rejected += 1
+            raise AdmissionRejected(429, "Too many requests in progress", self._retry_after())
+        if self.in_flight >= int(self.limiter.limit):
+            self.rejected += 1
+            logger.warning(f"Shedding request: {self.in_flight} in flight, limit {self.limiter.limit:.1f}")
+            raise AdmissionRejected(503, "Server is busy, try again shortly", self._retry_after())
+        self.in_flight += 1
+        QUEUE_DEPTH.labels(queue="agent_admission").inc()
+        self._per_user[key] = self._per_user.get(key, 0) + 1
+
+    def release(self, key: str, latency_ms: float, dropped: bool = False) -> None:
+        """Return a slot and feed the request's latency to the limiter"""
+        self.in_flight -= 1
+        QUEUE_DEPTH.labels(queue="agent_admission").dec()
+        remaining = self._per_user.get(key, 0) - 1
+        if remaining > 0:
+            self._per_user[key] = remaining
+        else:
+            self._per_user.pop(key, None)
+        self.limiter.on_sample(latency_ms, dropped=dropped)
+
+    @asynccontextmanager
+    async def slot(self, key: str):
+        """Hold a slot for the duration of the block"""
+        self.acquire(key)
+        start = time.perf_counter()
+        dropped = False
+        try:
+            yield
+        except Exception as e:
+            # Server-side failures signal overload; client errors (4xx) don't
+            dropped = getattr(e, "status_code", 500) >= 500
+            raise
+        except BaseException:
+            dropped = True
+            raise
+        finally:
+            self.release(key, (time.perf_counter() - start) * 1000, dropped=dropped)
+
+    def stats(self) -> Dict:
+        return {
+            "in_flight": self.in_flight,
+            "limit": round(self.limiter.limit, 2),
+            "latency_ms": self.limiter.latency_ms,
+            "rejected": self.rejected
+        }
+
+
+agent_admission = AdmissionController(
+    AdaptiveLimiter(
+        initial_limit=settings.admission_initial_limit,
+        min_limit=settings.admission_min_limit,
+        max_limit=settings.admission_max_limit,
+        target_latency_ms=settings.admission_target_latency_ms
+    ),
+    per_user_limit=settings.admission_per_user_limit
+)
@@ -1,12 +1,20 @@
 from sqlalchemy.orm import Session
-from typing import Dict, List, Optional
+from typing import Awaitable, Dict, List, Optional, Tuple
 from datetime import datetime
+import asyncio
 import logging
+import time
 from models import User, SlackMessage, Summary, AuditLog, UsageStats
 from services.credential_service import CredentialService
 from services.slack_service import SlackService
 from services.azure_ai_service import AzureAIService
 from services.google_service import GoogleWorkspaceService
+from services.channel_context import channel_context
+from services.conversation_summaries import conversation_summaries, CachedSummary
+from services.token_budget import token_ledger
+from services.usage_service import add_usage, build_usage, usage_from_response
+from config import settings
+from tracing import traced
 
 logger = logging.getLogger(__name__)
 
@@ -17,15 +25,19 @@ class AgentService:
     def __init__(self, db: Session, user_id: int):
         self.db = db
         self.user_id = user_id
+        self.unhealthy: Dict[str, str] = {}
     
+    @traced()
     async def _get_services(self) -> Dict:
         """Get all configured services for the user"""
         services = {}
         
-        # Get Slack credentials
-        slack_creds = await CredentialService.get_credential(
-            self.db, self.user_id, "slack"
+        # Resolve all credentials with a single query, skipping ones known to be broken
+        creds, self.unhealthy = await CredentialService.get_healthy_credentials(
+            self.db, self.user_id, ["slack", "azure_openai", "google_workspace"]
         )
+        
+        slack_creds = creds.get("slack")
         if slack_creds:
             services['slack'] = SlackService(
                 bot_token=slack_creds.get("bot_token"),
@@ -33,53 +45,126 @@ class AgentService:
                 signing_secret=slack_creds.get("signing_secret")
             )
         
-        # Get Azure AI credentials
-        azure_creds = await CredentialService.get_credential(
-            self.db, self.user_id, "azure_openai"
-        )
+        azure_creds = creds.get("azure_openai")
         if azure_creds:
-            services['azure_ai'] = AzureAIService(
-                endpoint=azure_creds.get("endpoint"),
-                api_key=azure_creds.get("api_key"),
-                deployment=azure_creds.get("deployment"),
-                api_version=azure_creds.get("api_version", "2023-05-15")
-            )
+            services['azure_ai'] = AzureAIService.from_credentials(azure_creds)
         
-        # Get Google credentials
-        google_creds = await CredentialService.get_credential(
-            self.db, self.user_id, "google_workspace"
-        )
+        google_creds = creds.get("google_workspace")
         if google_creds:
             services['google'] = GoogleWorkspaceService(google_creds)
         
         return services
     
+    def _unavailable(self, service_type: str, name: str) -> Dict:
+        """Error result for a service that isn't configured or failed its last health check"""
+        if service_type in self.unhealthy:
+            return {
+                "success": False,
+                "error": f"{name} credentials failed their last connection test: {self.unhealthy[service_type]}",
+                "error_code": "credential_unhealthy"
+            }
+        return {
+            "success": False,
+            "error": f"{name} not configured"
+        }
+    
+    @staticmethod
+    async def _timed(timings: Dict[str, float], stage: str, awaitable: Awaitable):
+        """Await a pipeline stage, recording its wall time in milliseconds"""
+        start = time.perf_counter()
+        try:
+            return await awaitable
+        finally:
+            timings[stage] = round((time.perf_counter() - start) * 1000, 2)
+    
+    def _write(self, rows: List, usage_stat: UsageStats, meta_info: Dict, timings: Dict[str, float]) -> None:
+        """Add built rows and their usage record, then commit them with the stage timings.
+        
+        Runs as one blocking call: SQLite holds its write lock from the first INSERT
+        until commit and every worker shares it, so the commit mustn't wait on the event loop.
+        """
+        start = time.perf_counter()
+        self.db.add_all(rows)
+        add_usage(self.db, usage_stat)
+        self.db.flush()
+        timings["db_write"] = round((time.perf_counter() - start) * 1000, 2)
+        usage_stat.meta_info = {**meta_info, "timings_ms": timings}
+        tokens_used = usage_stat.tokens_used
+        self.db.commit()
+        token_ledger.record(self.user_id, tokens_used)
+    
+    def _message_rows(
+        self,
+        message: str,
+        response_text: str,
+        channel_id: str,
+        slack_user_id: str,
+        message_ts: str,
+        ai_response: Dict
+    ) -> Tuple[List, UsageStats]:
+        """Build the message log, audit and priced usage rows for a reply, without touching the session"""
+        tokens_used = ai_response.get("tokens_used", 0)
+        slack_msg = SlackMessage(
+            user_id=self.user_id,
+            slack_user_id=slack_user_id,
+            slack_channel_id=channel_id,
+            slack_message_ts=message_ts,
+            user_message=message,
+            bot_response=response_text,
+            tokens_used=tokens_used,
+            response_time_ms=ai_response.get("execution_time_ms", 0)
+        )
+        audit_log = AuditLog(
+            user_id=self.user_id,
+            action="slack_message",
+            resource_type="message",
+            resource_id=message_ts,
+            details={"channel": channel_id, "tokens": tokens_used},
+            status="success"
+        )
+        usage_stat = build_usage(self.user_id, "azure_openai", "message", **usage_from_response(ai_response))
+        return [slack_msg, audit_log], usage_stat
+    
+    @traced()
     async def handle_slack_message(
         self,
         message: str,
         channel_id: str,
         slack_user_id: str,
         message_ts: str,
-        context: Optional[List[str]] = None
+        context: Optional[List[str]] = None,
+        use_channel_context: bool = False
     ) -> Dict:
         """Handle incoming Slack message and generate AI response"""
-        services = await self._get_services()
+        timings = {}
+        services = await self._timed(timings, "credentials", self._get_services())
         
         if 'azure_ai' not in services:
-            return {
-                "success": False,
-                "error": "Azure AI not configured"
-            }
+            return self._unavailable("azure_openai", "Azure AI")
         
         # Generate AI response
         azure_ai = services['azure_ai']
         
+        # Pull recent channel messages from the rolling buffer
+        if use_channel_context and context is None:
+            fetch_history = services['slack'].get_channel_history if 'slack' in services else None
+            context = await self._timed(timings, "context", channel_context.get_context(
+                channel_id,
+                exclude_ts=message_ts,
+                fetch_history=fetch_history
+            ))
+            channel_context.record(channel_id, message_ts, f"<@{slack_user_id}>", message)
+        
         # Build context if provided
         context_str = None
         if context:
             context_str = "\n".join(context)
         
-        ai_response = await azure_ai.answer_question(message, context=context_str)
+        ai_response = await self._timed(timings, "llm", azure_ai.answer_question(
+            message,
+            context=context_str,
+            token_budget=token_ledger.remaining(self.db, self.user_id)
+        ))
         
         if not ai_response.get("success"):
             return ai_response
@@ -88,52 +173,28 @@ class AgentService:
         tokens_used = ai_response.get("tokens_used", 0)
         execution_time_ms = ai_response.get("execution_time_ms", 0)
         
-        # Send response to Slack if available
-        if 'slack' in services:
-            slack = services['slack']
-            await slack.send_message(
-                channel=channel_id,
-                text=response_text,
-                thread_ts=message_ts
-            )
+        # Post to Slack while the log rows are built and priced; they're only inserted
+        # afterwards, so SQLite's write lock never spans the network round trip
+        sent_task = None
+        async with asyncio.TaskGroup() as tg:
+            if 'slack' in services:
+                sent_task = tg.create_task(self._timed(timings, "slack_post", services['slack'].send_message(
+                    channel=channel_id,
+                    text=response_text,
+                    thread_ts=message_ts
+                )))
+            rows_task = tg.create_task(asyncio.to_thread(
+                self._message_rows, message, response_text, channel_id, slack_user_id, message_ts, ai_response
+            ))
         
-        # Log the interaction
-        slack_msg = SlackMessage(
-            user_id=self.user_id,
-            slack_user_id=slack_user_id,
-            slack_channel_id=channel_id,
-            slack_message_ts=message_ts,
-            user_message=message,
-            bot_response=response_text,
-            tokens_used=tokens_used,
-            response_time_ms=execution_time_ms
-        )
-        self.db.add(slack_msg)
-        
-        # Log usage stats
-        usage_stat = UsageStats(
-            user_id=self.user_id,
-            service_type="azure_openai",
-            action_type="message",
-            tokens_used=tokens_used,
-            cost=tokens_used * 0.00002,  # Approximate cost
-            execution_time_ms=execution_time_ms,
-            meta_info={"channel_id": channel_id}
-        )
-        self.db.add(usage_stat)
+        if sent_task is not None:
+            sent = sent_task.result()
+            if use_channel_context and sent.get("success"):
+                channel_context.record(channel_id, sent["message_ts"], "assistant", response_text)
         
-        # Log audit
-        audit_log = AuditLog(
-            user_id=self.user_id,
-            action="slack_message",
-            resource_type="message",
-            resource_id=message_ts,
-            details={"channel": channel_id, "tokens": tokens_used},
-            status="success"
-        )
-        self.db.add(audit_log)
-        
-        self.db.commit()
+        # The rows commit in one transaction along with the stage timings
+        rows, usage_stat = rows_task.result()
+        await asyncio.to_thread(self._write, rows, usage_stat, {"channel_id": channel_id}, timings)
         
         return {
             "success": True,
@@ -142,6 +203,7 @@ class AgentService:
             "execution_time_ms": execution_time_ms
         }
     
+    @traced()
     async def generate_summary(
         self,
         title: str,
@@ -149,61 +211,201 @@ class AgentService:
         save_to_drive: bool = True
     ) -> Dict:
         """Generate a summary and optionally save to Google Drive"""
-        services = await self._get_services()
+        timings = {}
+        services = await self._timed(timings, "credentials", self._get_services())
         
         if 'azure_ai' not in services:
-            return {
-                "success": False,
-                "error": "Azure AI not configured"
-            }
+            return self._unavailable("azure_openai", "Azure AI")
         
         azure_ai = services['azure_ai']
         
         # Generate summary
-        summary_response = await azure_ai.generate_summary(content)
+        summary_response = await self._timed(timings, "llm", azure_ai.generate_summary(
+            content,
+            token_budget=token_ledger.remaining(self.db, self.user_id)
+        ))
+        
+        if not summary_response.get("success"):
+            return summary_response
+        
+        return await self._store_summary(
+            services,
+            title=title,
+            summary_text=summary_response.get("response"),
+            usage=usage_from_response(summary_response),
+            save_to_drive=save_to_drive,
+            timings=timings
+        )
+    
+    @traced()
+    async def summarize_conversation(
+        self,
+        channel_id: str,
+        thread_ts: Optional[str] = None,
+        exclude_ts: Optional[str] = None,
+        save_to_drive: bool = True
+    ) -> Dict:
+        """Summarize a Slack thread or recent channel window.
+        
+        Already-summarized messages are cached by ts, so repeat requests only fetch
+        and send the messages posted since the last summary.
+        """
+        timings = {}
+        services = await self._timed(timings, "credentials", self._get_services())
+        
+        if 'azure_ai' not in services:
+            return self._unavailable("azure_openai", "Azure AI")
+        if 'slack' not in services:
+            return self._unavailable("slack", "Slack")
+        
+        cached = conversation_summaries.get(self.user_id, channel_id, thread_ts)
+        messages = await self._timed(timings, "slack_fetch", services['slack'].fetch_conversation(
+            channel_id,
+            thread_ts=thread_ts,
+            oldest=cached.latest_ts if cached else None,
+            max_messages=settings.slack_summary_window_messages
+        ))
+        
+        # Skip bot posts (including earlier summaries) and the request itself
+        new_messages = [
+            m for m in messages
+            if m.get("text") and not m.get("bot_id") and m.get("ts") != exclude_ts
+        ]
+        
+        if not new_messages:
+            if cached:
+                return {
+                    "success": True,
+                    "summary": cached.summary,
+                    "summary_id": None,
+                    "google_drive_file_id": None,
+                    "google_drive_file_url": None,
+                    "tokens_used": 0,
+                    "execution_time_ms": 0,
+                    "cached": True
+                }
+            return {
+                "success": False,
+                "error": "No messages to summarize"
+            }
+        
+        content = "\n".join(f"<@{m.get('user')}>: {m['text']}" for m in new_messages)
+        summary_response = await self._timed(timings, "llm", services['azure_ai'].generate_summary(
+            content,
+            previous_summary=cached.summary if cached else None,
+            token_budget=token_ledger.remaining(self.db, self.user_id)
+        ))
         
         if not summary_response.get("success"):
             return summary_response
         
         summary_text = summary_response.get("response")
-        tokens_used = summary_response.get("tokens_used", 0)
-        execution_time_ms = summary_response.get("execution_time_ms", 0)
+        conversation_summaries.put(self.user_id, channel_id, thread_ts, CachedSummary(
+            latest_ts=messages[-1]["ts"],
+            summary=summary_text,
+            message_count=(cached.message_count if cached else 0) + len(new_messages)
+        ))
+        
+        title = f"Slack Thread Summary - {channel_id}" if thread_ts else f"Slack Channel Summary - {channel_id}"
+        return await self._store_summary(
+            services,
+            title=title,
+            summary_text=summary_text,
+            usage=usage_from_response(summary_response),
+            save_to_drive=save_to_drive,
+            source_messages=[m["ts"] for m in new_messages],
+            timings=timings
+        )
+    
+    @traced()
+    async def _store_summary(
+        self,
+        services: Dict,
+        title: str,
+        summary_text: str,
+        usage: Dict,
+        save_to_drive: bool,
+        source_messages: Optional[List[str]] = None,
+        timings: Optional[Dict[str, float]] = None
+    ) -> Dict:
+        """Save a summary to Google Drive (if requested) while recording it in the database"""
+        timings = timings if timings is not None else {}
+        
+        # Upload to Drive while the rows are built and priced, then fill in the file link
+        # and insert them, so the database write lock isn't held across the upload
+        doc_task = None
+        async with asyncio.TaskGroup() as tg:
+            if save_to_drive and 'google' in services:
+                doc_task = tg.create_task(self._timed(
+                    timings, "drive_upload", self._save_to_drive(services, title, summary_text)
+                ))
+            build_task = tg.create_task(asyncio.to_thread(
+                self._build_summary,
+                title=title,
+                summary_text=summary_text,
+                usage=usage,
+                source_messages=source_messages
+            ))
         
+        summary, usage_stat = build_task.result()
         google_drive_file_id = None
         google_drive_file_url = None
         
-        # Save to Google Drive if requested and configured
-        if save_to_drive and 'google' in services:
-            google = services['google']
-            doc_result = await google.create_google_doc(
-                title=title,
-                content=summary_text
-            )
-            
+        if doc_task is not None:
+            doc_result = doc_task.result()
             if doc_result.get("success"):
                 google_drive_file_id = doc_result.get("file_id")
                 google_drive_file_url = doc_result.get("file_url")
+                summary.google_drive_file_id = google_drive_file_id
+                summary.google_drive_file_url = google_drive_file_url
         
-        # Save summary to database
+        tokens_used = usage_stat.tokens_used
+        summary_id = await asyncio.to_thread(self._record_summary, summary, usage_stat, save_to_drive, timings)
+        
+        return {
+            "success": True,
+            "summary": summary_text,
+            "summary_id": summary_id,
+            "google_drive_file_id": google_drive_file_id,
+            "google_drive_file_url": google_drive_file_url,
+            "tokens_used": tokens_used,
+            "execution_time_ms": usage.get("execution_time_ms", 0)
+        }
+    
+    @traced()
+    async def _save_to_drive(self, services: Dict, title: str, summary_text: str) -> Dict:
+        """Create a Google Doc for a summary"""
+        google = services['google']
+        return await google.create_google_doc(
+            title=title,
+            content=summary_text
+        )
+    
+    def _build_summary(
+        self,
+        title: str,
+        summary_text: str,
+        usage: Dict,
+        source_messages: Optional[List[str]] = None,
+        google_drive_file_id: Optional[str] = None,
+        google_drive_file_url: Optional[str] = None
+    ) -> Tuple[Summary, UsageStats]:
+        """Build the summary row and its priced usage record, without touching the session"""
         summary = Summary(
             user_id=self.user_id,
             title=title,
             content=summary_text,
+            source_messages=source_messages,
             google_drive_file_id=google_drive_file_id,
             google_drive_file_url=google_drive_file_url
         )
+        return summary, build_usage(self.user_id, "azure_openai", "summary", **usage)
+    
+    def _add_summary(self, summary: Summary, usage_stat: UsageStats, save_to_drive: bool) -> None:
+        """Add the summary, usage and audit rows to the session without committing"""
         self.db.add(summary)
-        
-        # Log usage stats
-        usage_stat = UsageStats(
-            user_id=self.user_id,
-            service_type="azure_openai",
-            action_type="summary",
-            tokens_used=tokens_used,
-            cost=tokens_used * 0.00002,
-            execution_time_ms=execution_time_ms
-        )
-        self.db.add(usage_stat)
+        self.db.flush()
+        add_usage(self.db, usage_stat)
         
         # Log audit
         audit_log = AuditLog(
@@ -211,20 +413,29 @@ class AgentService:
             action="generate_summary",
             resource_type="summary",
             resource_id=str(summary.id),
-            details={"title": title, "saved_to_drive": save_to_drive},
+            details={"title": summary.title, "saved_to_drive": save_to_drive},
             status="success"
         )
         self.db.add(audit_log)
+        self.db.flush()
+    
+    def _record_summary(
+        self,
+        summary: Summary,
+        usage_stat: UsageStats,
+        save_to_drive: bool,
+        timings: Dict[str, float]
+    ) -> int:
+        """Add the summary rows and commit them with the stage timings, returning the summary id.
         
+        One blocking call for the same reason as _write.
+        """
+        start = time.perf_counter()
+        self._add_summary(summary, usage_stat, save_to_drive)
+        summary_id = summary.id
+        timings["db_write"] = round((time.perf_counter() - start) * 1000, 2)
+        usage_stat.meta_info = {"timings_ms": timings}
+        tokens_used = usage_stat.tokens_used
         self.db.commit()
-        self.db.refresh(summary)
-        
-        return {
-            "success": True,
-            "summary": summary_text,
-            "summary_id": summary.id,
-            "google_drive_file_id": google_drive_file_id,
-            "google_drive_file_url": google_drive_file_url,
-            "tokens_used": tokens_used,
-            "execution_time_ms": execution_time_ms
-        }
+        token_ledger.record(self.user_id, tokens_used)
+        return summary_id
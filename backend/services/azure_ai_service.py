@@ -1,130 +1,392 @@
-from openai import AzureOpenAI
-from typing import Dict, List, Optional
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+import asyncio
+import hashlib
 import logging
 import time
+from config import settings
+from metrics import LLM_REQUEST_SECONDS, elapsed_seconds
+from tracing import span, traced
+from services.deployment_pool import deployment_pool, backoff_delay
+from services.single_flight import llm_single_flight, prompt_key
+from services.token_budget import count_tokens, count_message_tokens, fit_completion, trim_lines_to_tokens
 
 logger = logging.getLogger(__name__)
 
 
+@dataclass
+class DeploymentTarget:
+    """One Azure OpenAI endpoint/deployment a credential can send requests to"""
+    endpoint: str
+    deployment: str
+    client: Any
+    context_window: int
+    api_key_hash: str = ""  # Tells apart callers sharing a deployment with different keys
+
+    @property
+    def key(self) -> Tuple[str, str]:
+        return (self.endpoint, self.deployment)
+
+
+def _classify_error(e: Exception) -> Tuple[bool, Optional[float]]:
+    """Whether an API error is worth failing over, and the server's Retry-After in seconds"""
+    from openai import APIConnectionError, APIStatusError
+
+    if isinstance(e, APIStatusError):
+        retryable = e.status_code == 429 or e.status_code >= 500
+        retry_after = None
+        try:
+            retry_after = float(e.response.headers.get("retry-after"))
+        except (TypeError, ValueError, AttributeError):
+            pass
+        return retryable, retry_after
+    # Connection errors and timeouts never reached the model
+    return isinstance(e, APIConnectionError), None
+
+
 class AzureAIService:
-    def __init__(self, endpoint: str, api_key: str, deployment: str, api_version: str = "2023-05-15"):
-        """Initialize Azure OpenAI service"""
+    def __init__(
+        self,
+        endpoint: str,
+        api_key: str,
+        deployment: str,
+        api_version: str = "2023-05-15",
+        context_window: Optional[int] = None,
+        deployments: Optional[List[Dict]] = None
+    ):
+        """Initialize Azure OpenAI service.
+        
+        deployments lists extra endpoints/deployments to balance across; each entry
+        may set endpoint, api_key, deployment, api_version and context_window and
+        inherits anything it omits from the primary deployment.
+        """
+        # The openai SDK is slow to import, so it is loaded with the first client
+        from openai import AsyncAzureOpenAI
+
         self.endpoint = endpoint
         self.api_key = api_key
         self.deployment = deployment
         self.api_version = api_version
         
-        self.client = AzureOpenAI(
-            azure_endpoint=endpoint,
-            api_key=api_key,
-            api_version=api_version
+        self.targets: List[DeploymentTarget] = []
+        primary = {
+            "endpoint": endpoint,
+            "api_key": api_key,
+            "deployment": deployment,
+            "api_version": api_version,
+            "context_window": context_window
+        }
+        for entry in [primary] + list(deployments or []):
+            config = {**primary, **{k: v for k, v in entry.items() if v}}
+            if not config["endpoint"] or not config["deployment"]:
+                continue
+            target = DeploymentTarget(
+                endpoint=config["endpoint"],
+                deployment=config["deployment"],
+                client=AsyncAzureOpenAI(
+                    azure_endpoint=config["endpoint"],
+                    api_key=config["api_key"],
+                    api_version=config["api_version"]
+                ),
+                context_window=config["context_window"] or settings.azure_openai_context_window,
+                api_key_hash=hashlib.sha256((config["api_key"] or "").encode()).hexdigest()
+            )
+            if all(t.key != target.key for t in self.targets):
+                self.targets.append(target)
+        
+        # Size requests for the smallest window so any deployment can serve them
+        self.context_window = min(
+            (t.context_window for t in self.targets),
+            default=context_window or settings.azure_openai_context_window
+        )
+    
+    @classmethod
+    def from_credentials(cls, creds: Dict) -> "AzureAIService":
+        """Build the service from a stored azure_openai credential"""
+        deployments = creds.get("deployments") or []
+        primary = creds if creds.get("endpoint") else (deployments[0] if deployments else {})
+        return cls(
+            endpoint=primary.get("endpoint"),
+            api_key=primary.get("api_key") or creds.get("api_key"),
+            deployment=primary.get("deployment"),
+            api_version=primary.get("api_version") or creds.get("api_version", "2023-05-15"),
+            context_window=primary.get("context_window") or creds.get("context_window"),
+            deployments=deployments
         )
     
+    @traced()
     async def test_connection(self) -> Dict[str, any]:
-        """Test Azure OpenAI connection"""
-        try:
-            # Test with a simple completion
-            response = self.client.chat.completions.create(
-                model=self.deployment,
-                messages=[{"role": "user", "content": "Test"}],
-                max_tokens=10
-            )
-            
+        """Test Azure OpenAI connection to every deployment"""
+        async def test_target(target: DeploymentTarget) -> Dict:
+            try:
+                # Test with a simple completion
+                response = await target.client.chat.completions.create(
+                    model=target.deployment,
+                    messages=[{"role": "user", "content": "Test"}],
+                    max_tokens=10
+                )
+                return {"endpoint": target.endpoint, "deployment": target.deployment, "model": response.model}
+            except Exception as e:
+                logger.error(f"Azure OpenAI connection test failed for {target.deployment}: {e}")
+                return {"endpoint": target.endpoint, "deployment": target.deployment, "error": str(e)}
+        
+        if not self.targets:
             return {
-                "status": "success",
-                "message": "Successfully connected to Azure OpenAI",
-                "details": {
-                    "deployment": self.deployment,
-                    "model": response.model
-                }
+                "status": "failed",
+                "message": "No Azure OpenAI endpoint and deployment configured",
+                "details": None
             }
-        except Exception as e:
-            logger.error(f"Azure OpenAI connection test failed: {e}")
+        
+        results = await asyncio.gather(*(test_target(t) for t in self.targets))
+        failures = [r for r in results if "error" in r]
+        if len(failures) == len(results):
             return {
                 "status": "failed",
-                "message": f"Connection failed: {str(e)}",
+                "message": f"Connection failed: {failures[0]['error']}",
                 "details": None
             }
+        
+        details = {
+            "deployment": results[0]["deployment"],
+            "model": results[0].get("model"),
+            "deployments": results
+        }
+        if failures:
+            return {
+                "status": "success",
+                "message": f"Connected to {len(results) - len(failures)} of {len(results)} Azure OpenAI deployments",
+                "details": details
+            }
+        return {
+            "status": "success",
+            "message": "Successfully connected to Azure OpenAI",
+            "details": details
+        }
     
+    @traced()
     async def generate_response(
         self,
         messages: List[Dict[str, str]],
         max_tokens: int = 1000,
-        temperature: float = 0.7
+        temperature: float = 0.7,
+        token_budget: Optional[int] = None
     ) -> Dict:
-        """Generate AI response"""
+        """Generate AI response, rejecting requests that can't fit before calling the model"""
         start_time = time.time()
         
-        try:
-            response = self.client.chat.completions.create(
-                model=self.deployment,
-                messages=messages,
-                max_tokens=max_tokens,
-                temperature=temperature
-            )
+        # Measure the prompt locally and shrink max_tokens to the window and budget
+        prompt_tokens = count_message_tokens(messages)
+        max_tokens, error, error_code = fit_completion(
+            prompt_tokens,
+            max_tokens,
+            self.context_window,
+            token_budget=token_budget,
+            min_completion_tokens=settings.min_completion_tokens
+        )
+        if error:
+            logger.warning(f"Rejected Azure OpenAI request before sending: {error}")
+            return {
+                "success": False,
+                "error": error,
+                "error_code": error_code,
+                "prompt_tokens": prompt_tokens,
+                "execution_time_ms": 0
+            }
+        
+        if not self.targets:
+            return {
+                "success": False,
+                "error": "Azure OpenAI endpoint and deployment not configured",
+                "execution_time_ms": 0
+            }
+        
+        if not settings.llm_coalesce_requests:
+            return await self._complete(messages, max_tokens, temperature, start_time)
+        
+        # Identical concurrent requests to the same deployments with the same keys share
+        # one completion; a caller never gets an answer paid for with someone else's key
+        key = prompt_key(
+            messages,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            deployments=sorted((t.key, t.api_key_hash) for t in self.targets)
+        )
+        result, shared = await llm_single_flight.do(
+            key, lambda: self._complete(messages, max_tokens, temperature, start_time)
+        )
+        if shared:
+            # Only the request that made the call is billed for it
+            result = {
+                **result,
+                "prompt_tokens": 0,
+                "completion_tokens": 0,
+                "tokens_used": 0,
+                "tokens_saved": result.get("tokens_used", 0),
+                "coalesced": True,
+                "execution_time_ms": (time.time() - start_time) * 1000
+            }
+        return result
+    
+    async def _complete(
+        self,
+        messages: List[Dict[str, str]],
+        max_tokens: int,
+        temperature: float,
+        start_time: float
+    ) -> Dict:
+        """Call the chat completions API, failing over between deployments on throttling and server errors"""
+        targets = {t.key: t for t in self.targets}
+        tried = set()
+        error = None
+        error_code = None
+        
+        for attempt in range(settings.azure_openai_max_attempts):
+            key = deployment_pool.acquire(targets, exclude=tried)
+            if key is None and tried:
+                # Every deployment has been tried once; any healthy one may be retried
+                tried.clear()
+                key = deployment_pool.acquire(targets)
+            if key is None:
+                # All breakers are open; wait for the first to cool down if it's soon
+                wait = deployment_pool.next_available_in(targets)
+                if wait is None or wait > settings.azure_openai_backoff_max_seconds:
+                    error = error or "All Azure OpenAI deployments are unavailable"
+                    error_code = "deployments_unavailable"
+                    break
+                await asyncio.sleep(wait)
+                continue
             
-            end_time = time.time()
-            execution_time_ms = (end_time - start_time) * 1000
+            target = targets[key]
+            call_start = time.perf_counter_ns()
+            try:
+                with span("azure_openai.chat_completion", deployment=target.deployment, attempt=attempt):
+                    response = await target.client.chat.completions.create(
+                        model=target.deployment,
+                        messages=messages,
+                        max_tokens=max_tokens,
+                        temperature=temperature
+                    )
+            except asyncio.CancelledError:
+                deployment_pool.released(key)
+                raise
+            except Exception as e:
+                LLM_REQUEST_SECONDS.labels(
+                    deployment=target.deployment, outcome="error"
+                ).observe(elapsed_seconds(call_start))
+                retryable, retry_after = _classify_error(e)
+                deployment_pool.failed(key, retryable, retry_after)
+                error = str(e)
+                if not retryable:
+                    logger.error(f"Failed to generate AI response: {e}")
+                    break
+                logger.warning(
+                    f"Azure OpenAI deployment {target.deployment} at {target.endpoint} failed "
+                    f"(attempt {attempt + 1}): {e}"
+                )
+                tried.add(key)
+                error_code = "deployments_unavailable"
+                if attempt + 1 < settings.azure_openai_max_attempts:
+                    await asyncio.sleep(backoff_delay(attempt))
+                continue
+            
+            call_seconds = elapsed_seconds(call_start)
+            LLM_REQUEST_SECONDS.labels(deployment=target.deployment, outcome="success").observe(call_seconds)
+            deployment_pool.succeeded(key, call_seconds * 1000)
+            execution_time_ms = (time.time() - start_time) * 1000
             
             return {
                 "success": True,
                 "response": response.choices[0].message.content,
                 "tokens_used": response.usage.total_tokens,
+                "prompt_tokens": response.usage.prompt_tokens,
+                "completion_tokens": response.usage.completion_tokens,
                 "execution_time_ms": execution_time_ms,
-                "model": response.model
-            }
-        except Exception as e:
-            logger.error(f"Failed to generate AI response: {e}")
-            end_time = time.time()
-            return {
-                "success": False,
-                "error": str(e),
-                "execution_time_ms": (end_time - start_time) * 1000
+                "model": response.model,
+                "deployment": target.deployment
             }
+        
+        result = {
+            "success": False,
+            "error": error,
+            "execution_time_ms": (time.time() - start_time) * 1000
+        }
+        if error_code:
+            result["error_code"] = error_code
+        return result
     
+    @traced()
     async def generate_summary(
         self,
         content: str,
-        max_tokens: int = 500
+        max_tokens: Optional[int] = None,
+        previous_summary: Optional[str] = None,
+        token_budget: Optional[int] = None
     ) -> Dict:
-        """Generate a summary of the given content"""
+        """Generate a summary of the given content, optionally extending a previous summary"""
         messages = [
             {
                 "role": "system",
                 "content": "You are a helpful assistant that creates concise and informative summaries. "
                           "Create a well-structured summary with key points and important details."
-            },
-            {
-                "role": "user",
-                "content": f"Please create a comprehensive summary of the following content:\n\n{content}"
             }
         ]
         
-        return await self.generate_response(messages, max_tokens=max_tokens, temperature=0.5)
+        if previous_summary:
+            messages.append({
+                "role": "user",
+                "content": f"Here is an existing summary of the conversation so far:\n\n{previous_summary}\n\n"
+                          f"Update it to also cover the following new messages:\n\n{content}"
+            })
+        else:
+            messages.append({
+                "role": "user",
+                "content": f"Please create a comprehensive summary of the following content:\n\n{content}"
+            })
+        
+        # Scale the summary length with the input instead of a fixed cap
+        if max_tokens is None:
+            input_tokens = count_tokens(content) + count_tokens(previous_summary or "")
+            max_tokens = max(128, min(settings.summary_max_tokens, input_tokens // 3))
+        
+        return await self.generate_response(
+            messages, max_tokens=max_tokens, temperature=0.5, token_budget=token_budget
+        )
     
+    @traced()
     async def answer_question(
         self,
         question: str,
-        context: Optional[str] = None
+        context: Optional[str] = None,
+        token_budget: Optional[int] = None
     ) -> Dict:
-        """Answer a question, optionally with context"""
+        """Answer a question, optionally with context trimmed to fit the token limits"""
+        system_prompt = (
+            "You are a helpful AI assistant integrated with Slack. "
+            "Provide clear, concise, and accurate responses to user questions."
+        )
+        
+        if context:
+            # Keep the newest context lines that fit alongside the question and a reply
+            room = self.context_window - count_message_tokens([
+                {"content": system_prompt}, {"content": question}
+            ]) - settings.answer_max_tokens
+            context = trim_lines_to_tokens(context, min(settings.answer_context_max_tokens, room))
+        
+        # Context goes in the single system message to avoid an extra message's overhead
+        if context:
+            system_prompt += f"\n\nContext:\n{context}"
+        
         messages = [
             {
                 "role": "system",
-                "content": "You are a helpful AI assistant integrated with Slack. "
-                          "Provide clear, concise, and accurate responses to user questions."
+                "content": system_prompt
+            },
+            {
+                "role": "user",
+                "content": question
             }
         ]
         
-        if context:
-            messages.append({
-                "role": "system",
-                "content": f"Context: {context}"
-            })
-        
-        messages.append({
-            "role": "user",
-            "content": question
-        })
-        
-        return await self.generate_response(messages)
+        return await self.generate_response(
+            messages, max_tokens=settings.answer_max_tokens, token_budget=token_budget
+        )
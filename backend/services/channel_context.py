@@ -0,0 +1,98 @@
+from collections import OrderedDict, deque
+from typing import Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+import logging
+from config import settings
+from metrics import cache_lookup
+
+logger = logging.getLogger(__name__)
+
+# (message ts, speaker, text)
+ContextEntry = Tuple[str, str, str]
+
+
+class ChannelContextCache:
+    """Rolling per-channel buffer of recent messages used as answer context.
+
+    Buffers are filled from incoming Slack events and bot replies, and backfilled
+    from conversations_history at most once per channel, so building context for a
+    message never needs its own Slack API round trip. Each buffer is a bounded
+    deque and the least recently used channels are evicted past max_channels.
+    """
+
+    def __init__(self, max_messages: int = 20, max_channels: int = 1000):
+        self.max_messages = max_messages
+        self.max_channels = max_channels
+        self._buffers: "OrderedDict[str, Deque[ContextEntry]]" = OrderedDict()
+        self._backfilled = set()
+
+    def _buffer(self, channel: str) -> Deque[ContextEntry]:
+        """Get the buffer for a channel, evicting the least recently used one if full"""
+        buffer = self._buffers.get(channel)
+        if buffer is None:
+            buffer = deque(maxlen=self.max_messages)
+            self._buffers[channel] = buffer
+            if len(self._buffers) > self.max_channels:
+                evicted, _ = self._buffers.popitem(last=False)
+                self._backfilled.discard(evicted)
+        else:
+            self._buffers.move_to_end(channel)
+        return buffer
+
+    def record(self, channel: str, ts: str, speaker: str, text: str) -> None:
+        """Append a message to a channel's buffer, ignoring Slack event retries"""
+        if not text or not ts:
+            return
+        buffer = self._buffer(channel)
+        if any(entry[0] == ts and entry[1] == speaker for entry in buffer):
+            return
+        buffer.append((ts, speaker, text))
+
+    def _merge_history(self, channel: str, history: List[Dict]) -> None:
+        """Merge conversations_history messages (newest first) into the buffer"""
+        buffer = self._buffer(channel)
+        entries = {(entry[0], entry[1]): entry for entry in buffer}
+        for message in history:
+            ts = message.get("ts")
+            text = message.get("text")
+            if not ts or not text:
+                continue
+            speaker = "assistant" if message.get("bot_id") else f"<@{message.get('user')}>"
+            entries.setdefault((ts, speaker), (ts, speaker, text))
+
+        merged = sorted(entries.values(), key=lambda entry: float(entry[0]))
+        buffer.clear()
+        buffer.extend(merged[-self.max_messages:])
+
+    async def get_context(
+        self,
+        channel: str,
+        exclude_ts: Optional[str] = None,
+        fetch_history: Optional[Callable[[str, int], Awaitable[List[Dict]]]] = None
+    ) -> List[str]:
+        """Get recent channel messages as context lines, backfilling once if needed"""
+        if fetch_history:
+            cache_lookup("channel_context", channel in self._backfilled)
+        if fetch_history and channel not in self._backfilled:
+            # Mark first so concurrent messages don't trigger duplicate backfills
+            self._backfilled.add(channel)
+            try:
+                history = await fetch_history(channel, self.max_messages)
+                self._merge_history(channel, history)
+            except Exception as e:
+                logger.error(f"Failed to backfill context for channel {channel}: {e}")
+
+        buffer = self._buffers.get(channel)
+        if not buffer:
+            return []
+        return [f"{speaker}: {text}" for ts, speaker, text in buffer if ts != exclude_ts]
+
+    def clear(self) -> None:
+        """Drop all buffered context"""
+        self._buffers.clear()
+        self._backfilled.clear()
+
+
+channel_context = ChannelContextCache(
+    max_messages=settings.slack_context_messages,
+    max_channels=settings.slack_context_channels
+)
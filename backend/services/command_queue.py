@@ -0,0 +1,89 @@
+from typing import Awaitable, Callable, Dict, Optional
+import asyncio
+import logging
+from config import settings
+from metrics import QUEUE_DEPTH
+
+logger = logging.getLogger(__name__)
+
+
+class CommandQueue:
+    """Runs slow Slack command work in the background after the request is acked.
+
+    Jobs from the same user run one at a time in submission order, at most
+    max_concurrency jobs run overall, each job is cancelled after timeout_seconds,
+    and a user can have at most max_pending_per_user jobs queued or running.
+    """
+
+    def __init__(self, max_concurrency: int = 4, max_pending_per_user: int = 3, timeout_seconds: float = 120):
+        self.max_concurrency = max_concurrency
+        self.max_pending_per_user = max_pending_per_user
+        self.timeout_seconds = timeout_seconds
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._user_locks: Dict[str, asyncio.Lock] = {}
+        self._pending: Dict[str, int] = {}
+        self._tasks = set()
+
+    def pending(self, user_key: str) -> int:
+        """Number of jobs queued or running for a user"""
+        return self._pending.get(user_key, 0)
+
+    def submit(
+        self,
+        user_key: str,
+        job: Callable[[], Awaitable[Dict]],
+        on_done: Callable[[Dict], Awaitable[None]]
+    ) -> bool:
+        """Queue a job for a user; returns False if the user's queue is full"""
+        if self.pending(user_key) >= self.max_pending_per_user:
+            return False
+
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._pending[user_key] = self.pending(user_key) + 1
+        QUEUE_DEPTH.labels(queue="slash_commands").inc()
+        lock = self._user_locks.setdefault(user_key, asyncio.Lock())
+
+        task = asyncio.create_task(self._run(user_key, lock, job, on_done))
+        # Keep a reference so the task isn't garbage collected mid-run
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return True
+
+    async def _run(
+        self,
+        user_key: str,
+        lock: asyncio.Lock,
+        job: Callable[[], Awaitable[Dict]],
+        on_done: Callable[[Dict], Awaitable[None]]
+    ) -> None:
+        """Run one job under the user's lock and the global concurrency limit"""
+        try:
+            async with lock:
+                async with self._semaphore:
+                    try:
+                        result = await asyncio.wait_for(job(), timeout=self.timeout_seconds)
+                    except asyncio.TimeoutError:
+                        logger.error(f"Command job for {user_key} timed out after {self.timeout_seconds}s")
+                        result = {"success": False, "error": "Timed out"}
+                    except Exception as e:
+                        logger.error(f"Command job for {user_key} failed: {e}", exc_info=True)
+                        result = {"success": False, "error": str(e)}
+            await on_done(result)
+        except Exception as e:
+            logger.error(f"Failed to deliver command result for {user_key}: {e}", exc_info=True)
+        finally:
+            QUEUE_DEPTH.labels(queue="slash_commands").dec()
+            remaining = self.pending(user_key) - 1
+            if remaining > 0:
+                self._pending[user_key] = remaining
+            else:
+                self._pending.pop(user_key, None)
+                self._user_locks.pop(user_key, None)
+
+
+slash_command_queue = CommandQueue(
+    max_concurrency=settings.slash_command_max_concurrency,
+    max_pending_per_user=settings.slash_command_max_pending_per_user,
+    timeout_seconds=settings.slash_command_timeout_seconds
+)
@@ -0,0 +1,53 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional, Tuple
+from config import settings
+from metrics import cache_lookup
+
+# (app user id, channel id, thread ts or None for the channel window). Per user,
+# since only that user's Slack credentials are known to be able to read the channel
+ConversationKey = Tuple[int, str, Optional[str]]
+
+
+@dataclass
+class CachedSummary:
+    """Summary of a conversation up to and including latest_ts"""
+    latest_ts: str
+    summary: str
+    message_count: int
+
+
+class ConversationSummaryCache:
+    """Bounded LRU of already-summarized Slack conversations keyed by user, channel and thread.
+
+    Repeat summary requests only fetch and send messages newer than latest_ts,
+    folding them into the cached summary.
+    """
+
+    def __init__(self, max_entries: int = 500):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[ConversationKey, CachedSummary]" = OrderedDict()
+
+    def get(self, user_id: int, channel: str, thread_ts: Optional[str] = None) -> Optional[CachedSummary]:
+        """Get a user's cached summary of a conversation"""
+        key = (user_id, channel, thread_ts)
+        entry = self._entries.get(key)
+        cache_lookup("conversation_summaries", entry is not None)
+        if entry is not None:
+            self._entries.move_to_end(key)
+        return entry
+
+    def put(self, user_id: int, channel: str, thread_ts: Optional[str], entry: CachedSummary) -> None:
+        """Store a user's conversation summary, evicting the least recently used one if full"""
+        key = (user_id, channel, thread_ts)
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        """Drop all cached summaries"""
+        self._entries.clear()
+
+
+conversation_summaries = ConversationSummaryCache(max_entries=settings.slack_summary_cache_size)
@@ -0,0 +1,125 @@
+from sqlalchemy import bindparam, update
+from sqlalchemy.orm import Session
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+import asyncio
+import logging
+import random
+from config import settings
+from database import SessionLocal
+from models import Credential
+from services.credential_service import CredentialService
+from services.shared_state import shared_state
+
+logger = logging.getLogger(__name__)
+
+
+class CredentialHealthChecker:
+    """Periodically re-tests every active credential in the background.
+
+    Sweeps run on a jittered interval, so several workers started together don't
+    test in lockstep. At most max_concurrency live tests run at once, and each
+    sweep's results are written in one bulk UPDATE, skipping credentials saved
+    again since they were read. AgentService reads the stored status to skip
+    services that keep failing. With several workers, only the one
+    that claims the interval in the shared state sweeps.
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Session] = SessionLocal,
+        interval_seconds: float = 900,
+        jitter: float = 0.2,
+        max_concurrency: int = 4
+    ):
+        self.session_factory = session_factory
+        self.interval_seconds = interval_seconds
+        self.jitter = jitter
+        self.max_concurrency = max_concurrency
+        self._task: Optional[asyncio.Task] = None
+
+    def _next_delay(self) -> float:
+        return self.interval_seconds * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    async def start(self) -> None:
+        """Start sweeping in the background; disabled when the interval is 0"""
+        if self.interval_seconds <= 0:
+            return
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self) -> None:
+        # Start at a random point in the first interval rather than at boot
+        await asyncio.sleep(random.uniform(0, self.interval_seconds))
+        while True:
+            try:
+                # One worker sweeps per interval; the others find the claim taken
+                if shared_state.add("credential_health:sweep", True, self.interval_seconds * (1 - self.jitter)):
+                    await self.sweep()
+            except Exception as e:
+                logger.error(f"Credential health sweep failed: {e}", exc_info=True)
+            await asyncio.sleep(self._next_delay())
+
+    async def sweep(self) -> Dict[str, int]:
+        """Test all active credentials and store the results, returning a count per status"""
+        # Don't hold a session open across the live tests
+        db = self.session_factory()
+        try:
+            credentials = db.query(Credential).filter(Credential.is_active == True).all()
+        finally:
+            db.close()
+
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def check(credential: Credential) -> Dict:
+            async with semaphore:
+                result = await CredentialService._run_test(credential, use_cache=False)
+            return {
+                "credential_id": credential.id,
+                "tested": credential.encrypted_credentials,
+                "status": result["status"],
+                "message": result["message"],
+                "failures": 0 if result["status"] == "success" else (credential.test_failures or 0) + 1,
+                "tested_at": datetime.utcnow()
+            }
+
+        rows: List[Dict] = await asyncio.gather(*(check(c) for c in credentials))
+        if rows:
+            db = self.session_factory()
+            try:
+                # One executemany UPDATE; a credential re-saved during the sweep no longer
+                # matches the value tested, so its fresh status isn't overwritten
+                db.execute(
+                    update(Credential.__table__)
+                    .where(
+                        Credential.id == bindparam("credential_id"),
+                        Credential.encrypted_credentials == bindparam("tested")
+                    )
+                    .values(
+                        test_status=bindparam("status"),
+                        test_message=bindparam("message"),
+                        test_failures=bindparam("failures"),
+                        last_tested_at=bindparam("tested_at")
+                    ),
+                    rows
+                )
+                db.commit()
+            finally:
+                db.close()
+
+        counts: Dict[str, int] = {}
+        for row in rows:
+            counts[row["status"]] = counts.get(row["status"], 0) + 1
+        logger.info(f"Credential health sweep: {counts or 'no credentials'}")
+        return counts
+
+
+credential_health = CredentialHealthChecker(
+    interval_seconds=settings.credential_health_interval_seconds,
+    max_concurrency=settings.credential_health_max_concurrency
+)
@@ -1,12 +1,22 @@
+from sqlalchemy import select, update
 from sqlalchemy.orm import Session
+from cryptography.fernet import InvalidToken
 from datetime import datetime
-from typing import Dict, Optional
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple
 from models import Credential, User
-from security import encrypt_credentials, decrypt_credentials
+from config import settings
+from database import SessionLocal
+from security import CredentialCipher, credential_cipher, encrypt_credentials, decrypt_credentials, slack_keyring
 from services.slack_service import SlackService
 from services.azure_ai_service import AzureAIService
 from services.google_service import GoogleWorkspaceService
+import asyncio
+import hashlib
 import logging
+import time
+from metrics import cache_lookup
+from services.shared_state import shared_state
+from tracing import traced
 
 logger = logging.getLogger(__name__)
 
@@ -15,6 +25,7 @@ class CredentialService:
     """Service for managing and testing credentials"""
     
     @staticmethod
+    @traced()
     async def create_or_update_credential(
         db: Session,
         user_id: int,
@@ -36,9 +47,10 @@ class CredentialService:
             existing_cred.is_active = True
             existing_cred.updated_at = datetime.utcnow()
             existing_cred.test_status = "pending"
+            existing_cred.test_failures = 0
             db.commit()
             db.refresh(existing_cred)
-            return existing_cred
+            credential = existing_cred
         else:
             # Create new credential
             new_cred = Credential(
@@ -51,9 +63,16 @@ class CredentialService:
             db.add(new_cred)
             db.commit()
             db.refresh(new_cred)
-            return new_cred
+            credential = new_cred
+        
+        # Signing secrets may have changed
+        if service_type == "slack":
+            slack_keyring.invalidate()
+        
+        return credential
     
     @staticmethod
+    @traced()
     async def get_credential(
         db: Session,
         user_id: int,
@@ -72,6 +91,163 @@ class CredentialService:
         return decrypt_credentials(credential.encrypted_credentials)
     
     @staticmethod
+    @traced()
+    async def get_credentials(
+        db: Session,
+        user_id: int,
+        service_types: List[str]
+    ) -> Dict[str, Dict]:
+        """Get decrypted credentials for several services with a single query"""
+        credentials = db.query(Credential).filter(
+            Credential.user_id == user_id,
+            Credential.service_type.in_(service_types),
+            Credential.is_active == True
+        ).all()
+        
+        return {
+            credential.service_type: decrypt_credentials(credential.encrypted_credentials)
+            for credential in credentials
+        }
+    
+    @staticmethod
+    @traced()
+    async def get_healthy_credentials(
+        db: Session,
+        user_id: int,
+        service_types: List[str]
+    ) -> Tuple[Dict[str, Dict], Dict[str, str]]:
+        """Get decrypted credentials, leaving out ones that failed their last few tests.
+        
+        A service is skipped once it has failed credential_unhealthy_after_failures
+        tests in a row, so one transient failure doesn't block it until the next
+        sweep. Returns (credentials, unhealthy) where unhealthy maps each skipped
+        service to its last test message.
+        """
+        credentials = db.query(Credential).filter(
+            Credential.user_id == user_id,
+            Credential.service_type.in_(service_types),
+            Credential.is_active == True
+        ).all()
+        
+        healthy = {}
+        unhealthy = {}
+        for credential in credentials:
+            if credential.test_status == "failed" and (credential.test_failures or 0) >= settings.credential_unhealthy_after_failures:
+                unhealthy[credential.service_type] = credential.test_message or "Connection test failed"
+            else:
+                healthy[credential.service_type] = decrypt_credentials(credential.encrypted_credentials)
+        return healthy, unhealthy
+    
+    @staticmethod
+    async def _live_test(service_type: str, creds: Dict) -> Dict:
+        """Connect to the service with decrypted credentials"""
+        result = None
+        
+        if service_type == "slack":
+            slack_service = SlackService(
+                bot_token=creds.get("bot_token"),
+                signing_secret=creds.get("signing_secret")
+            )
+            result = await slack_service.test_connection()
+        
+        elif service_type == "azure_openai":
+            azure_service = AzureAIService.from_credentials(creds)
+            result = await azure_service.test_connection()
+        
+        elif service_type == "google_workspace":
+            google_service = GoogleWorkspaceService(creds)
+            result = await google_service.test_connection()
+        
+        elif service_type == "google_oauth":
+            # Validate Google OAuth credentials format
+            client_id = creds.get("client_id", "")
+            client_secret = creds.get("client_secret", "")
+            redirect_uri = creds.get("redirect_uri", "")
+            
+            if not client_id or not client_secret:
+                result = {
+                    "status": "failed",
+                    "message": "Client ID and Client Secret are required"
+                }
+            elif not client_id.endswith(".apps.googleusercontent.com"):
+                result = {
+                    "status": "failed",
+                    "message": "Invalid Client ID format. Should end with .apps.googleusercontent.com"
+                }
+            elif not client_secret.startswith("GOCSPX-"):
+                result = {
+                    "status": "failed",
+                    "message": "Invalid Client Secret format. Should start with GOCSPX-"
+                }
+            else:
+                result = {
+                    "status": "success",
+                    "message": "Google OAuth credentials saved. Click 'Connect Google Workspace' to authorize.",
+                    "details": {
+                        "client_id": client_id,
+                        "redirect_uri": redirect_uri
+                    }
+                }
+        
+        else:
+            result = {
+                "status": "failed",
+                "message": f"Unknown service type: {service_type}"
+            }
+        
+        return result
+    
+    @staticmethod
+    @traced()
+    async def _run_test(
+        credential: Credential,
+        timeout: Optional[float] = None,
+        use_cache: bool = True
+    ) -> Dict:
+        """Test a credential, reusing a recent success and giving up after the timeout"""
+        timeout = timeout or settings.credential_test_timeout_seconds
+        cached = credential_test_cache.get(credential) if use_cache else None
+        if cached is not None:
+            return {**cached, "cached": True}
+        
+        try:
+            creds = decrypt_credentials(credential.encrypted_credentials)
+            result = await asyncio.wait_for(
+                CredentialService._live_test(credential.service_type, creds),
+                timeout=timeout
+            )
+        except asyncio.TimeoutError:
+            logger.error(f"Testing {credential.service_type} credential timed out after {timeout}s")
+            result = {
+                "status": "error",
+                "message": f"Connection test timed out after {timeout:g}s"
+            }
+        except Exception as e:
+            logger.error(f"Error testing credential: {e}")
+            result = {
+                "status": "error",
+                "message": str(e)
+            }
+        
+        if result["status"] == "success":
+            credential_test_cache.put(credential, result)
+        else:
+            credential_test_cache.discard(credential)
+        return {**result, "cached": False}
+    
+    @staticmethod
+    def _save_test_result(db: Session, credential: Credential, result: Dict) -> None:
+        """Record the outcome of a live test on the credential"""
+        if result.get("cached"):
+            return
+        credential.last_tested_at = datetime.utcnow()
+        credential.test_status = result["status"]
+        credential.test_message = result["message"]
+        credential.test_failures = 0 if result["status"] == "success" else (credential.test_failures or 0) + 1
+        db.commit()
+    
+    @staticmethod
+    @traced()
     async def test_credential(
         db: Session,
         user_id: int,
@@ -90,88 +266,34 @@ class CredentialService:
                 "message": "Credential not found"
             }
         
+        result = await CredentialService._run_test(credential)
+        CredentialService._save_test_result(db, credential, result)
+        return result
+    
+    @staticmethod
+    async def test_all_credentials(db: Session, user_id: int) -> AsyncIterator[Dict]:
+        """Test all of a user's active credentials concurrently, yielding each result as it completes"""
+        credentials = db.query(Credential).filter(
+            Credential.user_id == user_id,
+            Credential.is_active == True
+        ).all()
+        
+        async def run(credential: Credential):
+            return credential, await CredentialService._run_test(credential)
+        
+        tasks = [asyncio.create_task(run(credential)) for credential in credentials]
         try:
-            creds = decrypt_credentials(credential.encrypted_credentials)
-            result = None
-            
-            if service_type == "slack":
-                slack_service = SlackService(
-                    bot_token=creds.get("bot_token"),
-                    signing_secret=creds.get("signing_secret")
-                )
-                result = await slack_service.test_connection()
-            
-            elif service_type == "azure_openai":
-                azure_service = AzureAIService(
-                    endpoint=creds.get("endpoint"),
-                    api_key=creds.get("api_key"),
-                    deployment=creds.get("deployment"),
-                    api_version=creds.get("api_version", "2023-05-15")
-                )
-                result = await azure_service.test_connection()
-            
-            elif service_type == "google_workspace":
-                google_service = GoogleWorkspaceService(creds)
-                result = await google_service.test_connection()
-            
-            elif service_type == "google_oauth":
-                # Validate Google OAuth credentials format
-                client_id = creds.get("client_id", "")
-                client_secret = creds.get("client_secret", "")
-                redirect_uri = creds.get("redirect_uri", "")
-                
-                if not client_id or not client_secret:
-                    result = {
-                        "status": "failed",
-                        "message": "Client ID and Client Secret are required"
-                    }
-                elif not client_id.endswith(".apps.googleusercontent.com"):
-                    result = {
-                        "status": "failed",
-                        "message": "Invalid Client ID format. Should end with .apps.googleusercontent.com"
-                    }
-                elif not client_secret.startswith("GOCSPX-"):
-                    result = {
-                        "status": "failed",
-                        "message": "Invalid Client Secret format. Should start with GOCSPX-"
-                    }
-                else:
-                    result = {
-                        "status": "success",
-                        "message": "Google OAuth credentials saved. Click 'Connect Google Workspace' to authorize.",
-                        "details": {
-                            "client_id": client_id,
-                            "redirect_uri": redirect_uri
-                        }
-                    }
-            
-            else:
-                result = {
-                    "status": "failed",
-                    "message": f"Unknown service type: {service_type}"
-                }
-            
-            # Update credential test results
-            credential.last_tested_at = datetime.utcnow()
-            credential.test_status = result["status"]
-            credential.test_message = result["message"]
-            db.commit()
-            
-            return result
-            
-        except Exception as e:
-            logger.error(f"Error testing credential: {e}")
-            credential.last_tested_at = datetime.utcnow()
-            credential.test_status = "error"
-            credential.test_message = str(e)
-            db.commit()
-            
-            return {
-                "status": "error",
-                "message": str(e)
-            }
+            for next_done in asyncio.as_completed(tasks):
+                credential, result = await next_done
+                CredentialService._save_test_result(db, credential, result)
+                yield {"service_type": credential.service_type, **result}
+        finally:
+            # The client went away; don't leave live tests running
+            for task in tasks:
+                task.cancel()
     
     @staticmethod
+    @traced()
     async def get_all_credentials(db: Session, user_id: int) -> list:
         """Get all credentials for a user (without decrypting)"""
         return db.query(Credential).filter(
@@ -179,6 +301,7 @@ class CredentialService:
         ).all()
     
     @staticmethod
+    @traced()
     async def delete_credential(db: Session, user_id: int, service_type: str) -> bool:
         """Delete a credential"""
         credential = db.query(Credential).filter(
@@ -189,5 +312,109 @@ class CredentialService:
         if credential:
             db.delete(credential)
             db.commit()
+            if service_type == "slack":
+                slack_keyring.invalidate()
             return True
         return False
+
+
+def rotate_encryption_keys(
+    batch_size: int = 500,
+    pause_seconds: float = 0.0,
+    cipher: CredentialCipher = credential_cipher,
+    session_factory: Callable[[], Session] = SessionLocal,
+    progress: Optional[Callable[[Dict[str, int]], None]] = None
+) -> Dict[str, int]:
+    """Rewrap every stored credential under the keyring's primary key.
+    
+    Walks the table by id in batches of batch_size, each read and written in its
+    own short transaction, so memory stays bounded and the app keeps serving:
+    readers can use any key in the ring meanwhile. A row saved by the app since
+    it was read is left alone, as it's already under the primary key. Safe to
+    stop and rerun; rows already rotated are skipped.
+    """
+    stats = {"scanned": 0, "rotated": 0, "current": 0, "changed": 0, "failed": 0}
+    last_id = 0
+    while True:
+        db = session_factory()
+        try:
+            rows = db.execute(
+                select(Credential.id, Credential.encrypted_credentials)
+                .where(Credential.id > last_id)
+                .order_by(Credential.id)
+                .limit(batch_size)
+            ).all()
+            if not rows:
+                break
+            
+            for credential_id, token in rows:
+                try:
+                    rotated = cipher.rotate(token)
+                except InvalidToken:
+                    logger.error(f"Credential {credential_id} can't be decrypted with any configured key")
+                    stats["failed"] += 1
+                    continue
+                if rotated is None:
+                    stats["current"] += 1
+                    continue
+                result = db.execute(
+                    update(Credential)
+                    .where(Credential.id == credential_id, Credential.encrypted_credentials == token)
+                    .values(encrypted_credentials=rotated)
+                )
+                stats["rotated" if result.rowcount else "changed"] += 1
+            db.commit()
+        finally:
+            db.close()
+        
+        stats["scanned"] += len(rows)
+        last_id = rows[-1][0]
+        if progress is not None:
+            progress(dict(stats))
+        if pause_seconds:
+            time.sleep(pause_seconds)
+    
+    logger.info(f"Credential key rotation finished: {stats}")
+    return stats
+
+
+class CredentialTestCache:
+    """Successful credential test results, reused for ttl_seconds by every worker.
+    
+    Entries live in the shared state keyed by credential id and carry a hash of
+    the ciphertext, so saving new credentials makes the old result unreachable
+    while rotating encryption keys doesn't.
+    """
+    
+    def __init__(self, ttl_seconds: float = 300, state=shared_state):
+        self.ttl_seconds = ttl_seconds
+        self.state = state
+    
+    @staticmethod
+    def _fingerprint(credential: Credential) -> str:
+        return hashlib.sha256(CredentialCipher.ciphertext(credential.encrypted_credentials).encode()).hexdigest()
+    
+    @staticmethod
+    def _key(credential: Credential) -> str:
+        return f"credential_test:{credential.id}"
+    
+    def get(self, credential: Credential) -> Optional[Dict]:
+        entry = self.state.get(self._key(credential))
+        hit = entry is not None and entry["fingerprint"] == self._fingerprint(credential)
+        cache_lookup("credential_tests", hit)
+        return entry["result"] if hit else None
+    
+    def put(self, credential: Credential, result: Dict) -> None:
+        if self.ttl_seconds <= 0:
+            return
+        self.state.set(
+            self._key(credential),
+            {"fingerprint": self._fingerprint(credential), "result": result},
+            self.ttl_seconds
+        )
+    
+    def discard(self, credential: Credential) -> None:
+        self.state.delete(self._key(credential))
+
+
+credential_test_cache = CredentialTestCache(ttl_seconds=settings.credential_test_cache_seconds)
@@ -0,0 +1,156 @@
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+import random
+import threading
+import time
+from config import settings
+
+# (endpoint, deployment) identifies a deployment across credentials and requests
+DeploymentKey = Tuple[str, str]
+
+
+@dataclass
+class DeploymentHealth:
+    """Load and circuit breaker state for one Azure OpenAI deployment"""
+    outstanding: int = 0
+    latency_ms: Optional[float] = None  # Exponentially weighted average
+    consecutive_failures: int = 0
+    open_until: float = 0.0  # Breaker is open (skipped) until this monotonic time
+    half_open_trial: bool = False  # A single trial request is in flight after the cooldown
+
+
+class DeploymentPool:
+    """Process-wide health of Azure OpenAI deployments.
+
+    AzureAIService is created per request, so latency, outstanding requests and
+    breaker state are kept here where every request can see them. A deployment's
+    breaker opens after consecutive retryable failures and skips it for a cooldown
+    (or the server's Retry-After); afterwards one trial request decides whether it
+    closes again.
+    """
+
+    def __init__(
+        self,
+        strategy: str = "least_outstanding",
+        breaker_failures: int = 3,
+        breaker_cooldown_seconds: float = 30.0,
+        latency_alpha: float = 0.3
+    ):
+        self.strategy = strategy
+        self.breaker_failures = breaker_failures
+        self.breaker_cooldown_seconds = breaker_cooldown_seconds
+        self.latency_alpha = latency_alpha
+        self._health: Dict[DeploymentKey, DeploymentHealth] = {}
+        self._lock = threading.Lock()
+
+    def _state(self, health: DeploymentHealth, now: float) -> str:
+        if health.open_until > now:
+            return "open"
+        if health.consecutive_failures >= self.breaker_failures:
+            return "half_open"
+        return "closed"
+
+    def _available(self, key: DeploymentKey, now: float) -> bool:
+        health = self._health.setdefault(key, DeploymentHealth())
+        state = self._state(health, now)
+        if state == "half_open":
+            # Only one trial request at a time
+            return not health.half_open_trial
+        return state == "closed"
+
+    def _score(self, health: DeploymentHealth) -> Tuple[float, float]:
+        # Deployments without a latency sample yet are tried first
+        latency = health.latency_ms if health.latency_ms is not None else 0.0
+        if self.strategy == "latency":
+            return latency * (health.outstanding + 1), health.outstanding
+        return health.outstanding, latency
+
+    def acquire(self, keys: Iterable[DeploymentKey], exclude: Iterable[DeploymentKey] = ()) -> Optional[DeploymentKey]:
+        """Pick the best available deployment and count a request against it"""
+        now = time.monotonic()
+        excluded = set(exclude)
+        with self._lock:
+            candidates = [k for k in keys if k not in excluded and self._available(k, now)]
+            if not candidates:
+                return None
+            random.shuffle(candidates)  # Break ties randomly
+            key = min(candidates, key=lambda k: self._score(self._health[k]))
+            health = self._health[key]
+            if health.consecutive_failures >= self.breaker_failures:
+                health.half_open_trial = True
+            health.outstanding += 1
+            return key
+
+    def next_available_in(self, keys: Iterable[DeploymentKey]) -> Optional[float]:
+        """Seconds until the first open breaker among keys cools down, or None"""
+        now = time.monotonic()
+        with self._lock:
+            waits = [
+                self._health[k].open_until - now for k in keys
+                if k in self._health and self._health[k].open_until > now
+            ]
+        return min(waits) if waits else None
+
+    def succeeded(self, key: DeploymentKey, latency_ms: float) -> None:
+        """Record a successful request and close the breaker"""
+        with self._lock:
+            health = self._health[key]
+            health.outstanding = max(0, health.outstanding - 1)
+            health.latency_ms = latency_ms if health.latency_ms is None else (
+                self.latency_alpha * latency_ms + (1 - self.latency_alpha) * health.latency_ms
+            )
+            health.consecutive_failures = 0
+            health.open_until = 0.0
+            health.half_open_trial = False
+
+    def failed(self, key: DeploymentKey, retryable: bool, retry_after: Optional[float] = None) -> None:
+        """Record a failed request, opening the breaker on repeated throttling or server errors"""
+        with self._lock:
+            health = self._health[key]
+            health.outstanding = max(0, health.outstanding - 1)
+            health.half_open_trial = False
+            if not retryable:
+                return
+            health.consecutive_failures += 1
+            # Honour Retry-After even before the breaker trips
+            cooldown = retry_after or 0
+            if health.consecutive_failures >= self.breaker_failures:
+                cooldown = max(cooldown, self.breaker_cooldown_seconds)
+            if cooldown:
+                health.open_until = time.monotonic() + cooldown
+
+    def released(self, key: DeploymentKey) -> None:
+        """Release a request that ended without a result (e.g. cancelled)"""
+        with self._lock:
+            health = self._health[key]
+            health.outstanding = max(0, health.outstanding - 1)
+            health.half_open_trial = False
+
+    def snapshot(self) -> List[Dict]:
+        """Current state of every known deployment"""
+        now = time.monotonic()
+        with self._lock:
+            return [
+                {
+                    "endpoint": endpoint,
+                    "deployment": deployment,
+                    "state": self._state(health, now),
+                    "outstanding": health.outstanding,
+                    "latency_ms": health.latency_ms,
+                    "consecutive_failures": health.consecutive_failures
+                }
+                for (endpoint, deployment), health in self._health.items()
+            ]
+
+
+def backoff_delay(attempt: int) -> float:
+    """Full-jitter exponential backoff before retry number attempt (0-based)"""
+    cap = min(settings.azure_openai_backoff_max_seconds, settings.azure_openai_backoff_seconds * 2 ** attempt)
+    return random.uniform(0, cap)
+
+
+deployment_pool = DeploymentPool(
+    strategy=settings.azure_openai_balancing,
+    breaker_failures=settings.azure_openai_breaker_failures,
+    breaker_cooldown_seconds=settings.azure_openai_breaker_cooldown_seconds
+)
@@ -1,17 +1,27 @@
-from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build
-from googleapiclient.errors import HttpError
-from googleapiclient.http import MediaInMemoryUpload
 from typing import Dict, Optional
+import asyncio
 import logging
 import io
+from config import settings
+from metrics import EXTERNAL_API_SECONDS, timed
+from tracing import span, traced
 
 logger = logging.getLogger(__name__)
 
 
+def _execute(request):
+    """Execute a Google API request, recording its latency by API method"""
+    method = getattr(request, "methodId", "unknown")
+    with span(f"google.{method}"), timed(EXTERNAL_API_SECONDS, service="google", method=method):
+        return request.execute()
+
+
 class GoogleWorkspaceService:
     def __init__(self, credentials_dict: Dict):
         """Initialize Google Workspace service with OAuth credentials"""
+        # The Google client libraries are slow to import, so they load with the first service
+        from google.oauth2.credentials import Credentials
+
         self.credentials = Credentials(
             token=credentials_dict.get("token"),
             refresh_token=credentials_dict.get("refresh_token"),
@@ -24,12 +34,27 @@ class GoogleWorkspaceService:
             ])
         )
     
+    def _build(self, api: str, version: str):
+        """Build an API client, honouring any endpoint override in settings.google_api_endpoints"""
+        from googleapiclient.discovery import build
+
+        endpoint = settings.google_api_endpoints.get(api)
+        client_options = {"api_endpoint": endpoint} if endpoint else None
+        return build(api, version, credentials=self.credentials, client_options=client_options)
+    
+    @traced()
     async def test_connection(self) -> Dict[str, any]:
         """Test Google Drive connection"""
+        return await asyncio.to_thread(self._test_connection)
+    
+    def _test_connection(self) -> Dict[str, any]:
+        """Test Google Drive connection (blocking)"""
+        from googleapiclient.errors import HttpError
+
         try:
-            service = build('drive', 'v3', credentials=self.credentials)
+            service = self._build('drive', 'v3')
             # Try to get user info
-            about = service.about().get(fields="user").execute()
+            about = _execute(service.about().get(fields="user"))
             
             return {
                 "status": "success",
@@ -54,15 +79,23 @@ class GoogleWorkspaceService:
                 "details": None
             }
     
+    @traced()
     async def create_google_doc(self, title: str, content: str) -> Dict:
         """Create a Google Doc with the given content"""
+        # The Google client is blocking, so keep it off the event loop
+        return await asyncio.to_thread(self._create_google_doc, title, content)
+    
+    def _create_google_doc(self, title: str, content: str) -> Dict:
+        """Create a Google Doc (blocking)"""
+        from googleapiclient.errors import HttpError
+
         try:
             # Create the document using Google Docs API
-            docs_service = build('docs', 'v1', credentials=self.credentials)
-            drive_service = build('drive', 'v3', credentials=self.credentials)
+            docs_service = self._build('docs', 'v1')
+            drive_service = self._build('drive', 'v3')
             
             # Create a new document
-            doc = docs_service.documents().create(body={'title': title}).execute()
+            doc = _execute(docs_service.documents().create(body={'title': title}))
             doc_id = doc['documentId']
             
             # Insert content into the document
@@ -75,16 +108,16 @@ class GoogleWorkspaceService:
                 }
             }]
             
-            docs_service.documents().batchUpdate(
+            _execute(docs_service.documents().batchUpdate(
                 documentId=doc_id,
                 body={'requests': requests}
-            ).execute()
+            ))
             
             # Get the web view link
-            file = drive_service.files().get(
+            file = _execute(drive_service.files().get(
                 fileId=doc_id,
                 fields='webViewLink'
-            ).execute()
+            ))
             
             return {
                 "success": True,
@@ -106,6 +139,7 @@ class GoogleWorkspaceService:
                 "error": str(e)
             }
     
+    @traced()
     async def upload_file_to_drive(
         self,
         filename: str,
@@ -114,8 +148,11 @@ class GoogleWorkspaceService:
         folder_id: Optional[str] = None
     ) -> Dict:
         """Upload a file to Google Drive"""
+        from googleapiclient.errors import HttpError
+        from googleapiclient.http import MediaInMemoryUpload
+
         try:
-            service = build('drive', 'v3', credentials=self.credentials)
+            service = self._build('drive', 'v3')
             
             file_metadata = {'name': filename}
             if folder_id:
@@ -127,11 +164,11 @@ class GoogleWorkspaceService:
                 resumable=True
             )
             
-            file = service.files().create(
+            file = _execute(service.files().create(
                 body=file_metadata,
                 media_body=media,
                 fields='id,webViewLink'
-            ).execute()
+            ))
             
             return {
                 "success": True,
@@ -146,15 +183,18 @@ class GoogleWorkspaceService:
                 "error": str(e)
             }
     
+    @traced()
     async def list_files(self, page_size: int = 10) -> Dict:
         """List files in Google Drive"""
+        from googleapiclient.errors import HttpError
+
         try:
-            service = build('drive', 'v3', credentials=self.credentials)
+            service = self._build('drive', 'v3')
             
-            results = service.files().list(
+            results = _execute(service.files().list(
                 pageSize=page_size,
                 fields="files(id, name, mimeType, createdTime, webViewLink)"
-            ).execute()
+            ))
             
             files = results.get('files', [])
             
@@ -0,0 +1,84 @@
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Pattern
+import re
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class IntentMatch:
+    """Result of routing a message to an intent"""
+    intent: str
+    handler: Callable
+    keyword: Optional[str]
+    remainder: str  # Text after the matched keyword, e.g. the content to summarize
+
+
+class IntentRouter:
+    """Routes mention text and slash commands to handlers in a single pass.
+
+    Keywords for all intents are compiled into one alternation with a named group
+    per intent, so routing is one regex search however many intents exist. Slash
+    commands are an exact dict lookup.
+    """
+
+    def __init__(self, default: Optional[Callable] = None):
+        self.default = default
+        self._keywords: Dict[str, List[str]] = {}
+        self._handlers: Dict[str, Callable] = {}
+        self._commands: Dict[str, Callable] = {}
+        self._pattern: Optional[Pattern] = None
+
+    def register(self, name: str, keywords: List[str], handler: Callable) -> None:
+        """Register an intent triggered by any of the given keywords"""
+        if not name.isidentifier():
+            raise ValueError(f"Intent name must be an identifier: {name}")
+        self._keywords[name] = keywords
+        self._handlers[name] = handler
+        self._compile()
+
+    def intent(self, name: str, keywords: List[str]) -> Callable:
+        """Decorator form of register()"""
+        def decorator(handler: Callable) -> Callable:
+            self.register(name, keywords, handler)
+            return handler
+        return decorator
+
+    def command(self, name: str) -> Callable:
+        """Decorator registering a slash command handler"""
+        def decorator(handler: Callable) -> Callable:
+            self._commands[name] = handler
+            return handler
+        return decorator
+
+    def _compile(self) -> None:
+        """Rebuild the combined keyword pattern"""
+        groups = []
+        for name, keywords in self._keywords.items():
+            # Longest first so e.g. "summary" wins over "sum" at the same position
+            alternatives = "|".join(re.escape(k) for k in sorted(keywords, key=len, reverse=True))
+            groups.append(f"(?P<{name}>{alternatives})")
+        self._pattern = re.compile(r"\b(?:" + "|".join(groups) + ")", re.IGNORECASE) if groups else None
+
+    def route(self, text: str) -> Optional[IntentMatch]:
+        """Find the first intent keyword in the text, falling back to the default handler"""
+        match = self._pattern.search(text) if self._pattern else None
+        if match:
+            remainder = text[match.end():].strip()
+            if remainder.startswith(":"):
+                remainder = remainder[1:].strip()
+            return IntentMatch(
+                intent=match.lastgroup,
+                handler=self._handlers[match.lastgroup],
+                keyword=match.group(match.lastgroup),
+                remainder=remainder
+            )
+
+        if self.default:
+            return IntentMatch(intent="default", handler=self.default, keyword=None, remainder=text)
+        return None
+
+    def route_command(self, command: str) -> Optional[Callable]:
+        """Get the handler for a slash command"""
+        return self._commands.get(command)
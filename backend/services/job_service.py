@@ -0,0 +1,287 @@
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+import asyncio
+import logging
+import random
+from config import settings
+from database import SessionLocal
+from metrics import JOBS_QUEUED
+from models import Job
+from services.agent_service import AgentService
+from services.token_budget import token_ledger
+from services.usage_service import usage_from_response
+
+logger = logging.getLogger(__name__)
+
+TERMINAL_STATUSES = ("succeeded", "failed")
+
+
+class JobEngine:
+    """Persistent background job queue backed by the jobs table.
+
+    Each job records its next stage and partial result after every step, so a job
+    interrupted by a restart resumes where it left off instead of paying for the
+    LLM call again. Workers claim jobs with a conditional UPDATE, which keeps claims
+    exclusive even with several processes sharing the database. Only the Google
+    Drive step is retried, with jittered exponential backoff.
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Session] = SessionLocal,
+        workers: int = 2,
+        poll_interval: float = 2.0,
+        drive_max_attempts: int = 5,
+        drive_backoff_seconds: float = 2.0,
+        drive_backoff_max_seconds: float = 300.0
+    ):
+        self.session_factory = session_factory
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.drive_max_attempts = drive_max_attempts
+        self.drive_backoff_seconds = drive_backoff_seconds
+        self.drive_backoff_max_seconds = drive_backoff_max_seconds
+        self._wakeup: Optional[asyncio.Event] = None
+        self._worker_tasks: List[asyncio.Task] = []
+        self._listeners: Dict[int, List[asyncio.Event]] = {}
+
+    def submit_summary(
+        self,
+        db: Session,
+        user_id: int,
+        title: str,
+        content: str,
+        save_to_drive: bool = True
+    ) -> Job:
+        """Queue a summary job"""
+        job = Job(
+            user_id=user_id,
+            job_type="summary",
+            status="queued",
+            stage="summarize",
+            payload={"title": title, "content": content, "save_to_drive": save_to_drive}
+        )
+        db.add(job)
+        db.commit()
+        db.refresh(job)
+        JOBS_QUEUED.inc()
+        self._notify(job.id)
+        return job
+
+    async def start(self) -> None:
+        """Start the worker pool; recover() must already have run once for the deployment"""
+        self._wakeup = asyncio.Event()
+        self._worker_tasks = [
+            asyncio.create_task(self._worker(n)) for n in range(self.workers)
+        ]
+
+    async def stop(self) -> None:
+        """Stop the worker pool; running jobs are resumed on next start"""
+        for task in self._worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        self._worker_tasks = []
+
+    def recover(self) -> int:
+        """Put jobs left 'running' by a crash back in the queue at their current stage.
+        
+        Only safe while no worker is running jobs, so it runs once before they start.
+        """
+        db = self.session_factory()
+        try:
+            count = db.query(Job).filter(Job.status == "running").update(
+                {Job.status: "queued"}, synchronize_session=False
+            )
+            db.commit()
+            # Starting point for the gauge, which is moved as jobs are queued and claimed
+            JOBS_QUEUED.inc(db.query(Job).filter(Job.status == "queued").count())
+            return count
+        finally:
+            db.close()
+
+    def claim_next(self) -> Optional[int]:
+        """Atomically claim the oldest due job, returning its id"""
+        db = self.session_factory()
+        try:
+            now = datetime.utcnow()
+            candidates = db.query(Job.id).filter(
+                Job.status == "queued",
+                or_(Job.next_attempt_at == None, Job.next_attempt_at <= now)
+            ).order_by(Job.id).limit(self.workers + 1).all()
+
+            for (job_id,) in candidates:
+                claimed = db.query(Job).filter(Job.id == job_id, Job.status == "queued").update(
+                    {Job.status: "running", Job.updated_at: now}, synchronize_session=False
+                )
+                db.commit()
+                if claimed:
+                    JOBS_QUEUED.dec()
+                    return job_id
+            return None
+        finally:
+            db.close()
+
+    async def _worker(self, n: int) -> None:
+        """Claim and run jobs until cancelled"""
+        while True:
+            try:
+                job_id = self.claim_next()
+            except Exception as e:
+                logger.error(f"Job worker {n} failed to claim a job: {e}", exc_info=True)
+                job_id = None
+
+            if job_id is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            try:
+                await self.run_job(job_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Job {job_id} crashed: {e}", exc_info=True)
+                self._fail(job_id, str(e))
+
+    def _drive_backoff(self, attempts: int) -> float:
+        """Jittered exponential backoff before the next Drive attempt"""
+        delay = min(self.drive_backoff_max_seconds, self.drive_backoff_seconds * 2 ** (attempts - 1))
+        return delay * random.uniform(0.5, 1.0)
+
+    async def run_job(self, job_id: int) -> None:
+        """Run a claimed job's remaining stages, persisting progress after each one"""
+        db = self.session_factory()
+        try:
+            job = db.query(Job).filter(Job.id == job_id).first()
+            if job is None:
+                return
+
+            payload = job.payload
+            agent = AgentService(db, job.user_id)
+            services = await agent._get_services()
+
+            if job.stage == "summarize":
+                if 'azure_ai' not in services:
+                    self._finish(db, job, "failed", error=agent._unavailable("azure_openai", "Azure AI")["error"])
+                    return
+
+                summary_response = await services['azure_ai'].generate_summary(
+                    payload["content"],
+                    token_budget=token_ledger.remaining(db, job.user_id)
+                )
+                if not summary_response.get("success"):
+                    self._finish(db, job, "failed", error=summary_response.get("error"))
+                    return
+
+                job.result = {
+                    "summary": summary_response.get("response"),
+                    **usage_from_response(summary_response)
+                }
+                job.stage = "drive" if payload.get("save_to_drive") and 'google' in services else "record"
+                db.commit()
+                self._notify(job.id)
+
+            if job.stage == "drive":
+                result = dict(job.result)
+                job.attempts = (job.attempts or 0) + 1
+                doc_result = await agent._save_to_drive(services, payload["title"], result["summary"]) \
+                    if 'google' in services else {"success": False, "error": "Google Workspace not configured"}
+
+                if doc_result.get("success"):
+                    result["google_drive_file_id"] = doc_result.get("file_id")
+                    result["google_drive_file_url"] = doc_result.get("file_url")
+                    job.error = None
+                elif job.attempts < self.drive_max_attempts:
+                    # Retry later without redoing the summary
+                    delay = self._drive_backoff(job.attempts)
+                    job.status = "queued"
+                    job.error = doc_result.get("error")
+                    job.next_attempt_at = datetime.utcnow() + timedelta(seconds=delay)
+                    db.commit()
+                    JOBS_QUEUED.inc()
+                    self._notify(job.id)
+                    logger.warning(f"Job {job.id} Drive upload failed, retrying in {delay:.1f}s")
+                    return
+                else:
+                    # The summary still succeeds; the Drive failure is reported in the result
+                    result["drive_error"] = doc_result.get("error")
+                    job.error = None
+
+                job.result = result
+                job.stage = "record"
+                job.next_attempt_at = None
+                db.commit()
+
+            if job.stage == "record":
+                result = dict(job.result)
+                summary, usage_stat = agent._build_summary(
+                    title=payload["title"],
+                    summary_text=result["summary"],
+                    usage=usage_from_response(result),
+                    google_drive_file_id=result.get("google_drive_file_id"),
+                    google_drive_file_url=result.get("google_drive_file_url")
+                )
+                agent._add_summary(summary, usage_stat, save_to_drive=payload.get("save_to_drive", False))
+                result["summary_id"] = summary.id
+                job.result = result
+                tokens_used = usage_stat.tokens_used
+                # Summary rows and job completion are committed together
+                self._finish(db, job, "succeeded")
+                token_ledger.record(job.user_id, tokens_used)
+        finally:
+            db.close()
+
+    def _finish(self, db: Session, job: Job, status: str, error: Optional[str] = None) -> None:
+        """Mark a job as finished and notify subscribers"""
+        job.status = status
+        job.stage = "done"
+        if error is not None:
+            job.error = error
+        job.finished_at = datetime.utcnow()
+        db.commit()
+        self._notify(job.id)
+
+    def _fail(self, job_id: int, error: str) -> None:
+        """Mark a job failed after an unexpected error"""
+        db = self.session_factory()
+        try:
+            job = db.query(Job).filter(Job.id == job_id).first()
+            if job and job.status not in TERMINAL_STATUSES:
+                self._finish(db, job, "failed", error=error)
+        finally:
+            db.close()
+
+    def _notify(self, job_id: int) -> None:
+        """Wake idle workers and anyone subscribed to the job"""
+        if self._wakeup is not None:
+            self._wakeup.set()
+        for event in self._listeners.get(job_id, []):
+            event.set()
+
+    async def wait_for_change(self, job_id: int, timeout: float) -> None:
+        """Wait until the job changes in this process, or the timeout elapses"""
+        event = asyncio.Event()
+        self._listeners.setdefault(job_id, []).append(event)
+        try:
+            await asyncio.wait_for(event.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            listeners = self._listeners.get(job_id, [])
+            listeners.remove(event)
+            if not listeners:
+                self._listeners.pop(job_id, None)
+
+
+job_engine = JobEngine(
+    workers=settings.job_workers,
+    poll_interval=settings.job_poll_interval_seconds,
+    drive_max_attempts=settings.job_drive_max_attempts,
+    drive_backoff_seconds=settings.job_drive_backoff_seconds,
+    drive_backoff_max_seconds=settings.job_drive_backoff_max_seconds
+)
@@ -0,0 +1,51 @@
+from functools import lru_cache
+from typing import Optional, Tuple
+from config import settings
+
+# USD per 1K tokens as (prompt, completion), Azure OpenAI pay-as-you-go list prices.
+# Keys are matched as prefixes of the model name, longest first.
+MODEL_PRICING = {
+    "gpt-4o-mini": (0.000165, 0.00066),
+    "gpt-4o": (0.005, 0.015),
+    "gpt-4-turbo": (0.01, 0.03),
+    "gpt-4-32k": (0.06, 0.12),
+    "gpt-4": (0.03, 0.06),
+    "gpt-35-turbo-instruct": (0.0015, 0.002),
+    "gpt-35-turbo-16k": (0.003, 0.004),
+    "gpt-35-turbo": (0.0005, 0.0015),
+    "gpt-3.5-turbo": (0.0005, 0.0015),
+}
+
+
+@lru_cache(maxsize=256)
+def get_pricing(model: Optional[str], deployment: Optional[str] = None) -> Tuple[float, float]:
+    """Get (prompt, completion) USD per 1K tokens for a deployment or model.
+
+    settings.pricing_overrides is checked first by deployment name then by
+    model, followed by the built-in table, then the configured default.
+    """
+    for name in (deployment, model):
+        if name and name in settings.pricing_overrides:
+            prompt_price, completion_price = settings.pricing_overrides[name]
+            return float(prompt_price), float(completion_price)
+
+    for name in (model, deployment):
+        if not name:
+            continue
+        name = name.lower()
+        for prefix in sorted(MODEL_PRICING, key=len, reverse=True):
+            if name.startswith(prefix):
+                return MODEL_PRICING[prefix]
+
+    return settings.default_prompt_price_per_1k, settings.default_completion_price_per_1k
+
+
+def calculate_cost(
+    prompt_tokens: int,
+    completion_tokens: int,
+    model: Optional[str],
+    deployment: Optional[str] = None
+) -> float:
+    """Cost in USD of a completion"""
+    prompt_price, completion_price = get_pricing(model, deployment)
+    return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1000
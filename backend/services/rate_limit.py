@@ -0,0 +1,56 @@
+from typing import Dict, Optional, Tuple
+import re
+from config import settings
+from services.shared_state import build_shared_state, shared_state
+
+PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+_limit_pattern = re.compile(r"^\s*(\d+)\s*/\s*(\d*)\s*(second|minute|hour|day)s?\s*$")
+
+
+def parse_limit(spec: str) -> Tuple[float, float]:
+    """Parse '10/minute' or '100/5 minutes' into (capacity, tokens per second)"""
+    match = _limit_pattern.match(spec.lower())
+    if not match:
+        raise ValueError(f"Invalid rate limit: {spec!r}")
+    count, multiple, period = match.groups()
+    seconds = PERIODS[period] * int(multiple or 1)
+    return float(count), int(count) / seconds
+
+
+class RateLimiter:
+    """Named per-route limits applied per user (or client address) with token buckets.
+
+    Limits come from settings.rate_limits, where a "<name>:<user id>" entry overrides
+    "<name>" for one user. Parsed limits are cached, so a check is a dict lookup plus
+    one bucket update.
+    """
+
+    def __init__(self, store, limits: Dict[str, str]):
+        self.store = store
+        self.limits = limits
+        self._parsed: Dict[str, Optional[Tuple[float, float]]] = {}
+
+    def _limit(self, name: str) -> Optional[Tuple[float, float]]:
+        if name not in self._parsed:
+            spec = self.limits.get(name)
+            self._parsed[name] = parse_limit(spec) if spec else None
+        return self._parsed[name]
+
+    def check(self, name: str, identity: str, user_id: Optional[int] = None) -> Tuple[bool, float]:
+        """Count a request against a named limit. Returns (allowed, retry_after_seconds)"""
+        limit = None
+        if user_id is not None:
+            limit = self._limit(f"{name}:{user_id}")
+        if limit is None:
+            limit = self._limit(name)
+        if limit is None:
+            return True, 0.0
+        capacity, rate = limit
+        return self.store.take(f"{name}:{identity}", capacity, rate)
+
+
+# Buckets live in the shared state unless settings.rate_limit_store names a store of their own
+rate_limiter = RateLimiter(
+    build_shared_state(settings.rate_limit_store) if settings.rate_limit_store else shared_state,
+    settings.rate_limits
+)
@@ -0,0 +1,107 @@
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from typing import Callable, Dict, List, Optional, Tuple
+import asyncio
+import importlib
+import logging
+import time
+from config import settings
+from database import engine
+from services.token_budget import load_encoding
+
+logger = logging.getLogger(__name__)
+
+# SDKs the app imports on first use; warm-up loads them before traffic arrives
+WARM_IMPORTS = [
+    "openai",
+    "slack_bolt",
+    "slack_bolt.adapter.fastapi",
+    "googleapiclient.discovery",
+    "google.oauth2.credentials",
+    "google_auth_oauthlib.flow"
+]
+
+
+class Readiness:
+    """Warms up a worker after startup and reports whether it should receive traffic.
+
+    Warm-up runs once in the background so the process answers liveness probes
+    straight away: it opens database connections into the pool, loads the tokenizer
+    and imports the SDKs deferred at startup. A worker is ready once warm-up has
+    finished and the database answers within timeout_seconds.
+    """
+
+    def __init__(self, engine: Engine = engine, db_connections: int = 4, timeout_seconds: float = 2.0):
+        self.engine = engine
+        self.db_connections = db_connections
+        self.timeout_seconds = timeout_seconds
+        # Step name -> "pending", "ok" or the error it failed with
+        self.steps: Dict[str, str] = {name: "pending" for name, _ in self._steps()}
+        self._task: Optional[asyncio.Task] = None
+
+    def _steps(self) -> List[Tuple[str, Callable[[], None]]]:
+        return [
+            ("database_pool", self._warm_database_pool),
+            ("tokenizer", load_encoding),
+            ("sdk_imports", lambda: [importlib.import_module(name) for name in WARM_IMPORTS])
+        ]
+
+    def _warm_database_pool(self) -> None:
+        connections = [self.engine.connect() for _ in range(self.db_connections)]
+        try:
+            for conn in connections:
+                conn.execute(text("SELECT 1"))
+        finally:
+            for conn in connections:
+                conn.close()
+
+    async def start(self) -> None:
+        """Warm up in the background"""
+        self._task = asyncio.create_task(self.warm_up())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def warm_up(self) -> Dict[str, str]:
+        """Run every warm-up step; a failed step is recorded and doesn't stop the others"""
+        started = time.perf_counter()
+        for name, step in self._steps():
+            try:
+                await asyncio.to_thread(step)
+                self.steps[name] = "ok"
+            except Exception as e:
+                logger.warning(f"Warm-up step {name} failed: {e}")
+                self.steps[name] = f"failed: {e}"
+        logger.info(f"Warm-up finished in {time.perf_counter() - started:.2f}s: {self.steps}")
+        return self.steps
+
+    @property
+    def warm(self) -> bool:
+        return "pending" not in self.steps.values()
+
+    def _ping_database(self) -> None:
+        with self.engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+
+    async def check(self) -> Tuple[bool, Dict]:
+        """Whether the worker is ready, with the result of each check"""
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(asyncio.to_thread(self._ping_database), self.timeout_seconds)
+            database = {"status": "ok", "latency_ms": round((time.perf_counter() - started) * 1000, 2)}
+        except asyncio.TimeoutError:
+            database = {"status": "failed", "error": f"No answer within {self.timeout_seconds}s"}
+        except Exception as e:
+            database = {"status": "failed", "error": str(e)}
+
+        warmup = {"status": "ok" if self.warm else "pending", "steps": dict(self.steps)}
+        return database["status"] == "ok" and self.warm, {"database": database, "warmup": warmup}
+
+
+readiness = Readiness(
+    db_connections=settings.warmup_db_connections,
+    timeout_seconds=settings.readiness_timeout_seconds
+)
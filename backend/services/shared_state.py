@@ -0,0 +1,287 @@
+from collections import OrderedDict
+from typing import Any, Optional, Tuple
+import json
+import logging
+import sqlite3
+import threading
+import time
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# Every backend offers the same operations on JSON values, so callers don't care
+# which one settings.shared_state_url picked:
+#   get(key), set(key, value, ttl_seconds), add(key, value, ttl_seconds) -> bool
+#   (set only if absent, for dedup), incr(key, amount) -> new value or None if absent,
+#   delete(key), take(key, capacity, rate, cost) -> (allowed, retry_after) for token
+#   buckets, and reset().
+
+
+def _refill(tokens: float, updated: float, now: float, capacity: float, rate: float, cost: float) -> Tuple[bool, float]:
+    """Token bucket step: returns (allowed, tokens left)"""
+    tokens = min(capacity, tokens + max(0.0, now - updated) * rate)
+    allowed = tokens >= cost
+    return allowed, tokens - cost if allowed else tokens
+
+
+class MemoryState:
+    """State in process memory, for a single worker and for tests.
+
+    Values are stored JSON-encoded like the other backends. Values and token
+    buckets are each LRU-bounded by max_keys.
+    """
+
+    def __init__(self, max_keys: int = 100000):
+        self.max_keys = max_keys
+        self._values: "OrderedDict[str, Tuple[str, Optional[float]]]" = OrderedDict()
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _live(self, key: str) -> Optional[str]:
+        entry = self._values.get(key)
+        if entry is None:
+            return None
+        raw, expires_at = entry
+        if expires_at is not None and expires_at < time.monotonic():
+            del self._values[key]
+            return None
+        self._values.move_to_end(key)
+        return raw
+
+    def _store(self, key: str, raw: str, ttl_seconds: Optional[float]) -> None:
+        self._values[key] = (raw, time.monotonic() + ttl_seconds if ttl_seconds else None)
+        self._values.move_to_end(key)
+        if len(self._values) > self.max_keys:
+            self._values.popitem(last=False)
+
+    def get(self, key: str) -> Any:
+        with self._lock:
+            raw = self._live(key)
+        return None if raw is None else json.loads(raw)
+
+    def set(self, key: str, value: Any, ttl_seconds: Optional[float] = None) -> None:
+        raw = json.dumps(value, default=str)
+        with self._lock:
+            self._store(key, raw, ttl_seconds)
+
+    def add(self, key: str, value: Any, ttl_seconds: Optional[float] = None) -> bool:
+        raw = json.dumps(value, default=str)
+        with self._lock:
+            if self._live(key) is not None:
+                return False
+            self._store(key, raw, ttl_seconds)
+            return True
+
+    def incr(self, key: str, amount: int) -> Optional[int]:
+        with self._lock:
+            raw = self._live(key)
+            if raw is None:
+                return None
+            value = json.loads(raw) + amount
+            self._values[key] = (json.dumps(value), self._values[key][1])
+            return value
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._values.pop(key, None)
+
+    def take(self, key: str, capacity: float, rate: float, cost: float = 1) -> Tuple[bool, float]:
+        """Take cost tokens from key's bucket. Returns (allowed, seconds until allowed)"""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (capacity, now))
+            allowed, tokens = _refill(tokens, updated, now, capacity, rate, cost)
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return allowed, 0.0 if allowed else (cost - tokens) / rate
+
+    def reset(self) -> None:
+        with self._lock:
+            self._values.clear()
+            self._buckets.clear()
+
+
+class SQLiteState:
+    """State in a local SQLite file, shared by the worker processes on one host.
+
+    Each operation is one or two primary-key statements on its own small WAL file,
+    separate from the application database; put it on /dev/shm to keep it in
+    memory. Expired values are purged every purge_every writes.
+    """
+
+    def __init__(self, path: str, purge_every: int = 1000):
+        self.path = path
+        self.purge_every = purge_every
+        self._writes = 0
+        self._local = threading.local()
+        conn = self._connection()
+        conn.execute("CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, tokens REAL, updated REAL)")
+        conn.execute("CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, value TEXT, expires REAL)")
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=OFF")
+            self._local.conn = conn
+        return conn
+
+    def _written(self, conn: sqlite3.Connection) -> None:
+        self._writes += 1
+        if self._writes % self.purge_every == 0:
+            conn.execute("DELETE FROM entries WHERE expires < ?", (time.time(),))
+
+    @staticmethod
+    def _expires(ttl_seconds: Optional[float]) -> Optional[float]:
+        # Wall-clock time, since monotonic clocks aren't comparable across processes
+        return time.time() + ttl_seconds if ttl_seconds else None
+
+    def get(self, key: str) -> Any:
+        row = self._connection().execute(
+            "SELECT value FROM entries WHERE key = ? AND (expires IS NULL OR expires >= ?)", (key, time.time())
+        ).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def set(self, key: str, value: Any, ttl_seconds: Optional[float] = None) -> None:
+        conn = self._connection()
+        conn.execute(
+            "INSERT OR REPLACE INTO entries (key, value, expires) VALUES (?, ?, ?)",
+            (key, json.dumps(value, default=str), self._expires(ttl_seconds))
+        )
+        self._written(conn)
+
+    def add(self, key: str, value: Any, ttl_seconds: Optional[float] = None) -> bool:
+        conn = self._connection()
+        # Inserts, or replaces only an expired entry; rowcount is 0 if a live one exists
+        cursor = conn.execute(
+            "INSERT INTO entries (key, value, expires) VALUES (?, ?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = excluded.value, expires = excluded.expires "
+            "WHERE entries.expires IS NOT NULL AND entries.expires < ?",
+            (key, json.dumps(value, default=str), self._expires(ttl_seconds), time.time())
+        )
+        self._written(conn)
+        return cursor.rowcount == 1
+
+    def incr(self, key: str, amount: int) -> Optional[int]:
+        row = self._connection().execute(
+            "UPDATE entries SET value = CAST(value AS INTEGER) + ? "
+            "WHERE key = ? AND (expires IS NULL OR expires >= ?) RETURNING value",
+            (amount, key, time.time())
+        ).fetchone()
+        return None if row is None else int(row[0])
+
+    def delete(self, key: str) -> None:
+        self._connection().execute("DELETE FROM entries WHERE key = ?", (key,))
+
+    def take(self, key: str, capacity: float, rate: float, cost: float = 1) -> Tuple[bool, float]:
+        """Take cost tokens from key's bucket. Returns (allowed, seconds until allowed)"""
+        now = time.time()
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT tokens, updated FROM buckets WHERE key = ?", (key,)).fetchone()
+            tokens, updated = row if row else (capacity, now)
+            allowed, tokens = _refill(tokens, updated, now, capacity, rate, cost)
+            conn.execute(
+                "INSERT INTO buckets (key, tokens, updated) VALUES (?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET tokens = excluded.tokens, updated = excluded.updated",
+                (key, tokens, now)
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return allowed, 0.0 if allowed else (cost - tokens) / rate
+
+    def reset(self) -> None:
+        conn = self._connection()
+        conn.execute("DELETE FROM buckets")
+        conn.execute("DELETE FROM entries")
+
+
+# KEYS[1] bucket; ARGV capacity, rate, cost, now. Returns {allowed, tokens as a string}
+_TAKE_SCRIPT = """
+local capacity, rate, cost, now = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3]), tonumber(ARGV[4])
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(bucket[1]) or capacity
+local updated = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate)
+local allowed = 0
+if tokens >= cost then
+    tokens = tokens - cost
+    allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / rate * 1000))
+return {allowed, tostring(tokens)}
+"""
+
+# Only increments an existing key, like the other backends
+_INCR_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    return redis.call('INCRBY', KEYS[1], ARGV[1])
+end
+return false
+"""
+
+
+class RedisState:
+    """State in Redis, shared by workers on any number of hosts. Requires the redis package."""
+
+    def __init__(self, url: str, prefix: str = "slack-ai-bot:"):
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self._take = self.client.register_script(_TAKE_SCRIPT)
+        self._incr = self.client.register_script(_INCR_SCRIPT)
+
+    @staticmethod
+    def _px(ttl_seconds: Optional[float]) -> Optional[int]:
+        return max(1, int(ttl_seconds * 1000)) if ttl_seconds else None
+
+    def get(self, key: str) -> Any:
+        raw = self.client.get(self.prefix + key)
+        return None if raw is None else json.loads(raw)
+
+    def set(self, key: str, value: Any, ttl_seconds: Optional[float] = None) -> None:
+        self.client.set(self.prefix + key, json.dumps(value, default=str), px=self._px(ttl_seconds))
+
+    def add(self, key: str, value: Any, ttl_seconds: Optional[float] = None) -> bool:
+        return bool(self.client.set(
+            self.prefix + key, json.dumps(value, default=str), px=self._px(ttl_seconds), nx=True
+        ))
+
+    def incr(self, key: str, amount: int) -> Optional[int]:
+        value = self._incr(keys=[self.prefix + key], args=[amount])
+        return None if value is None else int(value)
+
+    def delete(self, key: str) -> None:
+        self.client.delete(self.prefix + key)
+
+    def take(self, key: str, capacity: float, rate: float, cost: float = 1) -> Tuple[bool, float]:
+        """Take cost tokens from key's bucket. Returns (allowed, seconds until allowed)"""
+        allowed, tokens = self._take(keys=[f"{self.prefix}bucket:{key}"], args=[capacity, rate, cost, time.time()])
+        tokens = float(tokens)
+        return bool(allowed), 0.0 if allowed else (cost - tokens) / rate
+
+    def reset(self) -> None:
+        keys = list(self.client.scan_iter(match=f"{self.prefix}*"))
+        if keys:
+            self.client.delete(*keys)
+
+
+def build_shared_state(url: str):
+    """Create the backend named by a state URL: "memory", "sqlite:///path" or "redis://..." """
+    if url.startswith("sqlite:///"):
+        return SQLiteState(url[len("sqlite:///"):])
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisState(url)
+    if url != "memory":
+        logger.warning(f"Unknown shared state {url!r}, using memory")
+    return MemoryState()
+
+
+shared_state = build_shared_state(settings.shared_state_url)
@@ -0,0 +1,73 @@
+from typing import Awaitable, Callable, Dict, List, Tuple
+import asyncio
+import hashlib
+import json
+import logging
+import re
+from metrics import QUEUE_DEPTH, cache_lookup
+
+logger = logging.getLogger(__name__)
+
+_whitespace = re.compile(r"\s+")
+
+
+def prompt_key(messages: List[Dict[str, str]], **params) -> str:
+    """Hash a chat request, ignoring whitespace differences in the message text"""
+    normalized = [
+        {"role": m.get("role"), "content": _whitespace.sub(" ", m.get("content", "")).strip()}
+        for m in messages
+    ]
+    payload = json.dumps([normalized, params], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class SingleFlight:
+    """Share one in-flight LLM completion between concurrent identical requests.
+
+    The first request for a key runs the call; requests arriving while it is in
+    flight await the same task. Nothing is cached once the call finishes. The shared
+    task is shielded, so a caller that gives up doesn't cancel it for the others.
+    """
+
+    def __init__(self):
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.requests = 0
+        self.executions = 0
+        self.coalesced = 0
+        self.tokens_saved = 0
+
+    async def do(self, key: str, call: Callable[[], Awaitable[Dict]]) -> Tuple[Dict, bool]:
+        """Run call, or join an identical one in flight. Returns (result, shared)"""
+        self.requests += 1
+        task = self._inflight.get(key)
+        shared = task is not None
+        cache_lookup("llm_single_flight", shared)
+        if shared:
+            self.coalesced += 1
+        else:
+            self.executions += 1
+            task = asyncio.ensure_future(call())
+            self._inflight[key] = task
+            QUEUE_DEPTH.labels(queue="llm_in_flight").inc()
+            task.add_done_callback(lambda _: self._finished(key))
+
+        result = await asyncio.shield(task)
+        if shared and result.get("success"):
+            self.tokens_saved += result.get("tokens_used", 0)
+        return result, shared
+
+    def _finished(self, key: str) -> None:
+        self._inflight.pop(key, None)
+        QUEUE_DEPTH.labels(queue="llm_in_flight").dec()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "requests": self.requests,
+            "executions": self.executions,
+            "coalesced": self.coalesced,
+            "tokens_saved": self.tokens_saved,
+            "in_flight": len(self._inflight)
+        }
+
+
+llm_single_flight = SingleFlight()
@@ -1,33 +1,83 @@
 from slack_sdk import WebClient
 from slack_sdk.errors import SlackApiError
-from slack_bolt import App
-from slack_bolt.adapter.fastapi import SlackRequestHandler
-from typing import Dict, Optional
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+import asyncio
+import threading
 import logging
+from config import settings
+from metrics import EXTERNAL_API_SECONDS, timed
+from tracing import span, traced
+
+if TYPE_CHECKING:
+    from slack_bolt import App
+    from slack_bolt.adapter.fastapi import SlackRequestHandler
 
 logger = logging.getLogger(__name__)
 
 
+# Bolt apps are only needed for event registration and the App constructor makes a
+# blocking auth.test call, so they are built on first use and shared per workspace token
+_bolt_apps: Dict[Tuple[str, str], Tuple["App", "SlackRequestHandler"]] = {}
+_bolt_apps_lock = threading.Lock()
+
+
+def _get_bolt_app(bot_token: str, signing_secret: str) -> Tuple["App", "SlackRequestHandler"]:
+    """Get or build the cached Bolt app and request handler for a workspace"""
+    key = (bot_token, signing_secret)
+    cached = _bolt_apps.get(key)
+    if cached is not None:
+        return cached
+    
+    with _bolt_apps_lock:
+        cached = _bolt_apps.get(key)
+        if cached is None:
+            # Bolt is slow to import and only event registration needs it
+            from slack_bolt import App
+            from slack_bolt.adapter.fastapi import SlackRequestHandler
+            
+            logger.info("Building Slack Bolt app for workspace")
+            with span("slack.bolt_app"):
+                app = App(token=bot_token, signing_secret=signing_secret)
+            cached = (app, SlackRequestHandler(app))
+            _bolt_apps[key] = cached
+        return cached
+
+
+class InstrumentedWebClient(WebClient):
+    """WebClient that records the latency of every Web API call by method"""
+
+    def api_call(self, api_method: str, *args, **kwargs):
+        with span(f"slack.{api_method}"), timed(EXTERNAL_API_SECONDS, service="slack", method=api_method):
+            return super().api_call(api_method, *args, **kwargs)
+
+
 class SlackService:
     def __init__(self, bot_token: str, app_token: Optional[str] = None, signing_secret: Optional[str] = None):
         """Initialize Slack service with credentials"""
         self.bot_token = bot_token
         self.app_token = app_token
         self.signing_secret = signing_secret
-        self.client = WebClient(token=bot_token)
-        
-        # Initialize Bolt app if signing secret is provided
-        if signing_secret:
-            self.app = App(token=bot_token, signing_secret=signing_secret)
-            self.handler = SlackRequestHandler(self.app)
-        else:
-            self.app = None
-            self.handler = None
+        self.client = InstrumentedWebClient(token=bot_token, base_url=settings.slack_api_base_url)
+    
+    @property
+    def app(self) -> Optional["App"]:
+        """Bolt app for event registration, built lazily if a signing secret is provided"""
+        if not self.signing_secret:
+            return None
+        return _get_bolt_app(self.bot_token, self.signing_secret)[0]
     
+    @property
+    def handler(self) -> Optional["SlackRequestHandler"]:
+        """FastAPI request handler for the Bolt app, built lazily with it"""
+        if not self.signing_secret:
+            return None
+        return _get_bolt_app(self.bot_token, self.signing_secret)[1]
+    
+    @traced()
     async def test_connection(self) -> Dict[str, any]:
         """Test Slack connection"""
         try:
-            response = self.client.auth_test()
+            response = await asyncio.to_thread(self.client.auth_test)
             return {
                 "status": "success",
                 "message": f"Connected to workspace: {response['team']}",
@@ -52,10 +102,12 @@ class SlackService:
                 "details": None
             }
     
+    @traced()
     async def send_message(self, channel: str, text: str, thread_ts: Optional[str] = None) -> Dict:
         """Send a message to Slack channel"""
         try:
-            response = self.client.chat_postMessage(
+            response = await asyncio.to_thread(
+                self.client.chat_postMessage,
                 channel=channel,
                 text=text,
                 thread_ts=thread_ts
@@ -72,10 +124,12 @@ class SlackService:
                 "error": str(e)
             }
     
+    @traced()
     async def get_channel_history(self, channel: str, limit: int = 10) -> list:
         """Get channel message history"""
         try:
-            response = self.client.conversations_history(
+            response = await asyncio.to_thread(
+                self.client.conversations_history,
                 channel=channel,
                 limit=limit
             )
@@ -84,6 +138,82 @@ class SlackService:
             logger.error(f"Failed to get channel history: {e}")
             return []
     
+    async def _fetch_pages(self, method, max_messages: int, **kwargs) -> List[Dict]:
+        """Follow pagination cursors for a conversations.* method off the event loop"""
+        messages = []
+        cursor = None
+        while len(messages) < max_messages:
+            response = await asyncio.to_thread(
+                method,
+                cursor=cursor,
+                limit=min(200, max_messages - len(messages)),
+                **kwargs
+            )
+            messages.extend(response.get("messages", []))
+            cursor = (response.get("response_metadata") or {}).get("next_cursor")
+            if not cursor:
+                break
+        return messages
+    
+    @traced()
+    async def fetch_conversation(
+        self,
+        channel: str,
+        thread_ts: Optional[str] = None,
+        oldest: Optional[str] = None,
+        max_messages: int = 200,
+        max_concurrency: int = 4
+    ) -> List[Dict]:
+        """Fetch a thread, or a channel window with its thread replies, oldest first.
+        
+        Only messages newer than `oldest` are returned. For channel windows the replies
+        of each threaded message are fetched concurrently. New replies can land under
+        parents older than `oldest`, so the window itself is always re-read and only
+        threads whose latest reply is newer than `oldest` are fetched.
+        """
+        kwargs = {"channel": channel}
+        if oldest:
+            kwargs["oldest"] = oldest
+        
+        try:
+            if thread_ts:
+                messages = await self._fetch_pages(
+                    self.client.conversations_replies, max_messages, ts=thread_ts, **kwargs
+                )
+            else:
+                messages = await self._fetch_pages(
+                    self.client.conversations_history, max_messages, channel=channel
+                )
+                
+                semaphore = asyncio.Semaphore(max_concurrency)
+                
+                async def fetch_replies(parent: Dict) -> List[Dict]:
+                    async with semaphore:
+                        replies = await self._fetch_pages(
+                            self.client.conversations_replies, max_messages, ts=parent["ts"], **kwargs
+                        )
+                    # The parent message is repeated at the start of its replies
+                    return [reply for reply in replies if reply.get("ts") != parent["ts"]]
+                
+                threaded = [
+                    m for m in messages
+                    if m.get("reply_count") and m.get("thread_ts") == m.get("ts")
+                    and (not oldest or float(m.get("latest_reply") or "inf") > float(oldest))
+                ]
+                for replies in await asyncio.gather(*(fetch_replies(m) for m in threaded)):
+                    messages.extend(replies)
+        except SlackApiError as e:
+            logger.error(f"Failed to fetch conversation: {e}")
+            return []
+        
+        # conversations.replies always includes the thread parent, even when older,
+        # and the channel window is read in full
+        if oldest:
+            messages = [m for m in messages if float(m.get("ts", 0)) > float(oldest)]
+        messages.sort(key=lambda m: float(m.get("ts", 0)))
+        return messages
+    
+    @traced()
     async def get_user_info(self, user_id: str) -> Dict:
         """Get Slack user information"""
         try:
@@ -0,0 +1,169 @@
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from datetime import datetime, date
+from typing import Dict, List, Optional, Tuple
+import asyncio
+import logging
+import threading
+from config import settings
+from models import UsageStats
+from services.shared_state import shared_state
+
+logger = logging.getLogger(__name__)
+
+# Chat format overhead per message and for the reply primer (OpenAI cookbook figures)
+TOKENS_PER_MESSAGE = 4
+TOKENS_PER_REPLY = 2
+# Daily totals outlive their day by a margin so a request spanning midnight still finds them
+LEDGER_TTL_SECONDS = 2 * 86400
+
+_encoding = None
+_encoding_loaded = False
+_encoding_lock = threading.Lock()
+
+
+def load_encoding():
+    """Load the tiktoken encoding once, or None to fall back to an estimate.
+
+    The first load may download the BPE file (set TIKTOKEN_CACHE_DIR to a directory
+    holding it to stay offline), so warm-up calls this in a thread.
+    """
+    global _encoding, _encoding_loaded
+    with _encoding_lock:
+        if not _encoding_loaded:
+            try:
+                import tiktoken
+                _encoding = tiktoken.get_encoding("cl100k_base")
+            except Exception as e:
+                logger.warning(f"tiktoken unavailable, estimating token counts: {e}")
+                _encoding = None
+            _encoding_loaded = True
+    return _encoding
+
+
+def _get_encoding():
+    """The tiktoken encoding, or None to estimate.
+
+    Never loads it on the event loop: requests arriving before warm-up has loaded it
+    are estimated rather than stalled on the download.
+    """
+    if _encoding_loaded:
+        return _encoding
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return load_encoding()
+    return None
+
+
+def count_tokens(text: str) -> int:
+    """Count tokens in a string with the local tokenizer"""
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is None:
+        # Roughly four characters per token for English text
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text))
+
+
+def count_message_tokens(messages: List[Dict[str, str]]) -> int:
+    """Count the prompt tokens a chat completion request will use"""
+    return sum(
+        TOKENS_PER_MESSAGE + count_tokens(message.get("content", ""))
+        for message in messages
+    ) + TOKENS_PER_REPLY
+
+
+def trim_lines_to_tokens(text: str, max_tokens: int) -> str:
+    """Keep the most recent lines of text that fit in max_tokens"""
+    if max_tokens <= 0:
+        return ""
+    if count_tokens(text) <= max_tokens:
+        return text
+
+    kept = []
+    used = 0
+    for line in reversed(text.split("\n")):
+        # +1 for the newline joining the lines
+        line_tokens = count_tokens(line) + 1
+        if used + line_tokens > max_tokens:
+            break
+        kept.append(line)
+        used += line_tokens
+    return "\n".join(reversed(kept))
+
+
+def fit_completion(
+    prompt_tokens: int,
+    requested_max_tokens: int,
+    context_window: int,
+    token_budget: Optional[int] = None,
+    min_completion_tokens: int = 64
+) -> Tuple[int, Optional[str], Optional[str]]:
+    """Choose max_tokens so the request fits the model window and the user's budget.
+
+    Returns (max_tokens, error, error_code); error is set when the request should be
+    rejected without calling the model.
+    """
+    available = context_window - prompt_tokens
+    if available < min_completion_tokens:
+        return 0, (
+            f"Request too large: {prompt_tokens} prompt tokens exceeds the "
+            f"{context_window}-token model window"
+        ), "context_window_exceeded"
+
+    max_tokens = min(requested_max_tokens, available)
+
+    if token_budget is not None:
+        budget_available = token_budget - prompt_tokens
+        if budget_available < min_completion_tokens:
+            return 0, "Token budget exceeded", "token_budget_exceeded"
+        max_tokens = min(max_tokens, budget_available)
+
+    return max_tokens, None, None
+
+
+class TokenLedger:
+    """Per-user token totals for the current UTC day, kept in the shared state.
+
+    A user's total is seeded from UsageStats on first use each day and then
+    incremented as any worker records usage, so budget checks don't query the database.
+    """
+
+    def __init__(self, daily_budget: int = 0, state=shared_state):
+        self.daily_budget = daily_budget
+        self.state = state
+
+    @staticmethod
+    def _key(user_id: int, day: date) -> str:
+        return f"tokens:{day.isoformat()}:{user_id}"
+
+    def used(self, db: Session, user_id: int) -> int:
+        """Tokens the user has used today"""
+        today = datetime.utcnow().date()
+        key = self._key(user_id, today)
+        total = self.state.get(key)
+        if total is None:
+            since = datetime.combine(today, datetime.min.time())
+            total = db.query(func.sum(UsageStats.tokens_used)).filter(
+                UsageStats.user_id == user_id,
+                UsageStats.created_at >= since
+            ).scalar() or 0
+            # Another worker may have seeded the day first; its total has the increments since
+            if not self.state.add(key, total, LEDGER_TTL_SECONDS):
+                total = self.state.get(key) or total
+        return total
+
+    def remaining(self, db: Session, user_id: int) -> Optional[int]:
+        """Tokens the user may still spend today, or None when budgets are disabled"""
+        if self.daily_budget <= 0:
+            return None
+        return max(0, self.daily_budget - self.used(db, user_id))
+
+    def record(self, user_id: int, tokens: int) -> None:
+        """Add tokens to a user's running total once it has been seeded"""
+        self.state.incr(self._key(user_id, datetime.utcnow().date()), tokens)
+
+
+token_ledger = TokenLedger(daily_budget=settings.user_daily_token_budget)
@@ -0,0 +1,162 @@
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from datetime import datetime, date
+from typing import Dict, Optional
+import logging
+from models import UsageStats, UsageRollup
+from services.pricing import calculate_cost
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_KEY = ("day", "user_id", "service_type", "action_type")
+ROLLUP_TOTALS = (
+    "requests", "prompt_tokens", "completion_tokens", "tokens_used",
+    "cost", "execution_time_ms_total", "timed_requests"
+)
+USAGE_FIELDS = (
+    "prompt_tokens", "completion_tokens", "tokens_used", "model", "deployment", "execution_time_ms"
+)
+
+
+def usage_from_response(response: Dict) -> Dict:
+    """Pick the fields record_usage needs from an AI service response"""
+    return {field: response[field] for field in USAGE_FIELDS if field in response}
+
+
+def _upsert_rollup(db: Session, key: Dict, totals: Dict) -> None:
+    """Add totals to the rollup row for key, creating it if needed"""
+    dialect = db.get_bind().dialect.name
+    if dialect in ("sqlite", "postgresql"):
+        if dialect == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert
+        table = UsageRollup.__table__
+        stmt = insert(table).values(**key, **totals)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=list(ROLLUP_KEY),
+            set_={name: table.c[name] + stmt.excluded[name] for name in totals}
+        )
+        db.execute(stmt)
+        return
+
+    # Other databases: update in place, inserting on first use
+    updated = db.query(UsageRollup).filter_by(**key).update(
+        {getattr(UsageRollup, name): getattr(UsageRollup, name) + value for name, value in totals.items()},
+        synchronize_session=False
+    )
+    if not updated:
+        db.add(UsageRollup(**key, **totals))
+
+
+def build_usage(
+    user_id: int,
+    service_type: str,
+    action_type: str,
+    prompt_tokens: Optional[int] = None,
+    completion_tokens: Optional[int] = None,
+    tokens_used: int = 0,
+    model: Optional[str] = None,
+    deployment: Optional[str] = None,
+    execution_time_ms: Optional[float] = None,
+    meta_info: Optional[Dict] = None
+) -> UsageStats:
+    """Price a request and build its UsageStats row without touching a session.
+
+    When the prompt/completion split is unknown, tokens_used is priced as completion
+    tokens so the cost errs high rather than low.
+    """
+    if prompt_tokens is None and completion_tokens is None:
+        prompt_tokens, completion_tokens = 0, tokens_used
+    prompt_tokens = prompt_tokens or 0
+    completion_tokens = completion_tokens or 0
+    return UsageStats(
+        user_id=user_id,
+        service_type=service_type,
+        action_type=action_type,
+        model=model or deployment,
+        prompt_tokens=prompt_tokens,
+        completion_tokens=completion_tokens,
+        tokens_used=prompt_tokens + completion_tokens,
+        cost=calculate_cost(prompt_tokens, completion_tokens, model, deployment),
+        execution_time_ms=execution_time_ms,
+        meta_info=meta_info
+    )
+
+
+def add_usage(db: Session, usage_stat: UsageStats) -> UsageStats:
+    """Add a built UsageStats row and update the rollups without committing.
+
+    The tokens only count against the daily budget once committed: callers pass them
+    to token_ledger.record after a successful commit.
+    """
+    db.add(usage_stat)
+    _upsert_rollup(
+        db,
+        {
+            "day": datetime.utcnow().date(),
+            "user_id": usage_stat.user_id,
+            "service_type": usage_stat.service_type,
+            "action_type": usage_stat.action_type
+        },
+        {
+            "requests": 1,
+            "prompt_tokens": usage_stat.prompt_tokens,
+            "completion_tokens": usage_stat.completion_tokens,
+            "tokens_used": usage_stat.tokens_used,
+            "cost": usage_stat.cost,
+            "execution_time_ms_total": usage_stat.execution_time_ms or 0.0,
+            "timed_requests": 1 if usage_stat.execution_time_ms is not None else 0
+        }
+    )
+    return usage_stat
+
+
+def record_usage(db: Session, user_id: int, service_type: str, action_type: str, **usage) -> UsageStats:
+    """Price a request, add its UsageStats row and update the rollups without committing"""
+    return add_usage(db, build_usage(user_id, service_type, action_type, **usage))
+
+
+def rebuild_rollups(db: Session) -> int:
+    """Recompute all rollups from UsageStats, returning the number of rollup rows"""
+    day = func.date(UsageStats.created_at)
+    rows = db.query(
+        day.label("day"),
+        UsageStats.user_id,
+        UsageStats.service_type,
+        UsageStats.action_type,
+        func.count(UsageStats.id).label("requests"),
+        func.sum(UsageStats.prompt_tokens).label("prompt_tokens"),
+        func.sum(UsageStats.completion_tokens).label("completion_tokens"),
+        func.sum(UsageStats.tokens_used).label("tokens_used"),
+        func.sum(UsageStats.cost).label("cost"),
+        func.sum(UsageStats.execution_time_ms).label("execution_time_ms_total"),
+        func.count(UsageStats.execution_time_ms).label("timed_requests")
+    ).group_by(day, UsageStats.user_id, UsageStats.service_type, UsageStats.action_type).all()
+
+    db.query(UsageRollup).delete(synchronize_session=False)
+    for row in rows:
+        # SQLite returns date() as a string
+        row_day = date.fromisoformat(row.day) if isinstance(row.day, str) else row.day
+        db.add(UsageRollup(
+            day=row_day,
+            user_id=row.user_id,
+            service_type=row.service_type,
+            action_type=row.action_type,
+            requests=row.requests,
+            prompt_tokens=row.prompt_tokens or 0,
+            completion_tokens=row.completion_tokens or 0,
+            tokens_used=row.tokens_used or 0,
+            cost=row.cost or 0.0,
+            execution_time_ms_total=row.execution_time_ms_total or 0.0,
+            timed_requests=row.timed_requests
+        ))
+    db.commit()
+    return len(rows)
+
+
+def ensure_rollups(db: Session) -> None:
+    """Backfill rollups once for usage recorded before rollups existed"""
+    if db.query(UsageRollup.id).first() is None and db.query(UsageStats.id).first() is not None:
+        count = rebuild_rollups(db)
+        logger.info(f"Backfilled {count} usage rollup row(s)")
@@ -0,0 +1,75 @@
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy.orm import Session
+from database import Base, TracedSession, get_db
+from main import app
+from security import slack_keyring
+from services.rate_limit import rate_limiter
+from services.shared_state import shared_state
+from tests.factories import SLACK_SIGNING_SECRET, create_memory_engine
+
+# One in-memory database per test process (so per pytest-xdist worker), created once
+engine = create_memory_engine()
+Base.metadata.create_all(bind=engine)
+
+
+@pytest.fixture
+def session_factory():
+    """Session factory whose sessions all join one per-test transaction that is rolled back afterwards.
+
+    Commits inside the code under test only release a savepoint, so each test sees an
+    empty database without recreating the schema.
+    """
+    connection = engine.connect()
+    transaction = connection.begin()
+    sessions = []
+
+    def factory() -> Session:
+        # The app's session class, so commits are traced as in SessionLocal
+        session = TracedSession(bind=connection, join_transaction_mode="create_savepoint", autoflush=False)
+        sessions.append(session)
+        return session
+
+    yield factory
+    # Newest first, since each session's savepoint is nested in the ones before it
+    for session in reversed(sessions):
+        session.close()
+    transaction.rollback()
+    connection.close()
+
+
+@pytest.fixture
+def db_session(session_factory) -> Session:
+    """Session for the test, rolled back afterwards"""
+    return session_factory()
+
+
+@pytest.fixture
+def client(session_factory):
+    """TestClient whose requests use the test's transaction"""
+    def override_get_db():
+        db = session_factory()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app.dependency_overrides[get_db] = override_get_db
+    yield TestClient(app)
+    app.dependency_overrides.pop(get_db, None)
+
+
+@pytest.fixture(autouse=True)
+def reset_shared_state():
+    """Start every test with full rate limit buckets and empty shared caches"""
+    shared_state.reset()
+    rate_limiter.store.reset()
+
+
+@pytest.fixture
+def slack_signing_secret(monkeypatch):
+    """Verify Slack requests against a fixed signing secret instead of stored credentials"""
+    monkeypatch.setattr(slack_keyring, "loader", lambda: [SLACK_SIGNING_SECRET])
+    slack_keyring.invalidate()
+    yield SLACK_SIGNING_SECRET
+    slack_keyring.invalidate()
@@ -0,0 +1,160 @@
+from datetime import datetime, timedelta
+from itertools import islice
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import StaticPool
+from typing import Dict, Iterable, Iterator, List, Optional
+import hashlib
+import hmac
+import time
+from models import AuditLog, SlackMessage, UsageStats, User
+from security import get_password_hash
+
+SERVICE_ACTIONS = [("azure_openai", "message"), ("azure_openai", "summary"), ("google_drive", "upload")]
+AUDIT_ACTIONS = ["login", "credential_update", "slack_message", "summary_create"]
+SLACK_SIGNING_SECRET = "test-signing-secret"
+
+
+def create_memory_engine() -> Engine:
+    """In-memory SQLite engine shared by every session (StaticPool) with working SAVEPOINTs"""
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+
+    # pysqlite's own transaction handling breaks SAVEPOINT; let SQLAlchemy emit BEGIN instead
+    @event.listens_for(engine, "connect")
+    def disable_pysqlite_transactions(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(engine, "begin")
+    def emit_begin(conn):
+        conn.exec_driver_sql("BEGIN")
+
+    return engine
+
+
+def sign_slack_request(body: bytes, timestamp: str = None, secret: str = SLACK_SIGNING_SECRET) -> dict:
+    """Build Slack signature headers for a request body"""
+    timestamp = timestamp or str(int(time.time()))
+    signature = "v0=" + hmac.new(
+        secret.encode(), b"v0:" + timestamp.encode() + b":" + body, hashlib.sha256
+    ).hexdigest()
+    return {"X-Slack-Request-Timestamp": timestamp, "X-Slack-Signature": signature}
+
+
+def make_user(db: Session, username: str = "testuser", role: str = "user", password: str = "testpassword123") -> User:
+    """Insert one user and return it"""
+    user = User(
+        username=username,
+        email=f"{username}@example.com",
+        hashed_password=get_password_hash(password),
+        role=role
+    )
+    db.add(user)
+    db.commit()
+    return user
+
+
+def bulk_insert(db: Session, model, rows: Iterable[Dict], batch_size: int = 50000) -> int:
+    """Insert rows with one executemany per batch, bypassing the ORM unit of work; returns the row count"""
+    rows = iter(rows)
+    total = 0
+    while True:
+        batch: List[Dict] = list(islice(rows, batch_size))
+        if not batch:
+            break
+        db.execute(model.__table__.insert(), batch)
+        total += len(batch)
+    db.commit()
+    return total
+
+
+def _timestamps(count: int, days: int, start: Optional[datetime]) -> Iterator[datetime]:
+    """count timestamps spread evenly over the days before start"""
+    start = start or datetime.utcnow()
+    step = timedelta(days=days) / max(count, 1)
+    first = start - timedelta(days=days)
+    return (first + step * i for i in range(count))
+
+
+def seed_audit_logs(
+    db: Session,
+    count: int,
+    user_ids: Iterable[int] = (1,),
+    days: int = 30,
+    start: Optional[datetime] = None
+) -> int:
+    """Insert count audit log rows spread across users, actions and the last days"""
+    user_ids = list(user_ids)
+    rows = (
+        {
+            "user_id": user_ids[i % len(user_ids)],
+            "action": AUDIT_ACTIONS[i % len(AUDIT_ACTIONS)],
+            "resource_type": "message",
+            "resource_id": str(i),
+            "status": "success" if i % 20 else "failed",
+            "created_at": created_at
+        }
+        for i, created_at in enumerate(_timestamps(count, days, start))
+    )
+    return bulk_insert(db, AuditLog, rows)
+
+
+def seed_usage_stats(
+    db: Session,
+    count: int,
+    user_ids: Iterable[int] = (1,),
+    days: int = 30,
+    start: Optional[datetime] = None
+) -> int:
+    """Insert count usage rows spread across users, services and the last days.
+
+    Rollups are not updated; call services.usage_service.rebuild_rollups afterwards
+    if the test reads them.
+    """
+    user_ids = list(user_ids)
+
+    def rows():
+        for i, created_at in enumerate(_timestamps(count, days, start)):
+            service_type, action_type = SERVICE_ACTIONS[i % len(SERVICE_ACTIONS)]
+            prompt_tokens, completion_tokens = 100 + i % 400, 20 + i % 80
+            yield {
+                "user_id": user_ids[i % len(user_ids)],
+                "service_type": service_type,
+                "action_type": action_type,
+                "model": "gpt-35-turbo",
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "tokens_used": prompt_tokens + completion_tokens,
+                "cost": (prompt_tokens + completion_tokens) * 0.000002,
+                "execution_time_ms": float(200 + i % 1000),
+                "created_at": created_at
+            }
+
+    return bulk_insert(db, UsageStats, rows())
+
+
+def seed_slack_messages(
+    db: Session,
+    count: int,
+    user_ids: Iterable[int] = (1,),
+    channels: int = 20,
+    days: int = 30,
+    start: Optional[datetime] = None
+) -> int:
+    """Insert count Slack message rows spread across users, channels and the last days"""
+    user_ids = list(user_ids)
+    rows = (
+        {
+            "user_id": user_ids[i % len(user_ids)],
+            "slack_user_id": f"U{i % 500:05d}",
+            "slack_channel_id": f"C{i % channels:05d}",
+            "slack_message_ts": f"{created_at.timestamp():.6f}",
+            "user_message": f"question {i}",
+            "bot_response": f"answer {i}",
+            "tokens_used": 50 + i % 200,
+            "response_time_ms": float(300 + i % 2000),
+            "created_at": created_at
+        }
+        for i, created_at in enumerate(_timestamps(count, days, start))
+    )
+    return bulk_insert(db, SlackMessage, rows)
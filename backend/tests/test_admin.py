@@ -0,0 +1,21 @@
+from services.usage_service import rebuild_rollups
+from tests.factories import make_user, seed_audit_logs, seed_slack_messages, seed_usage_stats
+
+
+def test_admin_dashboard_over_seeded_history(client, db_session):
+    """Test the admin dashboard against a large seeded history"""
+    admin = make_user(db_session, "admin", role="admin")
+    token = client.post(
+        "/api/auth/login", json={"username": "admin", "password": "testpassword123"}
+    ).json()["access_token"]
+    assert seed_usage_stats(db_session, 30000, user_ids=[admin.id]) == 30000
+    seed_slack_messages(db_session, 20000, user_ids=[admin.id])
+    seed_audit_logs(db_session, 20000, user_ids=[admin.id])
+    rebuild_rollups(db_session)
+
+    response = client.get("/api/admin/dashboard", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200
+    data = response.json()
+    assert data["total_messages"] == 20000
+    assert sum(s["count"] for s in data["usage_by_service"].values()) == 30000
+    assert len(data["recent_logs"]) == 20
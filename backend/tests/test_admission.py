@@ -0,0 +1,56 @@
+import json
+import pytest
+from services.admission import agent_admission, AdaptiveLimiter, AdmissionController, AdmissionRejected
+from services.shared_state import shared_state
+from tests.factories import sign_slack_request
+
+
+def test_adaptive_limit_grows_and_backs_off():
+    """Test that fast requests raise the limit and slow ones cut it"""
+    limiter = AdaptiveLimiter(initial_limit=10, min_limit=2, max_limit=12, target_latency_ms=1000)
+    for _ in range(10):
+        limiter.on_sample(100)
+    assert 10.9 < limiter.limit < 11
+    limiter.on_sample(5000)
+    assert limiter.limit < 10
+    for _ in range(100):
+        limiter.on_sample(100, dropped=True)
+    assert limiter.limit == 2
+
+
+def test_admission_per_user_and_global_limits():
+    """Test that a busy user gets 429 and a saturated server 503"""
+    admission = AdmissionController(AdaptiveLimiter(initial_limit=3), per_user_limit=2)
+    admission.acquire("a")
+    admission.acquire("a")
+    with pytest.raises(AdmissionRejected) as per_user:
+        admission.acquire("a")
+    assert per_user.value.status_code == 429
+
+    admission.acquire("b")
+    with pytest.raises(AdmissionRejected) as global_limit:
+        admission.acquire("c")
+    assert global_limit.value.status_code == 503
+    assert global_limit.value.retry_after >= 1
+
+    admission.release("a", 10)
+    admission.acquire("c")
+    assert admission.stats()["rejected"] == 2
+
+
+def test_slack_event_shed_with_retry_after(client, slack_signing_secret, monkeypatch):
+    """Test that a Slack event over the limit gets 503 with Retry-After before any work, and redeliveries dedup"""
+    monkeypatch.setattr(agent_admission.limiter, "limit", 0)
+    body = json.dumps({
+        "type": "event_callback",
+        "event_id": "Ev1",
+        "event": {"type": "app_mention", "user": "U1", "text": "<@B1> hi", "channel": "C1", "ts": "1.0"}
+    }).encode()
+    response = client.post("/api/slack/events", content=body, headers=sign_slack_request(body))
+    assert response.status_code == 503
+    assert int(response.headers["Retry-After"]) >= 1
+
+    # The shed delivery released its claim; one another worker is handling is skipped
+    assert shared_state.add("slack_event:Ev1", True, ttl_seconds=60)
+    redelivery = client.post("/api/slack/events", content=body, headers=sign_slack_request(body))
+    assert redelivery.status_code == 200 and redelivery.json() == {"ok": True}
@@ -1,42 +1,4 @@
-import pytest
-from fastapi.testclient import TestClient
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-from main import app
-from database import Base, get_db
-from models import User
-from security import get_password_hash
-
-# Test database
-SQLALCHEMY_DATABASE_URL = "sqlite:///./test.db"
-engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
-TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-
-# Create test database tables
-Base.metadata.create_all(bind=engine)
-
-
-def override_get_db():
-    try:
-        db = TestingSessionLocal()
-        yield db
-    finally:
-        db.close()
-
-
-app.dependency_overrides[get_db] = override_get_db
-client = TestClient(app)
-
-
-@pytest.fixture(autouse=True)
-def cleanup_database():
-    """Clean up database before each test"""
-    yield
-    Base.metadata.drop_all(bind=engine)
-    Base.metadata.create_all(bind=engine)
-
-
-def test_signup():
+def test_signup(client):
     """Test user signup"""
     response = client.post(
         "/api/auth/signup",
@@ -54,7 +16,7 @@ def test_signup():
     assert data["role"] == "admin"  # First user is admin
 
 
-def test_login():
+def test_login(client):
     """Test user login"""
     # First create a user
     client.post(
@@ -81,7 +43,7 @@ def test_login():
     assert data["token_type"] == "bearer"
 
 
-def test_login_invalid_credentials():
+def test_login_invalid_credentials(client):
     """Test login with invalid credentials"""
     response = client.post(
         "/api/auth/login",
@@ -93,7 +55,7 @@ def test_login_invalid_credentials():
     assert response.status_code == 401
 
 
-def test_get_current_user():
+def test_get_current_user(client):
     """Test getting current user information"""
     # Create and login user
     client.post(
@@ -124,7 +86,7 @@ def test_get_current_user():
     assert data["username"] == "testuser"
 
 
-def test_duplicate_username():
+def test_duplicate_username(client):
     """Test signup with duplicate username"""
     client.post(
         "/api/auth/signup",
@@ -144,3 +106,14 @@ def test_duplicate_username():
         }
     )
     assert response.status_code == 400
+
+
+def test_login_rate_limited(client):
+    """Test that repeated logins from one client are throttled with Retry-After"""
+    for _ in range(10):
+        response = client.post("/api/auth/login", json={"username": "nobody", "password": "wrongpass"})
+        assert response.status_code == 401
+
+    response = client.post("/api/auth/login", json={"username": "nobody", "password": "wrongpass"})
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) >= 1
@@ -0,0 +1,184 @@
+import asyncio
+import httpx
+import openai
+from datetime import datetime
+from types import SimpleNamespace
+import services.azure_ai_service as azure_ai_service
+from services.azure_ai_service import AzureAIService
+from services.deployment_pool import DeploymentPool
+from services.single_flight import SingleFlight
+from services.shared_state import MemoryState
+from services import token_budget
+from services.token_budget import count_tokens, fit_completion, trim_lines_to_tokens, TokenLedger
+
+
+class FakeCompletions:
+    """Stands in for client.chat.completions and records each request"""
+
+    def __init__(self, status_code=None, delay=0):
+        self.requests = []
+        self.status_code = status_code  # Fail every request with this HTTP status
+        self.delay = delay
+
+    async def create(self, **kwargs):
+        self.requests.append(kwargs)
+        await asyncio.sleep(self.delay)
+        if self.status_code:
+            request = httpx.Request("POST", "https://example.openai.azure.com/")
+            response = httpx.Response(self.status_code, request=request)
+            raise openai.APIStatusError("Throttled", response=response, body=None)
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content="ok"))],
+            usage=SimpleNamespace(total_tokens=12, prompt_tokens=10, completion_tokens=2),
+            model="gpt-test"
+        )
+
+
+def make_service(context_window=8192, api_key="key"):
+    service = AzureAIService(
+        endpoint="https://example.openai.azure.com/",
+        api_key=api_key,
+        deployment="gpt-test",
+        context_window=context_window
+    )
+    completions = FakeCompletions()
+    service.targets[0].client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+    return service, completions
+
+
+def test_fit_completion_limits():
+    """Test that max_tokens shrinks to the window and budget, or the request is rejected"""
+    assert fit_completion(1000, 1000, 8192) == (1000, None, None)
+    assert fit_completion(7800, 1000, 8192)[0] == 392
+    assert fit_completion(8180, 1000, 8192)[2] == "context_window_exceeded"
+    assert fit_completion(100, 1000, 8192, token_budget=400)[0] == 300
+    assert fit_completion(100, 1000, 8192, token_budget=120)[2] == "token_budget_exceeded"
+
+
+def test_trim_keeps_newest_lines():
+    """Test that context trimming drops the oldest lines first"""
+    lines = [f"<@U1>: message number {i}" for i in range(100)]
+    trimmed = trim_lines_to_tokens("\n".join(lines), 50)
+    assert trimmed.endswith("message number 99")
+    assert "message number 0\n" not in trimmed
+    assert count_tokens(trimmed) <= 50
+
+
+def test_tokenizer_never_loaded_on_event_loop(monkeypatch):
+    """Test that counting on the event loop estimates until the encoding is loaded elsewhere"""
+    monkeypatch.setattr(token_budget, "_encoding_loaded", False)
+    monkeypatch.setattr(token_budget, "_encoding", None)
+    loads = []
+    monkeypatch.setattr("tiktoken.get_encoding", lambda name: loads.append(name))
+
+    async def count_on_loop():
+        return count_tokens("x" * 40)
+
+    assert asyncio.run(count_on_loop()) == 10
+    assert loads == []
+    token_budget.load_encoding()
+    assert loads == ["cl100k_base"]
+
+
+def test_oversized_request_rejected_without_network():
+    """Test that a prompt larger than the model window never reaches the API"""
+    service, completions = make_service(context_window=512)
+    result = asyncio.run(service.generate_summary("word " * 5000))
+    assert result["success"] is False
+    assert result["error_code"] == "context_window_exceeded"
+    assert completions.requests == []
+
+
+def test_answer_context_compacted_into_one_system_message():
+    """Test that long context is trimmed to fit and sent in the single system message"""
+    service, completions = make_service(context_window=2048)
+    context = "\n".join(f"<@U1>: older message {i}" for i in range(1000))
+    result = asyncio.run(service.answer_question("What changed?", context=context))
+
+    assert result["success"]
+    messages = completions.requests[0]["messages"]
+    assert [m["role"] for m in messages] == ["system", "user"]
+    assert "older message 999" in messages[0]["content"]
+    assert "older message 0\n" not in messages[0]["content"]
+
+
+def test_token_ledger_budget():
+    """Test that the ledger tracks usage against the daily budget"""
+    state = MemoryState()
+    ledger = TokenLedger(daily_budget=100, state=state)
+    ledger.record(1, 50)  # Not seeded yet; seeding from UsageStats will include it
+    state.set(ledger._key(1, datetime.utcnow().date()), 30)
+    assert ledger.remaining(None, 1) == 70
+    ledger.record(1, 80)
+    assert ledger.remaining(None, 1) == 0
+    assert TokenLedger(daily_budget=0).remaining(None, 1) is None
+
+
+def test_failover_and_circuit_breaker(monkeypatch):
+    """Test that a throttled deployment fails over and is skipped once its breaker opens"""
+    pool = DeploymentPool(breaker_failures=2, breaker_cooldown_seconds=60)
+    monkeypatch.setattr(azure_ai_service, "deployment_pool", pool)
+    monkeypatch.setattr(azure_ai_service.settings, "azure_openai_backoff_seconds", 0)
+
+    service = AzureAIService(
+        endpoint="https://east.openai.azure.com/",
+        api_key="key",
+        deployment="gpt-4o",
+        deployments=[{"endpoint": "https://west.openai.azure.com/"}]
+    )
+    throttled, healthy = FakeCompletions(status_code=429), FakeCompletions()
+    service.targets[0].client = SimpleNamespace(chat=SimpleNamespace(completions=throttled))
+    service.targets[1].client = SimpleNamespace(chat=SimpleNamespace(completions=healthy))
+    messages = [{"role": "user", "content": "hi"}]
+
+    for _ in range(4):
+        result = asyncio.run(service.generate_response(messages))
+        assert result["success"]
+
+    # East failed twice, opened its breaker, and then stopped receiving requests
+    assert len(throttled.requests) == 2
+    assert len(healthy.requests) == 4
+    states = {d["endpoint"]: d["state"] for d in pool.snapshot()}
+    assert states == {"https://east.openai.azure.com/": "open", "https://west.openai.azure.com/": "closed"}
+
+
+def test_least_outstanding_balancing():
+    """Test that new requests go to the deployment with fewest requests in flight"""
+    pool = DeploymentPool()
+    keys = [("a", "d"), ("b", "d")]
+    first = pool.acquire(keys)
+    second = pool.acquire(keys)
+    assert {first, second} == set(keys)
+    pool.succeeded(first, 50)
+    assert pool.acquire(keys) == first
+
+
+def test_identical_concurrent_requests_coalesced(monkeypatch):
+    """Test that identical in-flight questions share one completion and only one is billed"""
+    single_flight = SingleFlight()
+    monkeypatch.setattr(azure_ai_service, "llm_single_flight", single_flight)
+    service, completions = make_service()
+    completions.delay = 0.05
+
+    async def ask_all():
+        questions = ["What is the deadline?"] * 4 + ["What is  the deadline? ", "Who owns it?"]
+        return await asyncio.gather(*(service.answer_question(q) for q in questions))
+
+    results = asyncio.run(ask_all())
+    assert len(completions.requests) == 2
+    assert all(r["response"] == "ok" for r in results)
+    assert sum(r["tokens_used"] for r in results) == 24
+    assert sum(1 for r in results if r.get("coalesced")) == 4
+    assert single_flight.stats()["tokens_saved"] == 48
+    assert single_flight.stats()["in_flight"] == 0
+
+    # The same question on the same deployment with another key is not shared
+    other, other_completions = make_service(api_key="other-key")
+    other_completions.delay = 0.05
+
+    async def ask_both():
+        return await asyncio.gather(service.answer_question("Who owns it?"), other.answer_question("Who owns it?"))
+
+    results = asyncio.run(ask_both())
+    assert len(other_completions.requests) == 1
+    assert not any(r.get("coalesced") for r in results)
@@ -0,0 +1,25 @@
+import asyncio
+import httpx
+import openai
+from services.azure_ai_service import AzureAIService
+from benchmarks.fake_services import build_azure_app
+from benchmarks.run import percentile
+
+
+def test_benchmark_fake_azure_server_speaks_the_api():
+    """Test that the benchmark's fake Azure OpenAI server is understood by the real client"""
+    service = AzureAIService(endpoint="http://fake-azure", api_key="k", deployment="bench-deployment")
+    service.targets[0].client = openai.AsyncAzureOpenAI(
+        azure_endpoint="http://fake-azure",
+        api_key="k",
+        api_version="2023-05-15",
+        http_client=httpx.AsyncClient(transport=httpx.ASGITransport(app=build_azure_app(latency_ms=0)))
+    )
+
+    result = asyncio.run(service.generate_response([{"role": "user", "content": "hello " * 40}], max_tokens=100))
+    assert result["success"], result
+    assert result["deployment"] == "bench-deployment"
+    assert result["completion_tokens"] == 60
+    assert result["tokens_used"] == result["prompt_tokens"] + 60
+    assert percentile([1.0, 2.0, 3.0, 4.0], 50) == 2.0
+    assert percentile(list(map(float, range(1, 101))), 99) == 99.0
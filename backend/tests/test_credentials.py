@@ -1,40 +1,18 @@
+import asyncio
+import json
 import pytest
-from fastapi.testclient import TestClient
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-from main import app
-from database import Base, get_db
-
-# Test database
-SQLALCHEMY_DATABASE_URL = "sqlite:///./test.db"
-engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
-TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-
-Base.metadata.create_all(bind=engine)
-
-
-def override_get_db():
-    try:
-        db = TestingSessionLocal()
-        yield db
-    finally:
-        db.close()
-
-
-app.dependency_overrides[get_db] = override_get_db
-client = TestClient(app)
-
-
-@pytest.fixture(autouse=True)
-def cleanup_database():
-    """Clean up database before each test"""
-    yield
-    Base.metadata.drop_all(bind=engine)
-    Base.metadata.create_all(bind=engine)
+from cryptography.fernet import Fernet
+from security import ENCRYPTION_KEY, CredentialCipher, load_encryption_keys
+from services.credential_service import CredentialService, rotate_encryption_keys
+from services.credential_health import CredentialHealthChecker
+from services.agent_service import AgentService
+from models import Credential
+from config import settings
+from tests.factories import make_user
 
 
 @pytest.fixture
-def auth_token():
+def auth_token(client):
     """Create user and return auth token"""
     client.post(
         "/api/auth/signup",
@@ -55,7 +33,7 @@ def auth_token():
     return response.json()["access_token"]
 
 
-def test_create_credential(auth_token):
+def test_create_credential(client, auth_token):
     """Test creating a credential"""
     response = client.post(
         "/api/credentials/",
@@ -74,7 +52,7 @@ def test_create_credential(auth_token):
     assert data["is_active"] == True
 
 
-def test_get_credentials(auth_token):
+def test_get_credentials(client, auth_token):
     """Test getting all credentials"""
     # Create a credential first
     client.post(
@@ -99,7 +77,7 @@ def test_get_credentials(auth_token):
     assert data[0]["service_type"] == "slack"
 
 
-def test_delete_credential(auth_token):
+def test_delete_credential(client, auth_token):
     """Test deleting a credential"""
     # Create a credential first
     client.post(
@@ -128,7 +106,7 @@ def test_delete_credential(auth_token):
     assert len(get_response.json()) == 0
 
 
-def test_invalid_service_type(auth_token):
+def test_invalid_service_type(client, auth_token):
     """Test creating credential with invalid service type"""
     response = client.post(
         "/api/credentials/",
@@ -143,7 +121,155 @@ def test_invalid_service_type(auth_token):
     assert response.status_code == 400
 
 
-def test_unauthorized_access():
+def test_unauthorized_access(client):
     """Test accessing credentials without authentication"""
     response = client.get("/api/credentials/")
     assert response.status_code == 401
+
+
+def test_test_all_credentials_streams_and_caches(client, auth_token, session_factory, monkeypatch):
+    """Test that all services are tested concurrently, streamed as they finish, and successes cached"""
+    monkeypatch.setattr("routes.credentials.SessionLocal", session_factory)
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    for service_type in ["slack", "azure_openai", "google_workspace"]:
+        client.post(
+            "/api/credentials/",
+            json={"service_type": service_type, "credentials": {"key": service_type}},
+            headers=headers
+        )
+
+    calls = []
+    delays = {"slack": 0.2, "azure_openai": 0.01, "google_workspace": 5}
+
+    async def fake_live_test(service_type, creds):
+        calls.append(service_type)
+        await asyncio.sleep(delays[service_type])
+        return {"status": "success", "message": f"{service_type} ok"}
+
+    monkeypatch.setattr(CredentialService, "_live_test", staticmethod(fake_live_test))
+    monkeypatch.setattr(settings, "credential_test_timeout_seconds", 0.5)
+
+    def run_batch():
+        response = client.post("/api/credentials/test", headers=headers)
+        assert response.status_code == 200
+        return [
+            json.loads(line[len("data: "):])
+            for line in response.text.splitlines() if line.startswith("data: ")
+        ]
+
+    results = run_batch()
+    assert [r["service_type"] for r in results] == ["azure_openai", "slack", "google_workspace"]
+    assert results[2]["status"] == "error"
+    assert "timed out" in results[2]["message"]
+
+    # Successes are served from the cache; the timed-out service is retried
+    results = run_batch()
+    assert {r["service_type"]: r["cached"] for r in results} == {
+        "azure_openai": True, "slack": True, "google_workspace": False
+    }
+    assert calls.count("slack") == 1
+    assert calls.count("google_workspace") == 2
+
+
+def test_health_sweep_marks_broken_services_and_agent_skips_them(client, auth_token, session_factory, monkeypatch):
+    """Test that a sweep stores each credential's status and the agent fails fast on a bad one"""
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    for service_type in ["slack", "azure_openai"]:
+        client.post(
+            "/api/credentials/",
+            json={"service_type": service_type, "credentials": {"key": service_type}},
+            headers=headers
+        )
+
+    async def fake_live_test(service_type, creds):
+        if service_type == "azure_openai":
+            return {"status": "failed", "message": "Access denied due to invalid subscription key"}
+        return {"status": "success", "message": "ok"}
+
+    monkeypatch.setattr(CredentialService, "_live_test", staticmethod(fake_live_test))
+    monkeypatch.setattr(settings, "credential_unhealthy_after_failures", 2)
+    checker = CredentialHealthChecker(session_factory=session_factory, max_concurrency=1)
+    assert asyncio.run(checker.sweep()) == {"success": 1, "failed": 1}
+
+    db = session_factory()
+    statuses = {c.service_type: c.test_status for c in db.query(Credential).all()}
+    assert statuses == {"slack": "success", "azure_openai": "failed"}
+    user_id = db.query(Credential).first().user_id
+    db.close()
+
+    # One failure could be transient, so the service is still tried
+    healthy, unhealthy = asyncio.run(CredentialService.get_healthy_credentials(session_factory(), user_id, ["azure_openai"]))
+    assert unhealthy == {} and "azure_openai" in healthy
+
+    asyncio.run(checker.sweep())
+    db = session_factory()
+    result = asyncio.run(AgentService(db, user_id).generate_summary("t", "content", save_to_drive=False))
+    assert result["error_code"] == "credential_unhealthy"
+    assert "invalid subscription key" in result["error"]
+
+
+def test_health_sweep_keeps_status_of_credentials_saved_meanwhile(client, auth_token, session_factory, monkeypatch):
+    """Test that a sweep doesn't overwrite the status of a credential re-saved while it was being tested"""
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    client.post("/api/credentials/", json={"service_type": "slack", "credentials": {"key": "old"}}, headers=headers)
+
+    async def fake_live_test(service_type, creds):
+        if creds["key"] == "old":
+            client.post("/api/credentials/", json={"service_type": "slack", "credentials": {"key": "new"}}, headers=headers)
+        return {"status": "failed", "message": "invalid_auth"}
+
+    monkeypatch.setattr(CredentialService, "_live_test", staticmethod(fake_live_test))
+    checker = CredentialHealthChecker(session_factory=session_factory, max_concurrency=1)
+    asyncio.run(checker.sweep())
+
+    credential = session_factory().query(Credential).one()
+    assert (credential.test_status, credential.test_failures) == ("pending", 0)
+
+
+def test_envelope_encryption_and_batched_key_rotation(session_factory):
+    """Test that legacy and envelope values survive a keyring rotation and reruns skip rotated rows"""
+    old_key, new_key = Fernet.generate_key(), Fernet.generate_key()
+    old_cipher = CredentialCipher([old_key])
+    db = session_factory()
+    user = make_user(db)
+    tokens = [Fernet(old_key).encrypt(b'{"n": 0}').decode()] + [old_cipher.encrypt(f'{{"n": {n}}}'.encode()) for n in range(1, 5)]
+    db.add_all([
+        Credential(user_id=user.id, service_type=f"service{n}", encrypted_credentials=token)
+        for n, token in enumerate(tokens)
+    ])
+    db.commit()
+
+    cipher = CredentialCipher([new_key, old_key])
+    assert json.loads(cipher.decrypt(tokens[1])) == {"n": 1}
+    assert json.loads(cipher.decrypt(tokens[1])) == {"n": 1}
+    assert len(cipher._data_keys) == 1
+
+    batches = []
+    stats = rotate_encryption_keys(batch_size=2, cipher=cipher, session_factory=session_factory, progress=batches.append)
+    assert stats == {"scanned": 5, "rotated": 5, "current": 0, "changed": 0, "failed": 0}
+    assert [batch["scanned"] for batch in batches] == [2, 4, 5]
+
+    new_only = CredentialCipher([new_key])
+    rows = session_factory().query(Credential).order_by(Credential.id).all()
+    assert [json.loads(new_only.decrypt(row.encrypted_credentials))["n"] for row in rows] == [0, 1, 2, 3, 4]
+    # Only the data key wrapping changed, so cached credential test results stay valid
+    assert CredentialCipher.ciphertext(rows[1].encrypted_credentials) == CredentialCipher.ciphertext(tokens[1])
+
+    assert rotate_encryption_keys(cipher=cipher, session_factory=session_factory)["current"] == 5
+
+
+def test_encryption_keyring_retires_derived_key(monkeypatch):
+    """Test that the key derived from secret_key is only trusted until retired, and never in production"""
+    key = Fernet.generate_key()
+    monkeypatch.setattr(settings, "credential_encryption_keys", "")
+    assert load_encryption_keys() == [ENCRYPTION_KEY]
+
+    monkeypatch.setattr(settings, "app_env", "production")
+    with pytest.raises(RuntimeError):
+        load_encryption_keys()
+
+    monkeypatch.setattr(settings, "credential_encryption_keys", key.decode())
+    assert load_encryption_keys() == [key, ENCRYPTION_KEY]
+    monkeypatch.setattr(settings, "credential_legacy_key", False)
+    assert load_encryption_keys() == [key]
+
@@ -0,0 +1,64 @@
+import asyncio
+from alembic import command
+from alembic.autogenerate import compare_metadata
+from alembic.runtime.migration import MigrationContext
+from sqlalchemy import create_engine, inspect, text
+from database import Base, current_revision, head_revision, init_db, migration_config
+from services.readiness import Readiness, readiness
+
+
+def test_migrations_build_the_models_schema(tmp_path):
+    """Test that migrating an empty database gives exactly the models' schema, and reruns are no-ops"""
+    engine = create_engine(f"sqlite:///{tmp_path}/app.db")
+    assert current_revision(engine) is None
+    assert init_db(engine) is True
+    assert current_revision(engine) == head_revision()
+    assert init_db(engine) is False
+
+    with engine.connect() as conn:
+        assert compare_metadata(MigrationContext.configure(conn), Base.metadata) == []
+
+
+def test_init_db_adopts_database_from_before_migrations(tmp_path):
+    """Test that a database created before migrations is stamped and upgraded, keeping its rows"""
+    engine = create_engine(f"sqlite:///{tmp_path}/app.db")
+    with engine.begin() as conn:
+        command.upgrade(migration_config(conn), "0001")
+        conn.execute(text("DROP TABLE alembic_version"))
+        conn.execute(text(
+            "INSERT INTO users (id, email, username, hashed_password) VALUES (1, 'a@example.com', 'a', 'x')"
+        ))
+        conn.execute(text(
+            "INSERT INTO usage_stats (user_id, service_type, action_type, tokens_used) VALUES (1, 'azure_openai', 'message', 30)"
+        ))
+
+    assert init_db(engine) is True
+    assert current_revision(engine) == head_revision()
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT tokens_used, prompt_tokens FROM usage_stats")).one() == (30, 0)
+        assert inspect(conn).has_table("jobs")
+
+
+def test_liveness_and_readiness_probes(client, monkeypatch, tmp_path):
+    """Test that readiness waits for warm-up and a reachable database while liveness doesn't"""
+    probe = Readiness(engine=create_engine(f"sqlite:///{tmp_path}/app.db"), db_connections=2)
+    monkeypatch.setattr(readiness, "check", probe.check)
+
+    assert client.get("/health/live").json() == {"status": "alive"}
+    response = client.get("/health/ready")
+    assert response.status_code == 503
+    assert response.json()["checks"]["warmup"]["status"] == "pending"
+    assert response.json()["checks"]["database"]["status"] == "ok"
+
+    assert asyncio.run(probe.warm_up()) == {"database_pool": "ok", "tokenizer": "ok", "sdk_imports": "ok"}
+    response = client.get("/health/ready")
+    assert response.status_code == 200
+    assert response.json()["status"] == "ready"
+
+    def unreachable():
+        raise ConnectionError("database is down")
+
+    monkeypatch.setattr(probe, "_ping_database", unreachable)
+    response = client.get("/health/ready")
+    assert response.status_code == 503
+    assert response.json()["checks"]["database"] == {"status": "failed", "error": "database is down"}
@@ -0,0 +1,115 @@
+import asyncio
+import pytest
+from prometheus_client import REGISTRY
+from models import Job, Summary
+from services.agent_service import AgentService
+from services.job_service import JobEngine
+
+
+class FakeAzure:
+    def __init__(self):
+        self.calls = 0
+
+    async def generate_summary(self, content, previous_summary=None, token_budget=None):
+        self.calls += 1
+        return {"success": True, "response": f"summary of {content}", "tokens_used": 42, "execution_time_ms": 5}
+
+
+class FakeGoogle:
+    def __init__(self, failures):
+        self.failures = failures
+        self.calls = 0
+
+    async def create_google_doc(self, title, content):
+        self.calls += 1
+        if self.calls <= self.failures:
+            return {"success": False, "error": "Drive unavailable"}
+        return {"success": True, "file_id": "doc1", "file_url": "https://docs.google.com/doc1"}
+
+
+@pytest.fixture
+def services(monkeypatch):
+    """Fake services returned to every AgentService"""
+    fakes = {"azure_ai": FakeAzure(), "google": FakeGoogle(failures=1)}
+
+    async def fake_get_services(self):
+        return fakes
+
+    monkeypatch.setattr(AgentService, "_get_services", fake_get_services)
+    return fakes
+
+
+@pytest.fixture
+def make_engine(session_factory):
+    def make(**kwargs):
+        return JobEngine(session_factory=session_factory, drive_backoff_seconds=0, **kwargs)
+    return make
+
+
+def test_summary_job_retries_drive_only(services, make_engine, db_session):
+    """Test that a failed Drive upload is retried without regenerating the summary"""
+    jobs = make_engine()
+    db = db_session
+    queued = REGISTRY.get_sample_value("jobs_queued")
+    job = jobs.submit_summary(db, user_id=1, title="Notes", content="text")
+    assert REGISTRY.get_sample_value("jobs_queued") == queued + 1
+
+    job_id = jobs.claim_next()
+    assert job_id == job.id
+    assert jobs.claim_next() is None  # Already claimed
+    assert REGISTRY.get_sample_value("jobs_queued") == queued
+
+    asyncio.run(jobs.run_job(job_id))
+    db.refresh(job)
+    assert (job.status, job.stage, job.attempts) == ("queued", "drive", 1)
+    assert REGISTRY.get_sample_value("jobs_queued") == queued + 1
+
+    asyncio.run(jobs.run_job(jobs.claim_next()))
+    assert REGISTRY.get_sample_value("jobs_queued") == queued
+    db.refresh(job)
+    assert job.status == "succeeded"
+    assert job.result["google_drive_file_url"] == "https://docs.google.com/doc1"
+    assert services["azure_ai"].calls == 1
+    assert services["google"].calls == 2
+
+    summary = db.query(Summary).filter(Summary.id == job.result["summary_id"]).first()
+    assert summary.content == "summary of text"
+
+
+def test_drive_gives_up_but_keeps_summary(services, make_engine, db_session):
+    """Test that exhausting Drive attempts still records the summary"""
+    services["google"].failures = 10
+    jobs = make_engine(drive_max_attempts=2)
+    db = db_session
+    job = jobs.submit_summary(db, user_id=1, title="Notes", content="text")
+
+    asyncio.run(jobs.run_job(jobs.claim_next()))
+    asyncio.run(jobs.run_job(jobs.claim_next()))
+    db.refresh(job)
+    assert job.status == "succeeded"
+    assert job.result["drive_error"] == "Drive unavailable"
+    assert job.error is None
+    assert db.query(Summary).count() == 1
+
+
+def test_interrupted_job_resumes_after_restart(services, make_engine, db_session):
+    """Test that a job left running by a crash resumes at its saved stage"""
+    jobs = make_engine()
+    db = db_session
+    db.add(Job(
+        user_id=1,
+        job_type="summary",
+        status="running",
+        stage="record",
+        payload={"title": "Notes", "content": "text", "save_to_drive": False},
+        result={"summary": "already generated", "tokens_used": 42, "execution_time_ms": 5}
+    ))
+    db.commit()
+
+    assert jobs.recover() == 1
+    asyncio.run(jobs.run_job(jobs.claim_next()))
+
+    job = db.query(Job).first()
+    assert job.status == "succeeded"
+    assert services["azure_ai"].calls == 0
+    assert db.query(Summary).first().content == "already generated"
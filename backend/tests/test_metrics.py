@@ -0,0 +1,59 @@
+import pytest
+from prometheus_client import REGISTRY
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+from config import settings
+from metrics import instrument_engine
+
+
+@pytest.fixture
+def auth_token(client):
+    """Create user and return auth token"""
+    client.post(
+        "/api/auth/signup",
+        json={"username": "testuser", "email": "test@example.com", "password": "testpassword123"}
+    )
+    response = client.post("/api/auth/login", json={"username": "testuser", "password": "testpassword123"})
+    return response.json()["access_token"]
+
+
+def test_metrics_endpoint(client, auth_token, monkeypatch):
+    """Test that /metrics reports per-route latency by path template and honours the scrape token"""
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    client.post(
+        "/api/credentials/",
+        json={"service_type": "slack", "credentials": {"key": "slack"}},
+        headers=headers
+    )
+    client.delete("/api/credentials/slack", headers=headers)
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    body = response.text
+    assert 'method="DELETE",route="/api/credentials/{service_type}",status="200"' in body
+    assert 'route="/api/credentials/slack"' not in body
+    assert "llm_request_duration_seconds" in body
+    assert "external_api_duration_seconds" in body
+    assert "cache_requests_total" in body
+    assert "jobs_queued" in body
+
+    monkeypatch.setattr(settings, "metrics_token", "scrape-secret")
+    assert client.get("/metrics").status_code == 401
+    assert client.get("/metrics", headers={"Authorization": "Bearer scrape-secret"}).status_code == 200
+
+
+def test_failed_queries_do_not_skew_query_timings():
+    """Test that a statement that raises leaves nothing behind for the next one to be timed against"""
+    engine = create_engine("sqlite://")
+    instrument_engine(engine)
+
+    def selects():
+        return REGISTRY.get_sample_value("db_query_duration_seconds_count", {"operation": "select"}) or 0
+
+    before = selects()
+    with engine.connect() as conn:
+        with pytest.raises(OperationalError):
+            conn.execute(text("SELECT * FROM missing_table"))
+        conn.execute(text("SELECT 1"))
+        assert "query_start_ns" not in conn.info
+    assert selects() == before + 1
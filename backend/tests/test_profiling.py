@@ -0,0 +1,49 @@
+from models import User
+from profiling import profile_store
+
+
+def test_admin_request_profiling(client, db_session, session_factory, tmp_path, monkeypatch):
+    """Test that only admins can profile a request and that stored profiles form a bounded ring"""
+    monkeypatch.setattr("profiling.SessionLocal", session_factory)
+    monkeypatch.setattr(profile_store, "directory", tmp_path)
+    monkeypatch.setattr(profile_store, "max_profiles", 2)
+    tokens = {}
+    for username in ["admin", "member"]:
+        client.post(
+            "/api/auth/signup",
+            json={"username": username, "email": f"{username}@example.com", "password": "testpassword123"}
+        )
+        tokens[username] = client.post(
+            "/api/auth/login",
+            json={"username": username, "password": "testpassword123"}
+        ).json()["access_token"]
+    admin = {"Authorization": f"Bearer {tokens['admin']}"}
+    member = {"Authorization": f"Bearer {tokens['member']}"}
+
+    # Unflagged and non-admin requests are never profiled
+    assert "x-profile-id" not in client.get("/api/auth/me", headers=admin).headers
+    assert "x-profile-id" not in client.get("/api/auth/me", headers={**member, "X-Profile": "1"}).headers
+
+    ids = []
+    for _ in range(3):
+        response = client.get("/api/auth/me?profile=1", headers=admin)
+        assert response.status_code == 200
+        ids.append(response.headers["x-profile-id"])
+
+    profiles = client.get("/api/admin/profiles", headers=admin).json()
+    assert [p["id"] for p in profiles] == ids[:0:-1]
+    assert profiles[0]["path"] == "/api/auth/me" and profiles[0]["status"] == 200
+
+    download = client.get(f"/api/admin/profiles/{ids[-1]}", headers=admin)
+    assert download.status_code == 200
+    assert "speedscope" in download.json()["$schema"]
+    assert client.get(f"/api/admin/profiles/{ids[0]}", headers=admin).status_code == 404
+    assert client.get("/api/admin/profiles/..%2Fsecret", headers=admin).status_code == 404
+    assert client.get("/api/admin/profiles", headers=member).status_code == 403
+
+    # A demoted admin's unexpired token no longer profiles
+    db_session.query(User).filter(User.username == "admin").update({"role": "member"})
+    db_session.commit()
+    response = client.get("/api/auth/me?profile=1", headers=admin)
+    assert response.status_code == 200
+    assert "x-profile-id" not in response.headers
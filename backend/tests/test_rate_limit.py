@@ -0,0 +1,19 @@
+import pytest
+from services.rate_limit import RateLimiter, parse_limit
+from services.shared_state import MemoryState, SQLiteState
+
+
+@pytest.mark.parametrize("store_type", ["memory", "sqlite"])
+def test_token_bucket_limits_and_user_overrides(store_type, tmp_path):
+    """Test bucket refill math and per-user overrides for both stores"""
+    assert parse_limit("10/minute") == (10, 10 / 60)
+    assert parse_limit("100/5 minutes") == (100, 100 / 300)
+
+    store = MemoryState() if store_type == "memory" else SQLiteState(str(tmp_path / "buckets.db"))
+    limiter = RateLimiter(store, {"agent": "2/hour", "agent:7": "5/hour"})
+
+    assert [limiter.check("agent", "user:1", 1)[0] for _ in range(3)] == [True, True, False]
+    allowed, retry_after = limiter.check("agent", "user:1", 1)
+    assert not allowed and 1700 < retry_after <= 1800
+    assert sum(limiter.check("agent", "user:7", 7)[0] for _ in range(6)) == 5
+    assert limiter.check("unlimited", "user:1", 1) == (True, 0.0)
@@ -0,0 +1,35 @@
+import pytest
+import time
+from services.shared_state import MemoryState, SQLiteState
+
+
+@pytest.mark.parametrize("store_type", ["memory", "sqlite"])
+def test_shared_state_values_dedup_and_counters(store_type, tmp_path, monkeypatch):
+    """Test values, TTLs, set-if-absent and counters, and that SQLite state is shared between instances"""
+    if store_type == "memory":
+        state = other = MemoryState()
+    else:
+        state, other = SQLiteState(str(tmp_path / "state.db")), SQLiteState(str(tmp_path / "state.db"))
+
+    state.set("summary", {"text": "hello", "count": 2})
+    assert other.get("summary") == {"text": "hello", "count": 2}
+    assert state.get("missing") is None
+
+    assert state.add("event:Ev1", True, ttl_seconds=60) is True
+    assert other.add("event:Ev1", True, ttl_seconds=60) is False
+    assert other.incr("tokens", 5) is None
+    state.set("tokens", 10)
+    assert other.incr("tokens", 5) == 15 and state.get("tokens") == 15
+
+    # Expired entries read as absent and can be claimed again
+    state.set("short", 1, ttl_seconds=30)
+    clock = time.monotonic if store_type == "memory" else time.time
+    later = clock() + 60
+    monkeypatch.setattr(time, "monotonic" if store_type == "memory" else "time", lambda: later)
+    assert other.get("short") is None
+    assert other.add("short", 2, ttl_seconds=30) is True
+
+    other.delete("summary")
+    assert state.get("summary") is None
+    state.reset()
+    assert other.get("tokens") is None
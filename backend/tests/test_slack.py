@@ -0,0 +1,341 @@
+import asyncio
+import json
+import time
+import pytest
+from types import SimpleNamespace
+from models import Summary, SlackMessage, UsageStats
+from security import SlackSigningKeyring
+from services import slack_service
+from services.channel_context import ChannelContextCache
+from services.agent_service import AgentService
+from services.conversation_summaries import conversation_summaries
+from services.intent_router import IntentRouter
+from services.command_queue import CommandQueue
+from services.shared_state import MemoryState
+from services.slack_service import SlackService
+from tests.factories import SLACK_SIGNING_SECRET, sign_slack_request
+
+pytestmark = pytest.mark.usefixtures("slack_signing_secret")
+
+
+@pytest.fixture
+def fake_bolt(monkeypatch):
+    """Replace the Bolt App with a recorder so no auth.test call is made"""
+    built = []
+
+    class FakeApp:
+        def __init__(self, token=None, signing_secret=None):
+            built.append(token)
+
+    monkeypatch.setattr("slack_bolt.App", FakeApp)
+    monkeypatch.setattr("slack_bolt.adapter.fastapi.SlackRequestHandler", lambda app: ("handler", app))
+    monkeypatch.setattr(slack_service, "_bolt_apps", {})
+    return built
+
+
+def test_bolt_app_not_built_on_init(fake_bolt):
+    """Test that constructing the service does not build a Bolt app"""
+    SlackService(bot_token="xoxb-test", signing_secret="secret")
+    assert fake_bolt == []
+
+
+def test_bolt_app_cached_per_workspace(fake_bolt):
+    """Test that the Bolt app is built once and shared per workspace"""
+    first = SlackService(bot_token="xoxb-test", signing_secret="secret")
+    second = SlackService(bot_token="xoxb-test", signing_secret="secret")
+    other = SlackService(bot_token="xoxb-other", signing_secret="secret")
+
+    assert first.app is second.app
+    assert first.handler[1] is first.app
+    assert other.app is not first.app
+    assert fake_bolt == ["xoxb-test", "xoxb-other"]
+
+
+def test_no_bolt_app_without_signing_secret(fake_bolt):
+    """Test that no Bolt app is available without a signing secret"""
+    slack = SlackService(bot_token="xoxb-test")
+    assert slack.app is None
+    assert slack.handler is None
+    assert fake_bolt == []
+
+
+def test_signed_url_verification(client):
+    """Test that a correctly signed challenge is answered"""
+    body = json.dumps({"type": "url_verification", "challenge": "abc"}).encode()
+    response = client.post("/api/slack/events", content=body, headers=sign_slack_request(body))
+    assert response.status_code == 200
+    assert response.json() == {"challenge": "abc"}
+
+
+def test_unsigned_requests_rejected(client):
+    """Test that every Slack endpoint rejects unsigned requests"""
+    for path in ["/api/slack/events", "/api/slack/interactive", "/api/slack/slash-commands"]:
+        response = client.post(path, content=b"{}")
+        assert response.status_code == 401
+
+
+def test_forged_and_stale_signatures_rejected(client):
+    """Test that wrong-secret and replayed requests are rejected"""
+    body = json.dumps({"type": "url_verification", "challenge": "abc"}).encode()
+
+    forged = client.post("/api/slack/events", content=body, headers=sign_slack_request(body, secret="wrong"))
+    assert forged.status_code == 401
+
+    stale_timestamp = str(int(time.time()) - 60 * 10)
+    stale = client.post("/api/slack/events", content=body, headers=sign_slack_request(body, stale_timestamp))
+    assert stale.status_code == 401
+
+
+def test_signed_slash_command_form_still_parsed(client):
+    """Test that the form body is still readable after signature verification"""
+    body = b"command=%2Funknown&text=hi&user_id=U1&channel_id=C1"
+    headers = sign_slack_request(body)
+    headers["Content-Type"] = "application/x-www-form-urlencoded"
+    response = client.post("/api/slack/slash-commands", content=body, headers=headers)
+    assert response.status_code == 200
+    assert "/unknown" in response.json()["text"]
+
+
+def test_stale_and_malformed_signatures_rejected_before_hashing():
+    """Test that cheap checks reject floods before any secret is loaded or HMAC computed"""
+    loads = []
+    keyring = SlackSigningKeyring(loader=lambda: loads.append(1) or [SLACK_SIGNING_SECRET])
+    body = json.dumps({"type": "event_callback", "event": {"text": "x" * 2000}}).encode()
+    now = time.time()
+    fresh = str(int(now))
+    forged = sign_slack_request(body, fresh, secret="wrong")["X-Slack-Signature"]
+
+    assert not keyring.verify(str(int(now) - 60 * 10), body, forged, now=now)
+    assert not keyring.verify(fresh, body, forged[:-1], now=now)
+    assert not keyring.verify("not-a-number", body, forged, now=now)
+    assert loads == []
+
+    assert not keyring.verify(fresh, body, forged, now=now)
+    assert keyring.verify(fresh, body, sign_slack_request(body, fresh)["X-Slack-Signature"], now=now)
+    assert loads == [1]
+
+
+def test_signing_keys_reload_when_another_worker_changes_them():
+    """Test that invalidating in one worker reloads the keys in the others, and empty key sets aren't cached"""
+    state = MemoryState()
+    secrets = []
+    workers = [SlackSigningKeyring(loader=lambda: list(secrets), state=state, check_seconds=0) for _ in range(2)]
+    body = b"{}"
+    timestamp = str(int(time.time()))
+    signature = sign_slack_request(body, timestamp)["X-Slack-Signature"]
+
+    assert not workers[1].verify(timestamp, body, signature)
+    secrets.append(SLACK_SIGNING_SECRET)
+    # The empty result wasn't cached, so the new secret is used without an invalidation
+    assert workers[1].verify(timestamp, body, signature)
+
+    secrets[:] = ["rotated"]
+    workers[0].invalidate()
+    assert not workers[1].verify(timestamp, body, signature)
+    assert workers[1].verify(timestamp, body, sign_slack_request(body, timestamp, secret="rotated")["X-Slack-Signature"])
+
+
+def test_channel_context_backfills_once_and_stays_bounded():
+    """Test that channel context is backfilled once and kept in a bounded ring"""
+    cache = ChannelContextCache(max_messages=3, max_channels=2)
+    calls = []
+
+    async def fetch_history(channel, limit):
+        calls.append((channel, limit))
+        return [
+            {"ts": "2.0", "user": "U2", "text": "second"},
+            {"ts": "1.0", "bot_id": "B1", "text": "first"},
+        ]
+
+    context = asyncio.run(cache.get_context("C1", exclude_ts="2.0", fetch_history=fetch_history))
+    assert context == ["assistant: first"]
+
+    for i in range(3, 6):
+        cache.record("C1", f"{i}.0", "<@U3>", f"message {i}")
+    cache.record("C1", "5.0", "<@U3>", "message 5")  # Slack retry
+
+    context = asyncio.run(cache.get_context("C1", fetch_history=fetch_history))
+    assert context == ["<@U3>: message 3", "<@U3>: message 4", "<@U3>: message 5"]
+    assert calls == [("C1", 3)]
+
+    # Least recently used channels are evicted
+    cache.record("C2", "1.0", "<@U1>", "hi")
+    cache.record("C3", "1.0", "<@U1>", "hi")
+    assert asyncio.run(cache.get_context("C1")) == []
+
+
+def test_thread_summary_only_sends_new_messages(monkeypatch, db_session):
+    """Test that repeat thread summaries only send messages newer than the cached range"""
+    db = db_session
+    conversation_summaries.clear()
+
+    thread = [
+        {"ts": "1.0", "user": "U1", "text": "kickoff"},
+        {"ts": "2.0", "user": "U2", "text": "reply"},
+        {"ts": "2.5", "bot_id": "B1", "text": "bot post"},
+    ]
+    fetches, prompts = [], []
+
+    class FakeSlack:
+        async def fetch_conversation(self, channel, thread_ts=None, oldest=None, max_messages=200):
+            fetches.append(oldest)
+            return [m for m in thread if oldest is None or float(m["ts"]) > float(oldest)]
+
+    class FakeAzure:
+        async def generate_summary(self, content, previous_summary=None, token_budget=None):
+            prompts.append((content, previous_summary))
+            return {"success": True, "response": f"summary {len(prompts)}", "tokens_used": 10}
+
+    async def fake_services(self):
+        return {"slack": FakeSlack(), "azure_ai": FakeAzure()}
+
+    monkeypatch.setattr(AgentService, "_get_services", fake_services)
+    agent = AgentService(db, user_id=1)
+
+    first = asyncio.run(agent.summarize_conversation("C1", thread_ts="1.0", save_to_drive=False))
+    assert first["summary"] == "summary 1"
+    assert prompts[0] == ("<@U1>: kickoff\n<@U2>: reply", None)
+
+    thread.append({"ts": "3.0", "user": "U1", "text": "follow up"})
+    second = asyncio.run(agent.summarize_conversation("C1", thread_ts="1.0", save_to_drive=False))
+    assert second["summary"] == "summary 2"
+    assert prompts[1] == ("<@U1>: follow up", "summary 1")
+    assert fetches == [None, "2.5"]
+
+    third = asyncio.run(agent.summarize_conversation("C1", thread_ts="1.0", save_to_drive=False))
+    assert third["cached"] is True
+    assert len(prompts) == 2
+    assert db.query(Summary).count() == 2
+
+    # Another user's request reads the conversation with their own credentials
+    asyncio.run(AgentService(db, user_id=2).summarize_conversation("C1", thread_ts="1.0", save_to_drive=False))
+    assert fetches[-1] is None and len(prompts) == 3
+
+    conversation_summaries.clear()
+
+
+def test_incremental_channel_fetch_includes_new_replies_to_older_threads():
+    """Test that a channel fetch since a ts picks up new replies under parents older than it"""
+    history = [
+        {"ts": "1.0", "text": "old parent", "thread_ts": "1.0", "reply_count": 2, "latest_reply": "5.0"},
+        {"ts": "2.0", "text": "quiet parent", "thread_ts": "2.0", "reply_count": 1, "latest_reply": "2.5"},
+        {"ts": "4.0", "text": "new message"},
+    ]
+    replies = {
+        "1.0": [{"ts": "1.0"}, {"ts": "1.5", "text": "old reply"}, {"ts": "5.0", "text": "new reply"}],
+        "2.0": [{"ts": "2.0"}, {"ts": "2.5", "text": "old reply"}],
+    }
+    replies_fetched = []
+
+    def conversations_history(channel, cursor=None, limit=200, **kwargs):
+        return {"messages": history}
+
+    def conversations_replies(channel, ts, cursor=None, limit=200, oldest=None):
+        replies_fetched.append(ts)
+        return {"messages": [m for m in replies[ts] if m["ts"] == ts or float(m["ts"]) > float(oldest or 0)]}
+
+    service = SlackService(bot_token="xoxb-test")
+    service.client = SimpleNamespace(
+        conversations_history=conversations_history, conversations_replies=conversations_replies
+    )
+    messages = asyncio.run(service.fetch_conversation("C1", oldest="3.0"))
+    assert [m["ts"] for m in messages] == ["4.0", "5.0"]
+    assert replies_fetched == ["1.0"]
+
+
+def test_intent_router_single_pass_dispatch():
+    """Test that intents, the default handler and slash commands route correctly"""
+    router = IntentRouter(default="answer")
+    router.register("summary", ["summarize", "summary", "tl;dr"], "summarize")
+    router.register("translate", ["translate"], "translate")
+    router.command("/ai-summarize")("summarize_command")
+
+    match = router.route("please TL;DR: the long text")
+    assert (match.intent, match.handler, match.remainder) == ("summary", "summarize", "the long text")
+
+    match = router.route("translate this, then summarize")
+    assert match.intent == "translate"
+
+    match = router.route("what is the weather?")
+    assert (match.intent, match.handler, match.remainder) == ("default", "answer", "what is the weather?")
+
+    assert router.route_command("/ai-summarize") == "summarize_command"
+    assert router.route_command("/unknown") is None
+
+
+def test_command_queue_limits_and_timeouts():
+    """Test per-user ordering, queue limits and job timeouts"""
+    async def scenario():
+        queue = CommandQueue(max_concurrency=2, max_pending_per_user=2, timeout_seconds=0.05)
+        order, results = [], []
+
+        def make_job(name, delay):
+            async def job():
+                order.append(f"start {name}")
+                await asyncio.sleep(delay)
+                order.append(f"end {name}")
+                return {"success": True, "name": name}
+            return job
+
+        async def on_done(result):
+            results.append(result)
+
+        assert queue.submit("U1", make_job("a", 0.01), on_done)
+        assert queue.submit("U1", make_job("b", 0.01), on_done)
+        assert not queue.submit("U1", make_job("c", 0.01), on_done)
+        assert queue.submit("U2", make_job("slow", 1), on_done)
+
+        await asyncio.sleep(0.2)
+        return queue, order, results
+
+    queue, order, results = asyncio.run(scenario())
+    assert order.index("end a") < order.index("start b")
+    assert {"success": False, "error": "Timed out"} in results
+    assert len(results) == 3
+    assert queue.pending("U1") == 0
+
+
+def test_slack_message_pipeline_records_stage_timings(monkeypatch, db_session):
+    """Test that the reply is posted, rows commit together and stage timings are kept"""
+    db = db_session
+    posted = []
+
+    class FakeSlack:
+        async def send_message(self, channel, text, thread_ts=None):
+            await asyncio.sleep(0.01)
+            posted.append((channel, text, thread_ts))
+            return {"success": True, "message_ts": "9.0", "channel": channel}
+
+    class FakeAzure:
+        async def answer_question(self, question, context=None, token_budget=None):
+            return {"success": True, "response": "answer", "tokens_used": 7, "execution_time_ms": 1}
+
+    async def fake_services(self):
+        return {"slack": FakeSlack(), "azure_ai": FakeAzure()}
+
+    # Rows are built while the post is in flight and only inserted once it's done
+    stages = []
+    message_rows, write = AgentService._message_rows, AgentService._write
+
+    def build_rows(self, *args):
+        stages.append(("build", len(posted)))
+        return message_rows(self, *args)
+
+    def write_rows(self, *args):
+        stages.append(("write", len(posted)))
+        return write(self, *args)
+
+    monkeypatch.setattr(AgentService, "_message_rows", build_rows)
+    monkeypatch.setattr(AgentService, "_write", write_rows)
+    monkeypatch.setattr(AgentService, "_get_services", fake_services)
+    result = asyncio.run(AgentService(db, user_id=1).handle_slack_message(
+        message="question", channel_id="C1", slack_user_id="U1", message_ts="8.0"
+    ))
+
+    assert result["success"]
+    assert posted == [("C1", "answer", "8.0")]
+    assert stages == [("build", 0), ("write", 1)]
+    assert db.query(SlackMessage).count() == 1
+    timings = db.query(UsageStats).first().meta_info["timings_ms"]
+    assert set(timings) == {"credentials", "llm", "slack_post", "db_write"}
+    assert timings["slack_post"] >= 10
@@ -0,0 +1,26 @@
+from benchmarks.startup import BUDGET_MS, best_of, parse_importtime
+
+# Coarse so a loaded test machine doesn't trip it; benchmarks.startup enforces BUDGET_MS itself
+SUITE_BUDGET_MS = 3 * BUDGET_MS
+
+
+def test_parse_importtime():
+    """Test that importtime output is parsed into per-module and per-package times"""
+    output = "\n".join([
+        "import time: self [us] | cumulative | imported package",
+        "import time:       300 |        300 |     openai._types",
+        "import time:      1200 |       1500 |   openai",
+        "import time:       500 |       2000 | main",
+    ])
+    profile = parse_importtime(output, "main")
+    assert profile.total_ms == 2.0
+    assert profile.modules["openai"] == (1200, 1500)
+    assert profile.packages() == [("openai", 1.5), ("main", 0.5)]
+    assert profile.deferred_loaded() == ["openai"]
+
+
+def test_app_import_leaves_heavy_sdks_for_first_use():
+    """Test that importing the app doesn't pull in the SDKs it loads on first use and stays within budget"""
+    profile = best_of(2, "main")
+    assert profile.deferred_loaded() == []
+    assert profile.total_ms < SUITE_BUDGET_MS, profile.packages()[:10]
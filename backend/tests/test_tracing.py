@@ -0,0 +1,65 @@
+import asyncio
+import json
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+from services import slack_service
+from services.agent_service import AgentService
+from services.slack_service import SlackService
+from tracing import build_exporter, configure_tracing, shutdown_tracing, span
+
+
+def test_agent_pipeline_spans(monkeypatch, db_session):
+    """Test that a Slack reply produces one trace covering the API call and the commit, and that sampling applies"""
+    db = db_session
+
+    class FakeAzure:
+        async def answer_question(self, question, context=None, token_budget=None):
+            return {"success": True, "response": "answer", "tokens_used": 7, "execution_time_ms": 1}
+
+    async def fake_services(self):
+        return {"slack": SlackService(bot_token="xoxb-test"), "azure_ai": FakeAzure()}
+
+    def fake_api_call(self, api_method, *args, **kwargs):
+        return {"ok": True, "ts": "9.0", "channel": "C1"}
+
+    monkeypatch.setattr(AgentService, "_get_services", fake_services)
+    monkeypatch.setattr(slack_service.WebClient, "api_call", fake_api_call)
+
+    def reply(message_ts):
+        return asyncio.run(AgentService(db, user_id=1).handle_slack_message(
+            message="question", channel_id="C1", slack_user_id="U1", message_ts=message_ts
+        ))
+
+    exporter = InMemorySpanExporter()
+    try:
+        configure_tracing(exporter, sample_ratio=1.0, batch=False)
+        assert reply("8.0")["success"]
+        spans = {s.name: s for s in exporter.get_finished_spans()}
+        root = spans["AgentService.handle_slack_message"]
+        assert root.parent is None
+        assert spans["SlackService.send_message"].parent.span_id == root.context.span_id
+        assert spans["slack.chat.postMessage"].parent.span_id == spans["SlackService.send_message"].context.span_id
+        assert spans["db.commit"].parent.span_id == root.context.span_id
+        assert {s.context.trace_id for s in spans.values()} == {root.context.trace_id}
+
+        exporter.clear()
+        configure_tracing(exporter, sample_ratio=0.0, batch=False)
+        assert reply("8.1")["success"]
+        assert exporter.get_finished_spans() == ()
+    finally:
+        shutdown_tracing()
+
+
+def test_file_exporter_closes_its_file(tmp_path):
+    """Test that spans exported to a file are written as JSON lines and the file is closed on shutdown"""
+    path = tmp_path / "spans.jsonl"
+    try:
+        exporter = build_exporter(f"file:{path}")
+        configure_tracing(exporter, sample_ratio=1.0, batch=False)
+        with span("outer"):
+            pass
+        # Reconfiguring shuts the previous exporter down
+        configure_tracing("none")
+        assert exporter.out.closed
+    finally:
+        shutdown_tracing()
+    assert json.loads(path.read_text().splitlines()[0])["name"] == "outer"
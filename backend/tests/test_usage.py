@@ -0,0 +1,75 @@
+import pytest
+from models import UsageStats, UsageRollup
+from services.agent_service import AgentService
+from services.pricing import calculate_cost, get_pricing
+from services.token_budget import token_ledger
+from services.usage_service import build_usage, record_usage, rebuild_rollups
+from tests.factories import make_user
+
+
+def test_pricing_by_model_prefix():
+    """Test that versioned model names match the longest table prefix"""
+    assert get_pricing("gpt-4o-mini-2024-07-18") == (0.000165, 0.00066)
+    assert get_pricing("gpt-4-0613") == (0.03, 0.06)
+    assert get_pricing(None, "gpt-35-turbo-16k") == (0.003, 0.004)
+    assert calculate_cost(1000, 500, "gpt-4") == 0.03 + 0.03
+
+
+def test_usage_rollups_match_rebuild(db_session):
+    """Test that write-time rollups match a rebuild from the raw usage rows"""
+    db = db_session
+
+    record_usage(db, 1, "azure_openai", "message", prompt_tokens=1000, completion_tokens=500,
+                 model="gpt-4", execution_time_ms=10)
+    record_usage(db, 1, "azure_openai", "message", prompt_tokens=2000, completion_tokens=0,
+                 model="gpt-4", execution_time_ms=30)
+    record_usage(db, 2, "azure_openai", "summary", tokens_used=100, deployment="gpt-35-turbo")
+    db.commit()
+
+    def snapshot():
+        return sorted(
+            (r.user_id, r.action_type, r.requests, r.prompt_tokens, r.completion_tokens,
+             round(r.cost, 6), r.execution_time_ms_total, r.timed_requests)
+            for r in db.query(UsageRollup).all()
+        )
+
+    written = snapshot()
+    assert written[0] == (1, "message", 2, 3000, 500, 0.12, 40, 2)
+    assert written[1][:5] == (2, "summary", 1, 0, 100)
+    assert db.query(UsageStats).filter(UsageStats.user_id == 2).first().model == "gpt-35-turbo"
+
+    rebuild_rollups(db)
+    assert snapshot() == written
+
+
+def test_deleting_user_removes_their_rollups(db_session):
+    """Test that a user's rollups are deleted with them rather than left orphaned"""
+    db = db_session
+    user = make_user(db, "leaving")
+    record_usage(db, user.id, "azure_openai", "message", tokens_used=10)
+    db.commit()
+
+    db.delete(user)
+    db.commit()
+    assert db.query(UsageRollup).count() == 0
+
+
+def test_rolled_back_usage_does_not_spend_budget(db_session, monkeypatch):
+    """Test that tokens only count against the daily budget once their usage row commits"""
+    db = db_session
+    assert token_ledger.used(db, 1) == 0
+    agent = AgentService(db, user_id=1)
+    commit = db.commit
+
+    def failing_commit():
+        raise RuntimeError("disk full")
+
+    monkeypatch.setattr(db, "commit", failing_commit)
+    with pytest.raises(RuntimeError):
+        agent._write([], build_usage(1, "azure_openai", "message", tokens_used=40), {}, {})
+    db.rollback()
+    assert token_ledger.used(db, 1) == 0
+
+    monkeypatch.setattr(db, "commit", commit)
+    agent._write([], build_usage(1, "azure_openai", "message", tokens_used=40), {}, {})
+    assert token_ledger.used(db, 1) == 40
@@ -0,0 +1,120 @@
+from contextlib import contextmanager
+from functools import wraps
+from opentelemetry import trace
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import (
+    BatchSpanProcessor,
+    ConsoleSpanExporter,
+    SimpleSpanProcessor,
+    SpanExporter
+)
+from opentelemetry.sdk.trace.sampling import ParentBased, TraceIdRatioBased
+from typing import Callable, Optional, Union
+import asyncio
+import logging
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+TRACER_NAME = "slack_ai_bot"
+
+# No-op until configure_tracing installs a provider
+_tracer: trace.Tracer = trace.NoOpTracer()
+_provider: Optional[TracerProvider] = None
+
+
+class FileSpanExporter(ConsoleSpanExporter):
+    """Appends one JSON span per line to a file, closed when the provider shuts down"""
+
+    def __init__(self, path: str):
+        super().__init__(out=open(path, "a"), formatter=lambda span: span.to_json(indent=None) + "\n")
+
+    def shutdown(self) -> None:
+        self.out.close()
+
+
+def build_exporter(spec: str) -> Optional[SpanExporter]:
+    """Create the exporter named by settings.tracing_exporter"""
+    if spec in ("", "none"):
+        return None
+    if spec == "console":
+        return ConsoleSpanExporter()
+    if spec.startswith("file:"):
+        return FileSpanExporter(spec[len("file:"):])
+    if spec == "otlp":
+        # Needs opentelemetry-exporter-otlp-proto-http; configured by the OTEL_EXPORTER_OTLP_* variables
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        return OTLPSpanExporter()
+    logger.warning(f"Unknown tracing exporter {spec!r}, tracing disabled")
+    return None
+
+
+def configure_tracing(
+    exporter: Union[str, SpanExporter, None] = None,
+    sample_ratio: Optional[float] = None,
+    batch: bool = True
+) -> Optional[TracerProvider]:
+    """Install a tracer provider exporting sampled spans; returns None if tracing is disabled.
+
+    Sampling is decided once per trace at its root span (child spans follow their
+    parent), so unsampled requests only pay for creating non-recording spans.
+    """
+    global _tracer, _provider
+    shutdown_tracing()
+
+    if exporter is None:
+        exporter = settings.tracing_exporter
+    if isinstance(exporter, str):
+        exporter = build_exporter(exporter)
+    if exporter is None:
+        return None
+    if sample_ratio is None:
+        sample_ratio = settings.tracing_sample_ratio
+
+    _provider = TracerProvider(
+        sampler=ParentBased(TraceIdRatioBased(sample_ratio)),
+        resource=Resource.create({"service.name": settings.app_name})
+    )
+    processor = BatchSpanProcessor(exporter) if batch else SimpleSpanProcessor(exporter)
+    _provider.add_span_processor(processor)
+    _tracer = _provider.get_tracer(TRACER_NAME)
+    logger.info(f"Tracing enabled ({type(exporter).__name__}, sample ratio {sample_ratio})")
+    return _provider
+
+
+def shutdown_tracing() -> None:
+    """Flush pending spans and disable tracing"""
+    global _tracer, _provider
+    if _provider is not None:
+        _provider.shutdown()
+    _tracer = trace.NoOpTracer()
+    _provider = None
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """Run the block in a span, recording any exception on it"""
+    with _tracer.start_as_current_span(name, attributes=attributes or None) as current:
+        yield current
+
+
+def traced(name: Optional[str] = None) -> Callable:
+    """Decorator running a function or coroutine function in a span named after it"""
+    def decorator(func: Callable) -> Callable:
+        span_name = name or func.__qualname__
+
+        if asyncio.iscoroutinefunction(func):
+            @wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with _tracer.start_as_current_span(span_name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with _tracer.start_as_current_span(span_name):
+                return func(*args, **kwargs)
+        return wrapper
+
+    return decorator